@@ -7,8 +7,12 @@
 #
 ######################################################
 
+import os
+import shutil
+import threading
 import numpy as np
 
+from PyRAI2MD.methods import QM
 from PyRAI2MD.Dynamics.aimd import AIMD
 
 class MIXAIMD(AIMD):
@@ -27,6 +31,18 @@ class MIXAIMD(AIMD):
             ref_grad         int         use reference gradient for hybrid ML/QM molecular dynamics
             ref_nac          int         use reference nac for hybrid ML/QM molecular dynamics
             ref_soc          int         use reference soc for hybrid ML/QM molecular dynamics
+            online           int         only call the reference for uncertain geometries and fine-tune the model
+            online_size      int         number of new reference data to start a fine-tuning
+            minerr_energy    float       energy error threshold to call the reference
+            minerr_grad      float       gradient error threshold to call the reference
+            minerr_nac       float       nac error threshold to call the reference
+            minerr_soc       float       soc error threshold to call the reference
+            replay           int         number of replayed old data in fine-tuning
+            data             class       training data class with the new reference data
+            buffer           list        new reference data waiting for fine-tuning
+            model_id         int         index of the model in use
+            nref             int         number of reference calculations
+            nupdate          int         number of model updates
 
         Functions:           Returns:
             run              class       run molecular dynamics simulation
@@ -44,8 +60,30 @@ class MIXAIMD(AIMD):
         ## create a reference electronic method object
         self.REF = ref
 
+        ## initialize variables for online learning
+        self.keywords = keywords.copy()
+        self.qm_name = keywords['control']['qm']
+        self.online = keywords['md']['online']
+        self.online_size = keywords['md']['online_size']
+        self.minerr_energy = keywords['control']['minenergy']
+        self.minerr_grad = keywords['control']['mingrad']
+        self.minerr_nac = keywords['control']['minnac']
+        self.minerr_soc = keywords['control']['minsoc']
+        self.replay = keywords['control']['replay']
+        self.data = keywords[self.qm_name]['data']
+        self.buffer = [[] for _ in range(5)]
+        self.model_id = 1
+        self.nref = 0
+        self.nupdate = 0
+        self.new_model = None
+        self.trainer = None
+        self.lock = threading.Lock()
+
     def _potential_energies(self, traj):
         ## modify the potential energy calculation to mixed mode
+        if self.online == 1:
+            return self._online_potential_energies(traj)
+
         traj_qm = self.QM.evaluate(traj)
         traj_ref = self.REF.evaluate(traj)
         traj_mix = self._mix_properties(traj_qm, traj_ref)
@@ -63,3 +101,155 @@ class MIXAIMD(AIMD):
             traj_qm.soc = np.copy(traj_ref.soc)
 
         return traj_qm
+
+    def _online_potential_energies(self, traj):
+        ## run the ML model and only call the reference for uncertain geometries
+        ## the reference results replace the ML results and are buffered for fine-tuning
+        self._update_model()
+        traj = self.QM.evaluate(traj)
+
+        if traj.err_energy <= self.minerr_energy and \
+                traj.err_grad <= self.minerr_grad and \
+                traj.err_nac <= self.minerr_nac and \
+                traj.err_soc <= self.minerr_soc:
+            return traj
+
+        traj = self.REF.evaluate(traj)
+        self.nref += 1
+
+        if traj.status == 1:
+            self.buffer[0].append(np.concatenate((traj.atoms, traj.coord), axis=1))
+            self.buffer[1].append(np.copy(traj.energy).tolist())
+            self.buffer[2].append(np.copy(traj.grad).tolist())
+            self.buffer[3].append(np.copy(traj.nac).tolist())
+            self.buffer[4].append(np.copy(traj.soc).tolist())
+
+        if len(self.buffer[0]) >= self.online_size and self.trainer is None:
+            self._start_finetune()
+
+        return traj
+
+    def _start_finetune(self):
+        ## add the buffered data to the training data and fine-tune a new model in a background thread
+        nold = len(self.data.geos)
+        self.data.append(self.buffer)
+        self.data.stat()
+        self.buffer = [[] for _ in range(5)]
+
+        ndata = len(self.data.geos)
+        new_index = np.arange(nold, ndata).tolist()
+        replay_index = np.random.permutation(nold)[0: self.replay].tolist()
+        data = self.data.subset(new_index + replay_index)
+
+        self.trainer = threading.Thread(target=self._finetune, args=(data, self.model_id + 1))
+        self.trainer.start()
+
+        return self
+
+    def _finetune(self, data, model_id):
+        ## continue training from a copy of the current model
+        title = self.keywords['control']['title']
+        if self.model_id == 1 and self.keywords[self.qm_name]['modeldir'] is not None:
+            source = self.keywords[self.qm_name]['modeldir']
+        elif self.model_id == 1:
+            source = 'NN-%s' % title
+        else:
+            source = 'NN-%s-%s' % (title, self.model_id)
+
+        target = 'NN-%s-%s' % (title, model_id)
+        if os.path.exists(target):
+            shutil.rmtree(target)
+        if os.path.exists(source):
+            shutil.copytree(source, target)
+
+        ## fine-tuning keeps the scaler and feature normalization of the current model
+        keywords = self.keywords.copy()
+        keywords[self.qm_name] = self.keywords[self.qm_name].copy()
+        keywords[self.qm_name]['data'] = data
+        keywords[self.qm_name]['train_mode'] = 'retraining'
+        keywords[self.qm_name]['finetune'] = 1
+
+        ## a failed fine-tuning keeps the current model and frees the trainer for the next buffer
+        try:
+            model = QM(self.qm_name, keywords=keywords, job_id=model_id)
+            model.train()
+            model = QM(self.qm_name, keywords=keywords, job_id=model_id)
+            model.load()
+        except BaseException as error:
+            with open('%s/%s.log' % (self.logpath, self.title), 'a') as log:
+                log.write('\n  Online learning: fine-tuning model %s failed at iter %s\n  %s: %s\n' % (
+                    target, self.traj.itr, type(error).__name__, str(error).strip()))
+
+            with self.lock:
+                self.trainer = None
+
+            return None
+
+        with self.lock:
+            self.new_model = [model_id, model]
+
+    def _update_model(self):
+        ## switch to the fine-tuned model once the background training completes
+        with self.lock:
+            if self.new_model is None:
+                return self
+
+            self.model_id, self.QM = self.new_model
+            self.new_model = None
+            trainer = self.trainer
+            self.trainer = None
+
+        trainer.join()
+        self.nupdate += 1
+
+        with open('%s/%s.log' % (self.logpath, self.title), 'a') as log:
+            log.write('\n  Online learning: switch to model NN-%s-%s at iter %s\n' % (
+                self.keywords['control']['title'], self.model_id, self.traj.itr))
+
+        return self
+
+    def run(self):
+        traj = super().run()
+
+        if self.online == 0:
+            return traj
+
+        ## wait for the last fine-tuning and save all reference data
+        with self.lock:
+            trainer = self.trainer
+
+        if trainer is not None:
+            trainer.join()
+            self._update_model()
+
+        if len(self.buffer[0]) > 0:
+            self.data.append(self.buffer)
+            self.data.stat()
+            self.buffer = [[] for _ in range(5)]
+
+        self.data.save('online')
+
+        online_info = """
+  &online learning
+-------------------------------------------------------
+  MD steps:                   %-10s
+  Reference calculations:     %-10s
+  Model updates:              %-10s
+  Last model:                 %-10s
+  Training data:              %-10s
+-------------------------------------------------------
+""" % (
+            traj.itr,
+            self.nref,
+            self.nupdate,
+            self.model_id,
+            len(self.data.geos)
+        )
+
+        if self.silent == 0:
+            print(online_info)
+
+        with open('%s/%s.log' % (self.logpath, self.title), 'a') as log:
+            log.write(online_info)
+
+        return traj
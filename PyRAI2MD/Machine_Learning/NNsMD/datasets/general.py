@@ -76,24 +76,42 @@ def save_data_to_folder(x, y, target_model, mod_dir, random_shuffle):
         with open(os.path.join(mod_dir, 'data_y'), 'wb') as f:
             pickle.dump(y, f)
     else:
-        if isinstance(y, list):
-            shuffle_list = [x] + y
-        else:
-            shuffle_list = [x] + [y]
-        # Make random shuffle
-        ind_shuffle, datalist = make_random_shuffle(shuffle_list)
-        x_out = datalist[0]
-        if len(datalist) > 2:
-            y_out = datalist[1:]
-        else:
-            y_out = datalist[1]
-        np.save(os.path.join(mod_dir, 'shuffle_index.npy'), ind_shuffle)
+        x_out, y_out = shuffle_data_in_folder(x, y, mod_dir)
         with open(os.path.join(mod_dir, 'data_x'), 'wb') as f:
             pickle.dump(x_out, f)
         with open(os.path.join(mod_dir, 'data_y'), 'wb') as f:
             pickle.dump(y_out, f)
 
 
+def shuffle_data_in_folder(x, y, mod_dir):
+    """
+    Shuffle x and y data consistently and save the shuffle index to the model folder.
+
+    Args:
+        x (np.array): Coordinates as x-data.
+        y (list): A possible list of np.arrays for y-values. Energy, Gradients, NAC etc.
+        mod_dir (str): Path of model directory.
+
+    Returns:
+        x_out (np.array): Shuffled x-data.
+        y_out (list): Shuffled y-data.
+
+    """
+    if isinstance(y, list):
+        shuffle_list = [x] + y
+    else:
+        shuffle_list = [x] + [y]
+    # Make random shuffle
+    ind_shuffle, datalist = make_random_shuffle(shuffle_list)
+    x_out = datalist[0]
+    if len(datalist) > 2:
+        y_out = datalist[1:]
+    else:
+        y_out = datalist[1]
+    np.save(os.path.join(mod_dir, 'shuffle_index.npy'), ind_shuffle)
+    return x_out, y_out
+
+
 def split_validation_training_index(allind, splitsize, do_offset, offset_steps):
     """
     Make a train-validation split for indexarray. Validation set is taken from beginning with possible offset.
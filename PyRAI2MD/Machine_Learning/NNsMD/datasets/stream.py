@@ -0,0 +1,323 @@
+"""
+Streaming input pipeline for training on chunked datasets larger than memory.
+
+The data is saved once as chunks of .npy files, which are memory-mapped when read. Batches are gathered chunk by chunk
+through a shuffle buffer and permutation augmentation is applied on the fly, so neither the full data nor its permuted
+copies are ever held in memory. Scalers and feature normalization are fitted in a single pass with running moments.
+"""
+
+import json
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from PyRAI2MD.Machine_Learning.NNsMD.scaler.moments import RunningMoments
+
+STREAM_DIR = 'data_stream'
+
+
+def save_chunked_data(directory, x, y, chunk_size=4096):
+    """
+    Save x and y data as chunks of .npy files.
+
+    Args:
+        directory (str): Directory of the chunked dataset.
+        x (np.array): Coordinates of shape (batch,atoms,3).
+        y (list, np.array): Target values, a list of arrays or an array.
+        chunk_size (int, optional): Number of samples per chunk. The default is 4096.
+
+    Returns:
+        directory (str): Directory of the chunked dataset.
+
+    """
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        if name.endswith('.npy'):
+            os.remove(os.path.join(directory, name))
+
+    y_list = isinstance(y, list)
+    y_all = y if y_list else [y]
+    sizes = []
+    for c, a in enumerate(range(0, len(x), chunk_size)):
+        b = min(a + chunk_size, len(x))
+        np.save(os.path.join(directory, 'x_%05d.npy' % c), np.asarray(x[a:b]))
+        for k, value in enumerate(y_all):
+            np.save(os.path.join(directory, 'y%s_%05d.npy' % (k, c)), np.asarray(value[a:b]))
+        sizes.append(b - a)
+
+    with open(os.path.join(directory, 'stream.json'), 'w') as f:
+        json.dump({'sizes': sizes, 'num_y': len(y_all), 'y_list': y_list}, f)
+
+    return directory
+
+
+class ChunkedData:
+    """
+    Chunked dataset of x and y data. Chunks are memory-mapped from a directory or taken from arrays in memory.
+    """
+
+    def __init__(self, directory=None, x=None, y=None):
+        """
+        Initialize from a directory written by save_chunked_data() or from arrays as a single chunk.
+
+        Args:
+            directory (str, optional): Directory of the chunked dataset. The default is None.
+            x (np.array, optional): Coordinates, if no directory is given. The default is None.
+            y (list, np.array, optional): Target values, if no directory is given. The default is None.
+
+        """
+        self.directory = directory
+        if directory is not None:
+            with open(os.path.join(directory, 'stream.json'), 'r') as f:
+                info = json.load(f)
+            self.sizes = info['sizes']
+            self.num_y = info['num_y']
+            self.y_list = info['y_list']
+            self._arrays = None
+        else:
+            self.y_list = isinstance(y, list)
+            y_all = y if self.y_list else [y]
+            self.sizes = [len(x)]
+            self.num_y = len(y_all)
+            self._arrays = [np.asarray(x), [np.asarray(value) for value in y_all]]
+        self.offsets = np.concatenate([[0], np.cumsum(self.sizes)]).astype(np.int64)
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def chunk(self, c):
+        """
+        Memory-mapped x and list of y of a chunk.
+
+        Args:
+            c (int): Chunk index.
+
+        Returns:
+            x (np.array): Coordinates.
+            y (list): List of target values.
+
+        """
+        if self._arrays is not None:
+            return self._arrays
+        x = np.load(os.path.join(self.directory, 'x_%05d.npy' % c), mmap_mode='r')
+        y = [np.load(os.path.join(self.directory, 'y%s_%05d.npy' % (k, c)), mmap_mode='r') for k in range(self.num_y)]
+        return x, y
+
+    def iter_chunks(self, indices=None):
+        """
+        Iterate over chunks and yield the selected rows of each chunk.
+
+        Args:
+            indices (np.array, optional): Selected sample index. The default is None, all samples.
+
+        Yields:
+            x (np.array): Coordinates.
+            y (list): List of target values.
+
+        """
+        if indices is None:
+            indices = np.arange(len(self))
+        indices = np.sort(np.asarray(indices, dtype=np.int64))
+        chunk_of = np.searchsorted(self.offsets, indices, side='right') - 1
+        for c in np.unique(chunk_of):
+            rows = indices[chunk_of == c] - self.offsets[c]
+            x, y = self.chunk(c)
+            yield np.asarray(x[rows]), [np.asarray(value[rows]) for value in y]
+
+    def take(self, indices):
+        """
+        Gather the selected rows in the order of indices.
+
+        Args:
+            indices (np.array): Selected sample index.
+
+        Returns:
+            x (np.array): Coordinates.
+            y (list, np.array): Target values in the same format as saved.
+
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        order = np.argsort(indices, kind='stable')
+        parts = list(self.iter_chunks(indices))
+        x = np.concatenate([part[0] for part in parts], axis=0)
+        y = [np.concatenate([part[1][k] for part in parts], axis=0) for k in range(self.num_y)]
+        inverse = np.empty_like(order)
+        inverse[order] = np.arange(len(order))
+        x = x[inverse]
+        y = [value[inverse] for value in y]
+        return x, (y if self.y_list else y[0])
+
+
+def load_permutations(pmap, atoms):
+    """
+    Load a permutation map as 0-based index array, the identity is always included first.
+
+    Args:
+        pmap (str): File of 1-based permutations, one per line. Empty or 'No' for no permutation.
+        atoms (int): Number of atoms.
+
+    Returns:
+        np.array: Permutation index of shape (permutations,atoms).
+
+    """
+    identity = np.arange(atoms).reshape((1, -1))
+    if not pmap or pmap == 'No' or not os.path.exists(pmap):
+        return identity
+    p = np.loadtxt(pmap).astype(int) - 1
+    p = p.reshape((-1, atoms))
+    return np.concatenate([identity, p], axis=0)
+
+
+def permute_atoms(x, y, index):
+    """
+    Permute atoms of coordinates and of per-atom targets of shape (batch,states,atoms,3).
+
+    Args:
+        x (np.array): Coordinates of shape (batch,atoms,3).
+        y (list): List of target values.
+        index (np.array): Permutation of the atoms.
+
+    Returns:
+        x (np.array): Permuted coordinates.
+        y (list): List of permuted target values.
+
+    """
+    return x[:, index, :], [value[:, :, index, :] if value.ndim == 4 else value for value in y]
+
+
+def stream_batches(data, indices, batch_size, permutations=None, shuffle_buffer=0, seed=None):
+    """
+    Yield batches of the selected samples and their permuted copies.
+
+    Chunks are visited in random order and their rows are collected in a buffer of at least shuffle_buffer samples,
+    which is shuffled before emitting batches. Without shuffle_buffer the samples come in ascending order of index.
+
+    Args:
+        data (ChunkedData): Dataset.
+        indices (np.array): Selected sample index.
+        batch_size (int): Batch size.
+        permutations (np.array, optional): Permutation index from load_permutations(). The default is None.
+        shuffle_buffer (int, optional): Size of the shuffle buffer. The default is 0, no shuffle.
+        seed (int, optional): Random seed. The default is None.
+
+    Yields:
+        x (np.array): Coordinates of a batch.
+        y (list): List of target values of a batch.
+
+    """
+    rng = np.random.default_rng(seed)
+    indices = np.asarray(indices, dtype=np.int64)
+    if shuffle_buffer > 0:
+        # Group by chunk and visit chunks in random order
+        chunk_of = np.searchsorted(data.offsets, indices, side='right') - 1
+        groups = [indices[chunk_of == c] for c in rng.permutation(np.unique(chunk_of))]
+    else:
+        groups = [indices]
+
+    buffer_x = []
+    buffer_y = []
+    buffered = 0
+    for group in groups:
+        for x, y in data.iter_chunks(group):
+            for index in (permutations if permutations is not None else [None]):
+                px, py = (x, y) if index is None else permute_atoms(x, y, index)
+                buffer_x.append(px)
+                buffer_y.append(py)
+                buffered += len(px)
+            if buffered < max(shuffle_buffer, batch_size):
+                continue
+            x_buf, y_buf = _merge_buffer(buffer_x, buffer_y, rng, shuffle_buffer > 0)
+            n_full = len(x_buf) // batch_size * batch_size
+            for a in range(0, n_full, batch_size):
+                yield x_buf[a:a + batch_size], [value[a:a + batch_size] for value in y_buf]
+            buffer_x = [x_buf[n_full:]]
+            buffer_y = [[value[n_full:] for value in y_buf]]
+            buffered = len(buffer_x[0])
+
+    if buffered > 0:
+        x_buf, y_buf = _merge_buffer(buffer_x, buffer_y, rng, shuffle_buffer > 0)
+        for a in range(0, len(x_buf), batch_size):
+            yield x_buf[a:a + batch_size], [value[a:a + batch_size] for value in y_buf]
+
+
+def _merge_buffer(buffer_x, buffer_y, rng, shuffle):
+    x = np.concatenate(buffer_x, axis=0)
+    y = [np.concatenate([by[k] for by in buffer_y], axis=0) for k in range(len(buffer_y[0]))]
+    if shuffle:
+        order = rng.permutation(len(x))
+        x = x[order]
+        y = [value[order] for value in y]
+    return x, y
+
+
+def make_tf_dataset(data, indices, batch_size, transform, permutations=None, shuffle_buffer=0, seed=None):
+    """
+    Keras input pipeline of stream_batches() with prefetch. The shuffle changes every epoch.
+
+    Args:
+        data (ChunkedData): Dataset.
+        indices (np.array): Selected sample index.
+        batch_size (int): Batch size.
+        transform (callable): Maps a batch (x, list of y) to the (inputs, targets) structure of the model.
+        permutations (np.array, optional): Permutation index from load_permutations(). The default is None.
+        shuffle_buffer (int, optional): Size of the shuffle buffer. The default is 0, no shuffle.
+        seed (int, optional): Random seed. The default is None.
+
+    Returns:
+        tf.data.Dataset: Dataset of batches.
+
+    """
+    epoch = [0]
+
+    def generator():
+        epoch_seed = None if seed is None else seed + epoch[0]
+        epoch[0] += 1
+        for x, y in stream_batches(data, indices, batch_size, permutations, shuffle_buffer, epoch_seed):
+            yield transform(x, y)
+
+    sample = transform(*next(stream_batches(data, np.asarray(indices)[:1], 1)))
+    signature = tf.nest.map_structure(
+        lambda v: tf.TensorSpec(shape=(None,) + np.shape(v)[1:], dtype=tf.float32), sample)
+    dataset = tf.data.Dataset.from_generator(generator, output_signature=signature)
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+
+def set_normalization_from_stream(model, batches, normalization_mode=None):
+    """
+    Set the constant feature normalization of a model in a single pass over batches of scaled coordinates.
+
+    Args:
+        model (object): Model with feat_layer and the 'feat_std' layer.
+        batches (iterable): Batches of scaled coordinates.
+        normalization_mode (int, optional): Normalization mode of the model. The default is None, from the model.
+
+    Returns:
+        list: [feat_x_mean, feat_x_std]
+
+    """
+    # Import here, the scaler module is imported by the models
+    from PyRAI2MD.Machine_Learning.NNsMD.scaler.general import SegmentStandardScaler
+
+    if normalization_mode is None:
+        normalization_mode = model.normalization_mode
+    else:
+        model.normalization_mode = normalization_mode
+
+    feat_x_mean, feat_x_std = model.get_layer('feat_std').get_weights()
+    feat_batches = (model.feat_layer(tf.convert_to_tensor(x, dtype=tf.float32)).numpy() for x in batches)
+    if normalization_mode == 1:
+        moments = RunningMoments()
+        for feat in feat_batches:
+            moments.update(feat, axis=0)
+        feat_x_mean, feat_x_std = moments.mean, moments.std
+    elif normalization_mode == 2:
+        seg_scaler = SegmentStandardScaler(model.get_layer('feat_geo').get_feature_type_segmentation())
+        seg_scaler.fit_stream(feat_batches)
+        feat_x_mean, feat_x_std = seg_scaler.feat_mean, seg_scaler.feat_std
+
+    feat_x_mean = np.asarray(feat_x_mean, dtype=np.float32)
+    feat_x_std = np.asarray(feat_x_std, dtype=np.float32)
+    model.get_layer('feat_std').set_weights([feat_x_mean, feat_x_std])
+
+    return [feat_x_mean, feat_x_std]
@@ -118,6 +118,8 @@ class EnergyModel(ks.Model):
         self.precomputed_features = False
         self.build((None, indim, 3))
         self.precomputed_features = precomputed_features
+        # Keep the feature normalization of loaded weights in fit
+        self.keep_normalization = False
 
     def call(self, data, training=False, **kwargs):
         """
@@ -204,7 +206,7 @@ class EnergyModel(ks.Model):
 
     def fit(self, **kwargs):
 
-        if self.precomputed_features:
+        if self.precomputed_features and not self.keep_normalization:
             self.set_const_normalization_from_features(kwargs['x'][0])
 
         return super(EnergyModel, self).fit(**kwargs)
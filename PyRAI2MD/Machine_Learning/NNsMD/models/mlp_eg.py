@@ -135,6 +135,8 @@ class EnergyGradientModel(ks.Model):
         self.build((None, indim, 3))
 
         self.precomputed_features = precomputed_features
+        # Keep the feature normalization of loaded weights in fit
+        self.keep_normalization = False
 
     def call(self, data, training=False, **kwargs):
         """
@@ -240,7 +242,7 @@ class EnergyGradientModel(ks.Model):
 
     def fit(self, **kwargs):
 
-        if self.precomputed_features:
+        if self.precomputed_features and not self.keep_normalization:
             self.set_const_normalization_from_features(kwargs['x'][0])
 
         return super(EnergyGradientModel, self).fit(**kwargs)
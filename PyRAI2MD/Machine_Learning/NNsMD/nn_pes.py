@@ -17,13 +17,26 @@ from PyRAI2MD.Machine_Learning.NNsMD.datasets.general import model_save_data_to_
 from PyRAI2MD.Machine_Learning.NNsMD.datasets.general import model_make_random_shuffle
 from PyRAI2MD.Machine_Learning.NNsMD.datasets.general import model_merge_data_in_chunks
 from PyRAI2MD.Machine_Learning.NNsMD.datasets.general import index_make_random_shuffle
+from PyRAI2MD.Machine_Learning.NNsMD.datasets.general import shuffle_data_in_folder
+from PyRAI2MD.Machine_Learning.NNsMD.datasets.stream import STREAM_DIR
+from PyRAI2MD.Machine_Learning.NNsMD.datasets.stream import save_chunked_data
 from PyRAI2MD.Machine_Learning.NNsMD.nn_pes_src.fit import fit_model_by_modeltype
+from PyRAI2MD.Machine_Learning.NNsMD.nn_pes_src.executor import TrainingExecutor
 from PyRAI2MD.Machine_Learning.NNsMD.nn_pes_src.selection import get_default_scaler
 from PyRAI2MD.Machine_Learning.NNsMD.nn_pes_src.selection import get_model_by_type
 from PyRAI2MD.Machine_Learning.NNsMD.nn_pes_src.selection import get_default_hyperparameters_by_modeltype
 from PyRAI2MD.Machine_Learning.NNsMD.nn_pes_src.selection import predict_uncertainty
+from PyRAI2MD.Machine_Learning.NNsMD.nn_pes_src.session import InferenceSession
+from PyRAI2MD.Machine_Learning.NNsMD.nn_pes_src.session import SharedFeatureSession
+from PyRAI2MD.Machine_Learning.NNsMD.nn_pes_src.bundle import read_bundle
+from PyRAI2MD.Machine_Learning.NNsMD.nn_pes_src.bundle import write_bundle
+from PyRAI2MD.Machine_Learning.NNsMD.nn_pes_numpy import NUMPY_MODEL_FILE
+from PyRAI2MD.Machine_Learning.NNsMD.nn_pes_numpy import NUMPY_MODEL_TYPES
+from PyRAI2MD.Machine_Learning.NNsMD.nn_pes_numpy import NUMPY_ACTIVATIONS
 from PyRAI2MD.Machine_Learning.NNsMD.nn_pes_src.selection import unpack_convert_y_to_numpy
 
+BUNDLE_FILE = 'models.bundle'
+
 
 class NeuralNetPes:
     """
@@ -42,13 +55,19 @@ class NeuralNetPes:
     
     """
 
-    def __init__(self, directory: str, mult_nn=2):
+    def __init__(self, directory: str, mult_nn=2, fused=True, shared_features=True, mc_passes=0):
         """
         Initilialize empty NeuralNetPes instance.
 
         Args:
             directory (str): Directory where models, hyperparameter, logs and fitresults are stored.
             mult_nn (TYPE, optional): Number of NN instances to create for error estimate. The default is 2.
+            fused (bool, optional): Run all NN instances of a model in one graph in call(). The default is True.
+            shared_features (bool, optional): Run all models in one graph in call() and compute the geometric
+                                              features once for all of them, if fused. The default is True.
+            mc_passes (int, optional): Number of stochastic dropout passes of each NN instance with dropout for
+                                       the error estimate in call() and predict(). The passes run batched in the
+                                       fused graph. The default is 0, which uses the NN instances only.
 
         Returns:
             NueralNetPes instance.
@@ -67,6 +86,11 @@ class NeuralNetPes:
 
         self._directory = directory
         self._addNN = mult_nn
+        self._fused = fused
+        self._shared_features = shared_features
+        self._mc_passes = mc_passes
+        self._sessions = {}
+        self._shared_session = None
 
         self._last_shuffle = None
 
@@ -164,6 +188,9 @@ class NeuralNetPes:
             self._models.update(mod)
             self._models_hyper[key] = hyp
             self._models_scaler.update(sc)
+            # New models or scalers need a new inference session
+            self._sessions.pop(key, None)
+            self._shared_session = None
 
         return self._models
 
@@ -214,6 +241,11 @@ class NeuralNetPes:
         for i, x in enumerate(self._models_scaler[name]):
             x.save(os.path.join(filename, 'scaler' + '_v%i' % i + ".json"))
 
+        # Weights on file changed, the bundle is outdated
+        bundle = os.path.join(os.path.abspath(directory), BUNDLE_FILE)
+        if os.path.exists(bundle):
+            os.remove(bundle)
+
         return filename
 
     def save(self, model_name=None):
@@ -302,6 +334,181 @@ class NeuralNetPes:
 
         return out_dirs
 
+    @staticmethod
+    def _get_numpy_params(model, hyper, scaler, model_type, prefix):
+        # Collect weights, feature index, activation and scaler of one NN instance as arrays
+        params = {}
+        feat_layer = model.feat_layer
+        atoms = int(hyper['model']['atoms'])
+        for key, use, layer, width in [('invd_index', feat_layer.use_invdist, 'invd_layer', 2),
+                                       ('angle_index', feat_layer.use_bond_angles, 'ang_layer', 3),
+                                       ('dihed_index', feat_layer.use_dihed_angles, 'dih_layer', 4)]:
+            if use:
+                params[prefix + key] = np.array(getattr(feat_layer, layer).get_weights()[0], dtype=np.int64)
+            else:
+                params[prefix + key] = np.zeros((0, width), dtype=np.int64)
+        nfeat = np.sum([len(params[prefix + x]) for x in ['invd_index', 'angle_index', 'dihed_index']])
+
+        feat_mean, feat_std = model.std_layer.get_weights()
+        params[prefix + 'feat_mean'] = feat_mean
+        params[prefix + 'feat_std'] = feat_std
+
+        mlp = model.mlp_layer
+        dense = mlp.mlp_dense_activ + [mlp.mlp_dense_last]
+        params[prefix + 'depth'] = np.array(len(dense))
+        for k, layer in enumerate(dense):
+            weights = layer.get_weights()
+            params[prefix + 'kernel_%i' % k] = weights[0]
+            params[prefix + 'bias_%i' % k] = weights[1] if len(weights) > 1 else np.zeros(weights[0].shape[1])
+
+        activ = mlp.dense_activ_serialize
+        if isinstance(activ, dict):
+            activ_name = activ['class_name']
+            activ_alpha = activ.get('config', {}).get('alpha', 0.03)
+        else:
+            activ_name = str(activ)
+            activ_alpha = 0.03
+        if activ_name not in NUMPY_ACTIVATIONS:
+            raise TypeError(f"Error: Cannot export activation {activ_name} to numpy")
+        params[prefix + 'activ'] = np.array(activ_name)
+        params[prefix + 'activ_alpha'] = np.array(activ_alpha)
+        # Dropout rate after the hidden layers except the last one for stochastic passes
+        params[prefix + 'dropout'] = np.array(mlp.dropout_dropout if mlp.dropout_use else 0.0)
+
+        if model_type in ['mlp_e', 'mlp_eg']:
+            out_layer = model.energy_layer
+        else:
+            out_layer = model.virt_layer
+        weights = out_layer.get_weights()
+        params[prefix + 'kernel_out'] = weights[0]
+        params[prefix + 'bias_out'] = weights[1] if len(weights) > 1 else np.zeros(weights[0].shape[1])
+
+        sc = scaler.get_params()
+        if model_type == 'mlp_eg':
+            states = weights[0].shape[1]
+            energy_only = model.energy_only
+        elif model_type == 'mlp_e':
+            states = weights[0].shape[1]
+            energy_only = True
+        elif model_type == 'mlp_nac':
+            states = weights[0].shape[1] // atoms
+            energy_only = False
+        else:
+            states = weights[0].shape[1] // nfeat
+            energy_only = False
+        params[prefix + 'atoms'] = np.array(atoms)
+        params[prefix + 'states'] = np.array(states)
+        params[prefix + 'energy_only'] = np.array(energy_only)
+        params[prefix + 'x_mean'] = np.array(sc['x_mean'])
+        params[prefix + 'x_std'] = np.array(sc['x_std'])
+        if model_type in ['mlp_e', 'mlp_eg']:
+            params[prefix + 'y_mean'] = np.array(sc['energy_mean'])
+            params[prefix + 'y_std'] = np.array(sc['energy_std'])
+            params[prefix + 'grad_std'] = np.array(sc.get('gradient_std', 1.0))
+        else:
+            params[prefix + 'y_mean'] = np.array(sc['nac_mean'])
+            params[prefix + 'y_std'] = np.array(sc['nac_std'])
+            params[prefix + 'grad_std'] = np.array(1.0)
+
+        return params
+
+    def _export_numpy(self, directory, name):
+        # Check if model name can be saved
+        if name not in self._models:
+            raise TypeError("Cannot save model before init.")
+
+        model_type = self._models_hyper[name][0]['general']['model_type']
+        if model_type not in NUMPY_MODEL_TYPES:
+            print(f"Warning: Cannot export model type {model_type} to numpy")
+            return None
+
+        # Folder to store model in
+        filename = os.path.abspath(os.path.join(directory, name))
+        os.makedirs(filename, exist_ok=True)
+
+        params = {'model_type': np.array(model_type), 'num_nn': np.array(self._addNN)}
+        for i in range(self._addNN):
+            params.update(self._get_numpy_params(self._models[name][i], self._models_hyper[name][i],
+                                                 self._models_scaler[name][i], model_type, 'v%i_' % i))
+        np.savez(os.path.join(filename, NUMPY_MODEL_FILE), **params)
+
+        return filename
+
+    def export_numpy(self, model_name=None):
+        """
+        Save weights, scaler, feature index and activation into a numpy_model.npz for NeuralNetPesNumpy.
+
+        Args:
+            model_name (str, optional): Name of the Model to save. The default is None, which means save all
+
+        Returns:
+            out_dirs (list): Saved directories.
+
+        """
+        directory = os.path.abspath(self._directory)
+        os.makedirs(directory, exist_ok=True)
+
+        if isinstance(model_name, str):
+            model_name = [model_name]
+        elif not isinstance(model_name, list):
+            model_name = list(self._models.keys())
+
+        out_dirs = []
+        for name in model_name:
+            out_dir = self._export_numpy(directory, name)
+            if out_dir is not None:
+                out_dirs.append(out_dir)
+
+        return out_dirs
+
+    def save_bundle(self):
+        """
+        Save weights, hyperparameter and scaler of all models into a single file models.bundle in class folder.
+
+        The weights are stored as raw arrays and are memory-mapped on load, see nn_pes_src.bundle.
+
+        Returns:
+            filepath (str): Bundle file path.
+
+        """
+        directory = os.path.abspath(self._directory)
+        os.makedirs(directory, exist_ok=True)
+
+        meta = {'num_nn': self._addNN, 'models': {}}
+        arrays = {}
+        for name in self._models.keys():
+            meta['models'][name] = {'hyper': self._models_hyper[name],
+                                    'scaler': [x.get_params() for x in self._models_scaler[name]],
+                                    'num_weights': [len(x.get_weights()) for x in self._models[name]]}
+            for i, x in enumerate(self._models[name]):
+                for k, w in enumerate(x.get_weights()):
+                    arrays['%s/v%i/w%i' % (name, i, k)] = w
+
+        return write_bundle(os.path.join(directory, BUNDLE_FILE), meta, arrays)
+
+    def _load_bundle(self, model_name):
+        # Load models from the bundle, return False if the bundle cannot provide all of them
+        bundle = os.path.join(os.path.abspath(self._directory), BUNDLE_FILE)
+        if not os.path.exists(bundle):
+            return False
+
+        meta, arrays = read_bundle(bundle)
+        if model_name is None:
+            model_name = list(meta['models'].keys())
+        if meta['num_nn'] != self._addNN or not all([x in meta['models'] for x in model_name]):
+            return False
+
+        for name in model_name:
+            info = meta['models'][name]
+            self.create({name: info['hyper']})
+            for i in range(self._addNN):
+                weights = [arrays['%s/v%i/w%i' % (name, i, k)] for k in range(info['num_weights'][i])]
+                self._models[name][i].set_weights(weights)
+                self._models_scaler[name][i].set_params(info['scaler'][i])
+            print("Info: Imported bundle for: %s" % name)
+
+        return True
+
     def _load(self, folder, model_name):
         fname = os.path.join(folder, model_name)
         # Check if folder exists
@@ -326,11 +533,26 @@ class NeuralNetPes:
             self._models_scaler[model_name][i].load(os.path.join(fname, 'scaler' + '_v%i' % i + ".json"))
             print("Info: Imported scaler for: %s" % (model_name + '_v%i' % i))
 
+    def _load_weights(self, model_name):
+        # Load weights into the created models if they are on file, hyperparameters are kept
+        # the scaler is kept as well for fine-tuning with keep_normalization
+        fname = os.path.join(os.path.abspath(self._directory), model_name)
+        for i in range(self._addNN):
+            wname = os.path.join(fname, 'weights' + '_v%i' % i + '.h5')
+            sname = os.path.join(fname, 'scaler' + '_v%i' % i + ".json")
+            if os.path.exists(wname):
+                self._models[model_name][i].load_weights(wname)
+                print("Info: Kept weights for retraining: %s" % (model_name + '_v%i' % i))
+            if os.path.exists(sname) and self._models_hyper[model_name][i]['general'].get('keep_normalization', False):
+                self._models_scaler[model_name][i].load(sname)
+                print("Info: Kept scaler for retraining: %s" % (model_name + '_v%i' % i))
+
     def load(self, model_name=None):
         """
         Load a model from weights and hyperparamter that are stored in class folder.
         
         The tensorflow.keras.model is not loaded itself but created new from hyperparameters.
+        If a models.bundle from save_bundle() holds all requested models, it is used instead of the model folders.
 
         Args:
             model_name (str,list, optional): Model names on file. The default is None.
@@ -346,6 +568,15 @@ class NeuralNetPes:
             raise FileNotFoundError("Cannot find class directory")
         directory = os.path.abspath(self._directory)
 
+        # Use the single file bundle if it has all requested models
+        if isinstance(model_name, str):
+            bundle_name = [model_name]
+        else:
+            bundle_name = model_name
+        if self._load_bundle(bundle_name):
+            print("Debug: loaded all models.")
+            return self._models
+
         # Load model_name 
         if isinstance(model_name, str):
             self._load(directory, model_name)
@@ -363,13 +594,27 @@ class NeuralNetPes:
         print("Debug: loaded all models.")
         return self._models
 
-    def _fit_models(self, target_model, x, y, gpu, proc_async, fitmode, random_shuffle=False):
+    def _fit_models(self, target_model, x, y, gpu, proc_async, fitmode, random_shuffle=False, executor=None):
         # Pick modeltype from first hyper
         model_type = self._models_hyper[target_model][0]['general']['model_type']
         # modelfolder
         mod_dir = os.path.join(os.path.abspath(self._directory), target_model)
+        # Pass data to the in-process executor without saving it
+        if executor is not None:
+            if random_shuffle:
+                x, y = shuffle_data_in_folder(x, y, mod_dir)
+            for i in range(self._addNN):
+                executor.submit(model_type, i, mod_dir, gpu[i], fitmode, x, y)
+            return []
         # Save data, will be made model specific if necessary in the future
-        model_save_data_to_folder(x, y, target_model, mod_dir, random_shuffle)
+        general = self._models_hyper[target_model][0]['general']
+        if general.get('stream', False):
+            # Chunks are streamed by the training script instead of loading all data
+            if random_shuffle:
+                x, y = shuffle_data_in_folder(x, y, mod_dir)
+            save_chunked_data(os.path.join(mod_dir, STREAM_DIR), x, y, general.get('chunk_size', 4096))
+        else:
+            model_save_data_to_folder(x, y, target_model, mod_dir, random_shuffle)
         # Start proc per NN
         proclist = []
         for i in range(self._addNN):
@@ -391,12 +636,27 @@ class NeuralNetPes:
 
         return fit_error
 
-    def fit(self, x, y, gpu_dist=None, proc_async=True, fitmode="training", random_shuffle=False):
+    def _collect_fit_error(self, target_model, results):
+        # Fit error returned by the in-process executor
+        outdir = os.path.join(os.path.abspath(self._directory), target_model)
+        fit_error = []
+        for i in range(self._addNN):
+            error_val = results.get((outdir, i))
+            if error_val is None:
+                print(f"Error: Can not find fit error output {target_model}. Fit may not have run correctly!")
+                break
+            fit_error.append(np.array(error_val))
+
+        return fit_error
+
+    def fit(self, x, y, gpu_dist=None, proc_async=True, fitmode="training", random_shuffle=False, in_process=False):
         """
         Fit NN to data. Model weights and hyper parameters are always saved to file before fit.
         
         The fit routine calls training scripts on the datafolder with parallel runtime.
         The type of execution is found in nn_pes_src.fit with the training nn_pes_src.training_ scripts.
+        With in_process, the training functions of these scripts run in threads of this process instead,
+        see nn_pes_src.executor.
         
         Args:
             x (np.array,list,dict): X-values, e.g. Coordinates in Angstroem of shape (batch,Atoms,3)
@@ -411,6 +671,7 @@ class NeuralNetPes:
                             Default is 'training'.
                             In principle every reasonable category can be created in hyperparameters.
             random_shuffle (bool): Whether to shuffle data before fitting. Default is False.  
+            in_process (bool): Train in threads of this process with the data passed directly. Default is False.
             
         Returns:
             ferr (dict): Fitting Error.
@@ -437,7 +698,13 @@ class NeuralNetPes:
 
                 # Fitting
         proclist = []
+        executor = None
+        if in_process:
+            executor = TrainingExecutor(max_workers=None if proc_async else 1)
         for target_model, ydata in y.items():
+            # Keep previous weights when retraining an existing model
+            if fitmode == 'retraining':
+                self._load_weights(target_model)
             # Save model here with hyper !!!!
             self.save(target_model)
             print(f"Debug: starting training model {target_model}")
@@ -446,10 +713,14 @@ class NeuralNetPes:
             else:
                 x_model = x
             proclist += self._fit_models(target_model, x_model, ydata, gpu_dict_clean[target_model], proc_async,
-                                         fitmode, random_shuffle)
+                                         fitmode, random_shuffle, executor)
 
         # Wait for fits
-        if proc_async:
+        fit_results = None
+        if in_process:
+            print("Fits submitted, training in-process...")
+            fit_results = executor.run()
+        elif proc_async:
             print("Fits submitted, waiting...")
             # Wait for models to finish
             for proc in proclist:
@@ -460,7 +731,10 @@ class NeuralNetPes:
         self.load(models_to_train)
         fit_error = {}
         for target_model in y.keys():
-            fit_error[target_model] = self._read_fit_error(target_model)
+            if fit_results is not None:
+                fit_error[target_model] = self._collect_fit_error(target_model, fit_results)
+            else:
+                fit_error[target_model] = self._read_fit_error(target_model)
 
         return fit_error
 
@@ -479,9 +753,37 @@ class NeuralNetPes:
         out = [self._models_scaler[name][i].inverse_transform(y=temp[i])[1] for i in range(self._addNN)]
         return predict_uncertainty(model_type, out, self._addNN)
 
+    def _predict_passes(self, x):
+        # Stochastic passes need dropout in training mode, run them in the fused graph in batches
+        names = list(self._models.keys())
+        batch_size = min([self._models_hyper[name][0]['predict']['batch_size_predict'] for name in names])
+        batch_size = max(batch_size // self._mc_passes, 1)
+        if isinstance(x, dict):
+            ndata = len(x[names[0]])
+        else:
+            ndata = len(x)
+
+        chunks = []
+        for a in range(0, ndata, batch_size):
+            if isinstance(x, dict):
+                x_chunk = {k: v[a: a + batch_size] for k, v in x.items()}
+            else:
+                x_chunk = x[a: a + batch_size]
+            chunks.append(self.call(x_chunk))
+
+        def concat(y):
+            if isinstance(y[0], list):
+                return [np.concatenate([z[i] for z in y], axis=0) for i in range(len(y[0]))]
+            return np.concatenate(y, axis=0)
+
+        result = {name: concat([c[0][name] for c in chunks]) for name in names}
+        error = {name: concat([c[1][name] for c in chunks]) for name in names}
+        return result, error
+
     def predict(self, x):
         """
         Prediction for all models available. Prediction is slower but works on large data.
+        With mc_passes, the stochastic passes run in the fused graph of call() in batches.
 
         Args:
             x (np.array,list, dict):    Coordinates in Angstroem of shape (batch,Atoms,3)
@@ -494,6 +796,9 @@ class NeuralNetPes:
                           'nac' : np.array , ..}.
 
         """
+        if self._mc_passes > 1:
+            return self._predict_passes(x)
+
         result = {}
         error = {}
         for name in self._models.keys():
@@ -522,9 +827,81 @@ class NeuralNetPes:
         out = [self._models_scaler[name][i].inverse_transform(y=temp[i])[1] for i in range(self._addNN)]
         return predict_uncertainty(model_type, out, self._addNN)
 
+    def _get_session(self, name):
+        # Scaling, all NN instances and the mean/std reduction in one graph with a pinned input signature
+        if name not in self._sessions:
+            atoms = self._models_hyper[name][0]['model']['atoms']
+            self._sessions[name] = InferenceSession(self._models[name], self._models_scaler[name], atoms,
+                                                    self._mc_passes)
+        return self._sessions[name]
+
+    def _use_shared_session(self):
+        return self._fused and self._shared_features and len(self._models) > 1
+
+    def _get_shared_session(self):
+        # All models in one graph with the geometric features computed once
+        if self._shared_session is None:
+            names = list(self._models.keys())
+            atoms = self._models_hyper[names[0]][0]['model']['atoms']
+            types = {name: self._models_hyper[name][0]['general']['model_type'] for name in names}
+            self._shared_session = SharedFeatureSession(self._models, self._models_scaler, types, atoms,
+                                                        self._mc_passes)
+        return self._shared_session
+
+    def _call_shared(self, x):
+        out_dict = self._get_shared_session()(x)
+        result = {}
+        error = {}
+        for name, (out_mean, out_std) in out_dict.items():
+            model_type = self._models_hyper[name][0]['general']['model_type']
+            result[name] = unpack_convert_y_to_numpy(model_type, out_mean)
+            error[name] = unpack_convert_y_to_numpy(model_type, out_std)
+        return result, error
+
+    def _call_fused(self, name, x):
+        # Check type with first hyper
+        model_type = self._models_hyper[name][0]['general']['model_type']
+        out_mean, out_std = self._get_session(name)(x)
+        return unpack_convert_y_to_numpy(model_type, out_mean), unpack_convert_y_to_numpy(model_type, out_std)
+
+    def warmup(self):
+        """
+        Trace the inference graph of all models with a dummy geometry, so that the first call() is fast.
+
+        Returns:
+            warmup_time (dict): Warmup time in seconds for each model.
+
+        """
+        if self._use_shared_session():
+            return {'shared': self._get_shared_session().warmup()}
+
+        warmup_time = {}
+        for name in self._models.keys():
+            warmup_time[name] = self._get_session(name).warmup()
+        return warmup_time
+
+    def get_trace_info(self):
+        """
+        Tracing counters of the inference sessions.
+
+        Returns:
+            trace_info (dict): Number of traces, retraces and calls for each model.
+
+        """
+        trace_info = {}
+        for name, session in self._sessions.items():
+            trace_info[name] = {'trace': session.num_trace, 'retrace': session.retrace(), 'call': session.num_call}
+        if self._shared_session is not None:
+            session = self._shared_session
+            trace_info['shared'] = {'trace': session.num_trace, 'retrace': session.retrace(), 'call': session.num_call}
+        return trace_info
+
     def call(self, x):
         """
         Faster prediction without looping batches. Requires single small batch (batch, Atoms,3) that fit into memory.
+        All NN instances of a model run in a single graph including scaling and error estimate, if fused.
+        With shared_features, all models run in one graph and the geometric features are computed once.
+        With mc_passes, the stochastic dropout passes always run in the fused graph.
 
         Args:
             x (np.array):   Coordinates in Angstroem of shape (batch,Atoms,3)
@@ -537,6 +914,9 @@ class NeuralNetPes:
                           'nac' : np.array , ..}.
 
         """
+        if self._use_shared_session() and not isinstance(x, dict):
+            return self._call_shared(x)
+
         result = {}
         error = {}
         for name in self._models.keys():
@@ -544,7 +924,10 @@ class NeuralNetPes:
                 x_model = x[name]
             else:
                 x_model = x
-            temp = self._call_models(name, x_model)
+            if self._fused or self._mc_passes > 1:
+                temp = self._call_fused(name, x_model)
+            else:
+                temp = self._call_models(name, x_model)
             result[name] = temp[0]
             error[name] = temp[1]
 
@@ -0,0 +1,545 @@
+"""
+NumPy runtime for exported MLP models of NeuralNetPes.
+
+Evaluates energies, analytic gradients and NACs of the models mlp_e, mlp_eg, mlp_nac and mlp_nac2 without
+tensorflow. The weights, scaler, feature index and activation are read from the numpy_model.npz written by
+NeuralNetPes.export_numpy(). The gradients are back-propagated by hand through the dense layers and the
+geometric features. Models with dropout can run stochastic passes for the error estimate as in NeuralNetPes.
+"""
+
+import os
+
+import numpy as np
+
+NUMPY_MODEL_FILE = 'numpy_model.npz'
+NUMPY_MODEL_TYPES = ['mlp_e', 'mlp_eg', 'mlp_nac', 'mlp_nac2']
+NUMPY_ACTIVATIONS = ['leaky_softplus', 'shifted_softplus', 'softplus', 'sigmoid', 'tanh', 'relu', 'selu', 'linear']
+
+# Same as tf.keras.backend.epsilon() in ConstLayerNormalization
+NORM_EPSILON = 1e-7
+SELU_ALPHA = 1.6732632423543772848170429916717
+SELU_SCALE = 1.0507009873554804934193349852946
+
+
+def _sigmoid(x):
+    return 0.5 * (1.0 + np.tanh(0.5 * x))
+
+
+def get_activation(name, alpha=0.03):
+    """
+    Activation function and its derivative as in layers.mlp.
+
+    Args:
+        name (str): Activation identifier.
+        alpha (float): Leaking slope of leaky_softplus.
+
+    Returns:
+        func: Activation of x.
+        func: Derivative of the activation of x.
+
+    """
+    if name == 'leaky_softplus':
+        return (lambda x: np.logaddexp(0.0, x) * (1 - alpha) + alpha * x,
+                lambda x: _sigmoid(x) * (1 - alpha) + alpha)
+    elif name == 'shifted_softplus':
+        return lambda x: np.logaddexp(0.0, x) - np.log(2.0), _sigmoid
+    elif name == 'softplus':
+        return lambda x: np.logaddexp(0.0, x), _sigmoid
+    elif name == 'sigmoid':
+        return _sigmoid, lambda x: _sigmoid(x) * (1 - _sigmoid(x))
+    elif name == 'tanh':
+        return np.tanh, lambda x: 1 - np.tanh(x) ** 2
+    elif name == 'relu':
+        return lambda x: np.maximum(x, 0.0), lambda x: (x > 0).astype(x.dtype)
+    elif name == 'selu':
+        return (lambda x: SELU_SCALE * np.where(x > 0, x, SELU_ALPHA * np.expm1(np.minimum(x, 0.0))),
+                lambda x: SELU_SCALE * np.where(x > 0, 1.0, SELU_ALPHA * np.exp(np.minimum(x, 0.0))))
+    elif name == 'linear':
+        return lambda x: x, lambda x: np.ones_like(x)
+    else:
+        raise TypeError(f"Error: Unknown activation for numpy model {name}")
+
+
+def inverse_distance(x, index):
+    """
+    Inverse distances and their derivative, same as layers.features.InverseDistanceIndexed.
+
+    Args:
+        x (np.array): Coordinates of shape (batch,atoms,3).
+        index (np.array): Atom pairs of shape (N,2).
+
+    Returns:
+        feat (np.array): Inverse distances of shape (batch,N).
+        grad (np.array): Derivative of shape (batch,N,atoms,3).
+
+    """
+    batch, atoms = x.shape[0], x.shape[1]
+    npair = len(index)
+    vec = x[:, index[:, 1]] - x[:, index[:, 0]]
+    dist = np.sqrt(np.sum(vec * vec, axis=-1))
+    feat = 1 / dist
+    dfdv = -vec / np.expand_dims(dist ** 3, axis=-1)
+    grad = np.zeros((batch, npair, atoms, 3))
+    pair = np.arange(npair)
+    grad[:, pair, index[:, 1]] += dfdv
+    grad[:, pair, index[:, 0]] -= dfdv
+    return feat, grad
+
+
+def angle(x, index):
+    """
+    Bond angles and their derivative, same as layers.features.Angles.
+
+    Args:
+        x (np.array): Coordinates of shape (batch,atoms,3).
+        index (np.array): Atom triples of shape (N,3), the second atom is the center.
+
+    Returns:
+        feat (np.array): Angles in rad of shape (batch,N).
+        grad (np.array): Derivative of shape (batch,N,atoms,3).
+
+    """
+    batch, atoms = x.shape[0], x.shape[1]
+    nangle = len(index)
+    vec1 = x[:, index[:, 0]] - x[:, index[:, 1]]
+    vec2 = x[:, index[:, 2]] - x[:, index[:, 1]]
+    norm1 = np.expand_dims(np.sqrt(np.sum(vec1 * vec1, axis=-1)), axis=-1)
+    norm2 = np.expand_dims(np.sqrt(np.sum(vec2 * vec2, axis=-1)), axis=-1)
+    cos = np.sum(vec1 * vec2, axis=-1, keepdims=True) / norm1 / norm2
+    feat = np.arccos(cos[..., 0])
+    dadc = -1 / np.sqrt(1 - cos ** 2)
+    dadv1 = dadc * (vec2 / norm1 / norm2 - cos * vec1 / norm1 ** 2)
+    dadv2 = dadc * (vec1 / norm1 / norm2 - cos * vec2 / norm2 ** 2)
+    grad = np.zeros((batch, nangle, atoms, 3))
+    ang = np.arange(nangle)
+    grad[:, ang, index[:, 0]] += dadv1
+    grad[:, ang, index[:, 2]] += dadv2
+    grad[:, ang, index[:, 1]] -= dadv1 + dadv2
+    return feat, grad
+
+
+def dihedral(x, index):
+    """
+    Dihedral angles and their derivative, same as layers.features.Dihedral.
+
+    Args:
+        x (np.array): Coordinates of shape (batch,atoms,3).
+        index (np.array): Atom quadruples of shape (N,4).
+
+    Returns:
+        feat (np.array): Dihedral angles in rad of shape (batch,N).
+        grad (np.array): Derivative of shape (batch,N,atoms,3).
+
+    """
+    batch, atoms = x.shape[0], x.shape[1]
+    ndihed = len(index)
+    p1 = x[:, index[:, 0]]
+    p2 = x[:, index[:, 1]]
+    p3 = x[:, index[:, 2]]
+    p4 = x[:, index[:, 3]]
+    b1 = p1 - p2
+    b2 = p2 - p3
+    b3 = p4 - p3
+    m = np.cross(b1, b2)
+    n = np.cross(b3, b2)
+    norm2 = np.sqrt(np.sum(b2 * b2, axis=-1, keepdims=True))
+    arg1 = np.sum(b2 * np.cross(n, m), axis=-1, keepdims=True)
+    mn = np.sum(m * n, axis=-1, keepdims=True)
+    arg2 = norm2 * mn
+    feat = np.arctan2(arg1[..., 0], arg2[..., 0])
+
+    # Derivative of atan2(arg1,arg2) by the triple product arg1 = b2.(n x m) and arg2 = |b2| m.n
+    dd1 = arg2 / (arg1 ** 2 + arg2 ** 2)
+    dd2 = -arg1 / (arg1 ** 2 + arg2 ** 2)
+    gm = dd1 * np.cross(b2, n) + dd2 * norm2 * n
+    gn = dd1 * np.cross(m, b2) + dd2 * norm2 * m
+    gb1 = np.cross(b2, gm)
+    gb2 = dd1 * np.cross(n, m) + dd2 * mn * b2 / norm2 + np.cross(gm, b1) + np.cross(gn, b3)
+    gb3 = np.cross(b2, gn)
+    grad = np.zeros((batch, ndihed, atoms, 3))
+    dih = np.arange(ndihed)
+    grad[:, dih, index[:, 0]] += gb1
+    grad[:, dih, index[:, 1]] += gb2 - gb1
+    grad[:, dih, index[:, 2]] -= gb2 + gb3
+    grad[:, dih, index[:, 3]] += gb3
+    return feat, grad
+
+
+def geometric_features(x, invd_index, angle_index, dihed_index):
+    """
+    Feature vector and its derivative, same as layers.features.FeatureGeometric.
+
+    Args:
+        x (np.array): Coordinates of shape (batch,atoms,3).
+        invd_index (np.array): Atom pairs of shape (N,2).
+        angle_index (np.array): Atom triples of shape (N,3).
+        dihed_index (np.array): Atom quadruples of shape (N,4).
+
+    Returns:
+        feat (np.array): Features of shape (batch,features).
+        grad (np.array): Derivative of shape (batch,features,atoms,3).
+
+    """
+    feat = []
+    grad = []
+    if len(invd_index) > 0:
+        f, g = inverse_distance(x, invd_index)
+        feat.append(f)
+        grad.append(g)
+    if len(angle_index) > 0:
+        f, g = angle(x, angle_index)
+        feat.append(f)
+        grad.append(g)
+    if len(dihed_index) > 0:
+        f, g = dihedral(x, dihed_index)
+        feat.append(f)
+        grad.append(g)
+    return np.concatenate(feat, axis=1), np.concatenate(grad, axis=1)
+
+
+class NumpyMLP:
+    """
+    A single exported MLP model evaluated with numpy.
+    """
+
+    def __init__(self, params, prefix, model_type):
+        """
+        Read model parameters from the exported dictionary.
+
+        Args:
+            params (dict): Arrays from numpy_model.npz.
+            prefix (str): Key prefix of this NN instance, e.g. 'v0_'.
+            model_type (str): Model identifier.
+
+        """
+        self.model_type = model_type
+        self.invd_index = params[prefix + 'invd_index'].astype(int)
+        self.angle_index = params[prefix + 'angle_index'].astype(int)
+        self.dihed_index = params[prefix + 'dihed_index'].astype(int)
+        self.feat_mean = params[prefix + 'feat_mean']
+        self.feat_std = params[prefix + 'feat_std'] + NORM_EPSILON
+        self.depth = int(params[prefix + 'depth'])
+        self.kernel = [params[prefix + 'kernel_%i' % k] for k in range(self.depth)]
+        self.bias = [params[prefix + 'bias_%i' % k] for k in range(self.depth)]
+        self.kernel_out = params[prefix + 'kernel_out']
+        self.bias_out = params[prefix + 'bias_out']
+        self.energy_only = bool(params[prefix + 'energy_only'])
+        self.states = int(params[prefix + 'states'])
+        self.atoms = int(params[prefix + 'atoms'])
+        self.x_mean = params[prefix + 'x_mean']
+        self.x_std = params[prefix + 'x_std']
+        self.y_mean = params[prefix + 'y_mean']
+        self.y_std = params[prefix + 'y_std']
+        self.grad_std = params[prefix + 'grad_std']
+        self.activ, self.activ_grad = get_activation(str(params[prefix + 'activ']), float(params[prefix + 'activ_alpha']))
+        # Models exported before stochastic passes have no dropout rate
+        self.dropout = float(params.get(prefix + 'dropout', 0.0))
+        # Models with the same feature index can share the features of the unscaled coordinates
+        self.feature_key = (self.invd_index.tobytes(), self.angle_index.tobytes(), self.dihed_index.tobytes())
+        self.shared_features = np.size(self.x_std) == 1
+
+    def features(self, x):
+        """
+        Features of the unscaled coordinates, which can be shared by models with the same feature_key.
+
+        Args:
+            x (np.array): Coordinates of shape (batch,atoms,3).
+
+        Returns:
+            feat (np.array): Features of shape (batch,features).
+            grad (np.array): Derivative of shape (batch,features,atoms,3).
+
+        """
+        return geometric_features(np.asarray(x, dtype=float), self.invd_index, self.angle_index, self.dihed_index)
+
+    def _scale_features(self, feat, feat_grad):
+        # A uniform coordinate scale only changes the inverse distances, angles are invariant
+        x_std = float(np.reshape(self.x_std, -1)[0])
+        scale = np.ones(feat.shape[1])
+        scale[:len(self.invd_index)] = x_std
+        return feat * scale, feat_grad * np.reshape(scale * x_std, (1, -1, 1, 1))
+
+    def _forward(self, feat, rng=None):
+        h = (feat - self.feat_mean) / self.feat_std
+        z_list = []
+        masks = []
+        for k in range(self.depth):
+            z = np.matmul(h, self.kernel[k]) + self.bias[k]
+            z_list.append(z)
+            h = self.activ(z)
+            # Inverted dropout as tf.keras.layers.Dropout, the last hidden layer has none
+            if rng is not None and self.dropout > 0 and k < self.depth - 1:
+                mask = (rng.random(h.shape) >= self.dropout) / (1 - self.dropout)
+                h = h * mask
+                masks.append(mask)
+            else:
+                masks.append(None)
+        out = np.matmul(h, self.kernel_out) + self.bias_out
+        return out, z_list, masks
+
+    def _backward(self, z_list, masks):
+        # Jacobian of all outputs to features of shape (batch,outputs,features)
+        batch = z_list[0].shape[0]
+        jac = np.repeat(np.expand_dims(self.kernel_out.T, axis=0), batch, axis=0)
+        for k in reversed(range(self.depth)):
+            if masks[k] is not None:
+                jac = jac * np.expand_dims(masks[k], axis=1)
+            jac = jac * np.expand_dims(self.activ_grad(z_list[k]), axis=1)
+            jac = np.matmul(jac, self.kernel[k].T)
+        return jac / self.feat_std
+
+    def __call__(self, x, features=None, rng=None):
+        """
+        Forward pass with input and output scaling as NeuralNetPes.call().
+
+        Args:
+            x (np.array): Coordinates of shape (batch,atoms,3).
+            features (list, optional): Output of features() for the same x. The default is None.
+            rng (np.random.Generator, optional): Draw dropout masks for a stochastic pass. The default is None.
+
+        Returns:
+            list, np.array: Prediction of the model type.
+
+        """
+        batch = len(x)
+        if features is not None and self.shared_features:
+            feat, feat_grad = self._scale_features(*features)
+        else:
+            x = (np.asarray(x, dtype=float) - self.x_mean) / self.x_std
+            feat, feat_grad = geometric_features(x, self.invd_index, self.angle_index, self.dihed_index)
+        out, z_list, masks = self._forward(feat, rng)
+
+        if self.model_type == 'mlp_e':
+            return out * self.y_std + self.y_mean
+
+        elif self.model_type == 'mlp_eg':
+            energy = out * self.y_std + self.y_mean
+            if self.energy_only:
+                grad = np.zeros((batch, self.states, self.atoms, 3))
+            else:
+                grad = np.einsum('bsf,bfac->bsac', self._backward(z_list, masks), feat_grad) * self.grad_std
+            return [energy, grad]
+
+        elif self.model_type == 'mlp_nac':
+            # NAC of atom i is the derivative of virtual potential i to the coordinates of atom i
+            jac = self._backward(z_list, masks).reshape((batch, self.states, self.atoms, -1))
+            nac = np.einsum('bsif,bfic->bsic', jac, feat_grad)
+            return nac * self.y_std + self.y_mean
+
+        elif self.model_type == 'mlp_nac2':
+            virt = out.reshape((batch, self.states, -1))
+            nac = np.einsum('bsf,bfac->bsac', virt, feat_grad)
+            return nac * self.y_std + self.y_mean
+
+
+class NeuralNetPesNumpy:
+    """
+    Container of exported models with the same call() and predict() interface as NeuralNetPes.
+    """
+
+    def __init__(self, directory: str, mc_passes=0):
+        """
+        Initilialize empty NeuralNetPesNumpy instance.
+
+        Args:
+            directory (str): Directory of the NeuralNetPes models.
+            mc_passes (int, optional): Number of stochastic dropout passes of each NN instance with dropout for
+                                       the error estimate. The default is 0, which uses the NN instances only.
+
+        """
+        self._directory = directory
+        self._models = {}
+        self._models_type = {}
+        self._mc_passes = mc_passes
+        self._rng = np.random.default_rng()
+
+    @staticmethod
+    def exists(directory, model_name):
+        """
+        Check if a model has been exported.
+
+        Args:
+            directory (str): Directory of the NeuralNetPes models.
+            model_name (str): Model name.
+
+        Returns:
+            bool: Exported model is on file.
+
+        """
+        return os.path.exists(os.path.join(directory, model_name, NUMPY_MODEL_FILE))
+
+    def _load(self, folder, model_name):
+        fname = os.path.join(folder, model_name, NUMPY_MODEL_FILE)
+        if not os.path.exists(fname):
+            raise FileNotFoundError(f"Cannot find exported model {fname}")
+
+        with np.load(fname) as npz:
+            params = {key: npz[key] for key in npz.files}
+
+        model_type = str(params['model_type'])
+        num_nn = int(params['num_nn'])
+        self._models_type[model_name] = model_type
+        self._models[model_name] = [NumpyMLP(params, 'v%i_' % i, model_type) for i in range(num_nn)]
+
+    def load(self, model_name=None):
+        """
+        Load exported models.
+
+        Args:
+            model_name (str,list, optional): Model names on file. The default is None for all models.
+
+        Returns:
+            dict: Loaded Models.
+
+        """
+        if not os.path.exists(self._directory):
+            raise FileNotFoundError("Cannot find class directory")
+        directory = os.path.abspath(self._directory)
+
+        if isinstance(model_name, str):
+            self._load(directory, model_name)
+        elif isinstance(model_name, list):
+            for name in model_name:
+                self._load(directory, name)
+        else:
+            for name in os.listdir(directory):
+                if self.exists(directory, name):
+                    self._load(directory, name)
+
+        return self._models
+
+    @staticmethod
+    def _mean_std(out):
+        num_nn = len(out)
+        out = np.array(out)
+        out_mean = np.mean(out, axis=0)
+        if num_nn > 1:
+            out_std = np.std(out, axis=0, ddof=1)
+        else:
+            out_std = np.zeros_like(out_mean)
+        return out_mean, out_std
+
+    @staticmethod
+    def _tile_passes(x, mc_passes):
+        # Copies of the batch for the stochastic passes, each row draws its own dropout mask
+        x = np.asarray(x)
+        return np.tile(x, [mc_passes] + [1] * (x.ndim - 1))
+
+    @staticmethod
+    def _split_passes(y, mc_passes):
+        if isinstance(y, list):
+            y_split = [np.split(x, mc_passes, axis=0) for x in y]
+            return [[x[i] for x in y_split] for i in range(mc_passes)]
+        return np.split(y, mc_passes, axis=0)
+
+    def _call_models(self, name, x, features=None):
+        out = []
+        for model in self._models[name]:
+            mc = self._mc_passes > 1 and model.dropout > 0
+            rng = self._rng if mc else None
+            x_in = self._tile_passes(x, self._mc_passes) if mc else x
+            if features is not None and model.shared_features:
+                # Features are computed once per feature index set and geometry batch
+                if model.feature_key not in features:
+                    features[model.feature_key] = model.features(x)
+                feat = features[model.feature_key]
+                if mc:
+                    feat = [self._tile_passes(f, self._mc_passes) for f in feat]
+                y = model(x_in, features=feat, rng=rng)
+            else:
+                y = model(x_in, rng=rng)
+            if mc:
+                out += self._split_passes(y, self._mc_passes)
+            else:
+                out.append(y)
+        if self._models_type[name] == 'mlp_eg':
+            energy = self._mean_std([y[0] for y in out])
+            grad = self._mean_std([y[1] for y in out])
+            return [energy[0], grad[0]], [energy[1], grad[1]]
+        return self._mean_std(out)
+
+    def call(self, x):
+        """
+        Prediction for all models available. Models with the same feature index share the features and their
+        derivative, which are computed once for x.
+
+        Args:
+            x (np.array, dict): Coordinates in Angstroem of shape (batch,Atoms,3).
+                                If models require different x please provide dict matching model name.
+
+        Returns:
+            result (dict): All model predictions: {'energy_gradient' : [np.array,np.array] , 'nac' : np.array , ..}.
+            error (dict): Error estimate for each value: {'energy_gradient' : [np.array,np.array] ,
+                          'nac' : np.array , ..}.
+
+        """
+        result = {}
+        error = {}
+        features = None if isinstance(x, dict) else {}
+        for name in self._models.keys():
+            if isinstance(x, dict):
+                x_model = x[name]
+            else:
+                x_model = x
+            result[name], error[name] = self._call_models(name, x_model, features)
+
+        return result, error
+
+    def predict(self, x, batch_size=1000):
+        """
+        Prediction in batches for large data.
+
+        Args:
+            x (np.array, dict): Coordinates in Angstroem of shape (batch,Atoms,3).
+            batch_size (int): Number of geometries per batch.
+
+        Returns:
+            result (dict): All model predictions.
+            error (dict): Error estimate for each value.
+
+        """
+        if isinstance(x, dict):
+            ndata = len(list(x.values())[0])
+        else:
+            ndata = len(x)
+
+        # Stochastic passes multiply the batch
+        if self._mc_passes > 1:
+            batch_size = max(batch_size // self._mc_passes, 1)
+
+        chunks = []
+        for a in range(0, ndata, batch_size):
+            if isinstance(x, dict):
+                x_chunk = {k: v[a: a + batch_size] for k, v in x.items()}
+            else:
+                x_chunk = x[a: a + batch_size]
+            chunks.append(self.call(x_chunk))
+
+        def concat(y):
+            if isinstance(y[0], list):
+                return [np.concatenate([z[i] for z in y], axis=0) for i in range(len(y[0]))]
+            return np.concatenate(y, axis=0)
+
+        result = {name: concat([c[0][name] for c in chunks]) for name in self._models.keys()}
+        error = {name: concat([c[1][name] for c in chunks]) for name in self._models.keys()}
+        return result, error
+
+    def warmup(self):
+        """
+        Nothing to trace for numpy models.
+
+        Returns:
+            dict: Zero warmup time for each model.
+
+        """
+        return {name: 0.0 for name in self._models.keys()}
+
+    def get_trace_info(self):
+        """
+        Nothing to trace for numpy models.
+
+        Returns:
+            dict: Empty.
+
+        """
+        return {}
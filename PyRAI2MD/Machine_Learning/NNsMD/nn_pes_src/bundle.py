@@ -0,0 +1,86 @@
+"""
+Single file model bundle with a json header and memory-mapped arrays.
+
+Layout: 8 byte magic, 8 byte header length, json header, then the raw arrays each aligned to 64 bytes.
+The header holds the metadata and the dtype, shape and offset of each array.
+"""
+
+import json
+import os
+
+import numpy as np
+
+BUNDLE_MAGIC = b'PYRAIBND'
+BUNDLE_ALIGN = 64
+
+
+def _align(n):
+    return (n + BUNDLE_ALIGN - 1) // BUNDLE_ALIGN * BUNDLE_ALIGN
+
+
+def write_bundle(filepath, meta, arrays):
+    """
+    Write metadata and arrays into one file. The file is written to a temporary file first and then replaced.
+
+    Args:
+        filepath (str): Bundle file path.
+        meta (dict): Json serializable metadata.
+        arrays (dict): Dictionary of np.array.
+
+    Returns:
+        filepath (str): Bundle file path.
+
+    """
+    table = {}
+    offset = 0
+    for key, value in arrays.items():
+        value = np.asarray(value, order='C')
+        table[key] = {'dtype': value.dtype.str, 'shape': list(value.shape), 'offset': offset}
+        offset = _align(offset + value.nbytes)
+
+    header = json.dumps({'meta': meta, 'arrays': table}).encode()
+    start = _align(len(BUNDLE_MAGIC) + 8 + len(header))
+
+    tmp = filepath + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(BUNDLE_MAGIC)
+        f.write(np.array(len(header), dtype='<u8').tobytes())
+        f.write(header)
+        for key, value in arrays.items():
+            f.seek(start + table[key]['offset'])
+            f.write(np.asarray(value, order='C').tobytes())
+        f.truncate(start + offset)
+    os.replace(tmp, filepath)
+
+    return filepath
+
+
+def read_bundle(filepath):
+    """
+    Read a bundle. Arrays are read-only views into a memory map of the file.
+
+    Args:
+        filepath (str): Bundle file path.
+
+    Returns:
+        meta (dict): Metadata.
+        arrays (dict): Dictionary of np.array.
+
+    """
+    with open(filepath, 'rb') as f:
+        magic = f.read(len(BUNDLE_MAGIC))
+        if magic != BUNDLE_MAGIC:
+            raise ValueError(f"Error: Not a model bundle {filepath}")
+        length = int(np.frombuffer(f.read(8), dtype='<u8')[0])
+        header = json.loads(f.read(length).decode())
+
+    start = _align(len(BUNDLE_MAGIC) + 8 + length)
+    arrays = {}
+    if os.path.getsize(filepath) > start:
+        data = np.memmap(filepath, dtype=np.uint8, mode='r', offset=start)
+        for key, info in header['arrays'].items():
+            dtype = np.dtype(info['dtype'])
+            count = int(np.prod(info['shape']))
+            arrays[key] = np.frombuffer(data, dtype=dtype, count=count, offset=info['offset']).reshape(info['shape'])
+
+    return header['meta'], arrays
@@ -0,0 +1,159 @@
+"""
+In-process training of NN instances in threads.
+
+This is the alternative to fit.py, which starts a training script in a subprocess for each NN instance.
+Here the training functions of the same scripts are imported and run in threads of the calling process with the data
+passed directly. Tensorflow, matplotlib and the data are loaded once and the fit errors are returned directly.
+"""
+
+import contextlib
+import importlib
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import tensorflow as tf
+
+TRAINING_FUNCTIONS = {'mlp_eg': ['training_mlp_eg', 'train_model_energy_gradient'],
+                      'mlp_nac': ['training_mlp_nac', 'train_model_nac'],
+                      'mlp_nac2': ['training_mlp_nac2', 'train_model_nac'],
+                      'mlp_e': ['training_mlp_e', 'train_model_energy'],
+                      'mlp_g2': ['training_mlp_g2', 'train_model_energy_gradient']}
+
+
+def get_training_function(model_type):
+    """
+    Import the training function of a training script.
+
+    Args:
+        model_type (str): Model identifier.
+
+    Returns:
+        callable: Training function of the model type.
+
+    """
+    module, func = TRAINING_FUNCTIONS[model_type]
+    module = importlib.import_module('PyRAI2MD.Machine_Learning.NNsMD.nn_pes_src.training.' + module)
+    return getattr(module, func)
+
+
+class ThreadStream:
+    """
+    Stream that writes to the fit log of the current thread, otherwise to the original stream.
+    """
+
+    def __init__(self, stream, local):
+        """
+        Initialize the stream.
+
+        Args:
+            stream (object): Original stream, e.g. sys.stdout.
+            local (threading.local): Thread-local storage holding the log file.
+
+        """
+        self.stream = stream
+        self._local = local
+
+    def _target(self):
+        log = getattr(self._local, 'log', None)
+        return self.stream if log is None else log
+
+    def write(self, text):
+        return self._target().write(text)
+
+    def flush(self):
+        self._target().flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+class TrainingExecutor:
+    """
+    Train NN instances in a thread pool of this process.
+
+    Tasks are collected by submit() and trained together by run(). Each thread writes to the fitlog_i.txt of its
+    NN instance as the training scripts do, and runs on the GPU of its instance if available.
+    """
+
+    def __init__(self, max_workers=None):
+        """
+        Initialize an empty executor.
+
+        Args:
+            max_workers (int, optional): Number of threads. The default is None, one thread per task.
+
+        """
+        self.max_workers = max_workers
+        self._tasks = []
+        self._local = threading.local()
+
+    def submit(self, model_type, i, filepath, g, m, x, y):
+        """
+        Add a training task.
+
+        Args:
+            model_type (str): Name of the model.
+            i (int): Index of model.
+            filepath (str): Filepath to model.
+            g (int): GPU index to use.
+            m (str): Fitmode.
+            x (np.array): Coordinates.
+            y (list, np.array): Target values.
+
+        Returns:
+            None.
+
+        """
+        # Import in the calling thread, so the training threads only run the fit
+        train = get_training_function(model_type)
+        print("Run:", filepath, "Instance:", i, "on GPU:", g, m, "in-process")
+        self._tasks.append([train, int(i), filepath, int(g), m, x, y])
+
+    @staticmethod
+    def _device(g):
+        gpus = tf.config.list_logical_devices('GPU')
+        if 0 <= g < len(gpus):
+            return tf.device(gpus[g].name)
+        return contextlib.nullcontext()
+
+    def _train(self, train, i, filepath, g, m, x, y):
+        with open(os.path.join(filepath, "fitlog_" + str(i) + ".txt"), 'w') as log:
+            self._local.log = log
+            try:
+                print("Training Model: ", filepath)
+                print("Network instance: ", i)
+                with self._device(g):
+                    return train(i, filepath, m, x=x, y=y)
+            except Exception as e:
+                print("Error: In-process training failed:", e)
+                return None
+            finally:
+                self._local.log = None
+
+    def run(self):
+        """
+        Train all submitted tasks and wait for them.
+
+        Returns:
+            fit_error (dict): Validation error of each task by (filepath, index), None if the fit failed.
+
+        """
+        tasks = self._tasks
+        self._tasks = []
+        if len(tasks) == 0:
+            return {}
+
+        max_workers = self.max_workers if self.max_workers is not None else len(tasks)
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout = ThreadStream(stdout, self._local)
+        sys.stderr = ThreadStream(stderr, self._local)
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                futures = [pool.submit(self._train, *task) for task in tasks]
+                results = [f.result() for f in futures]
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+
+        return {(task[2], task[1]): result for task, result in zip(tasks, results)}
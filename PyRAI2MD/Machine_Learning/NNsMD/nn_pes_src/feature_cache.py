@@ -0,0 +1,194 @@
+"""
+On-disk cache of precomputed geometric features and their derivative for training.
+
+Features are cached for the unscaled coordinates and keyed by the feature index of the model and the content of each
+geometry, so they are shared by all NN instances, retraining with appended data and different hyperparameters.
+The scaler divides all coordinates by the same x_std, which only scales the inverse distances. The features of the
+scaled coordinates are therefore computed from the cached ones.
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+def scale_features(feat, feat_grad, n_invd, x_std):
+    """
+    Convert features of unscaled coordinates to features of coordinates scaled by (x - x_mean) / x_std.
+
+    Args:
+        feat (np.array): Features of shape (batch,features).
+        feat_grad (np.array): Derivative of shape (batch,features,atoms,3).
+        n_invd (int): Number of inverse distances, which come first in the features.
+        x_std (float, np.array): Coordinate scale of size one.
+
+    Returns:
+        feat (np.array): Scaled features, changed in place.
+        feat_grad (np.array): Derivative to the scaled coordinates, changed in place.
+
+    """
+    x_std = float(np.reshape(x_std, -1)[0])
+    scale = np.ones(feat.shape[1], dtype=feat.dtype)
+    scale[:n_invd] = x_std
+    feat *= scale
+    feat_grad *= np.reshape(scale * x_std, (1, -1, 1, 1)).astype(feat_grad.dtype)
+    return feat, feat_grad
+
+
+class FeatureCache:
+    """
+    Memory-mapped feature cache of one feature index set.
+
+    Each update appends a chunk of features, derivatives and geometry keys. The keys are written last, so a chunk
+    only becomes visible when complete. Updates are locked, so parallel training processes compute missing features
+    once.
+    """
+
+    def __init__(self, directory, feat_layer):
+        """
+        Initialize the cache in a subdirectory named by the hash of the feature index.
+
+        Args:
+            directory (str): Cache directory.
+            feat_layer (object): FeatureGeometric layer of the model.
+
+        """
+        segments = [int(x) for x in feat_layer.get_feature_type_segmentation()]
+        config = hashlib.sha1(json.dumps(segments).encode())
+        for weight in feat_layer.get_weights():
+            config.update(np.ascontiguousarray(weight, dtype=np.int64).tobytes())
+        self.n_invd = int(feat_layer.invd_shape[0]) if feat_layer.use_invdist else 0
+        self.directory = os.path.join(os.path.abspath(directory), config.hexdigest()[:16])
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, 'features.json'), 'w') as f:
+            json.dump({'segments': segments}, f)
+
+    @staticmethod
+    def geometry_keys(x):
+        """
+        Content hash of each geometry.
+
+        Args:
+            x (np.array): Coordinates of shape (batch,atoms,3).
+
+        Returns:
+            list: Hex digest for each geometry.
+
+        """
+        x = np.ascontiguousarray(x, dtype=np.float64)
+        return [hashlib.sha1(row.tobytes()).hexdigest() for row in x]
+
+    def _chunks(self):
+        return sorted([int(x[5: -4]) for x in os.listdir(self.directory) if x.startswith('keys_')])
+
+    def _path(self, name, chunk):
+        return os.path.join(self.directory, '%s_%05d.npy' % (name, chunk))
+
+    def _read_index(self):
+        index = {}
+        for chunk in self._chunks():
+            keys = np.load(self._path('keys', chunk))
+            for row, key in enumerate(keys):
+                index[str(key)] = (chunk, row)
+        return index
+
+    def _save(self, name, chunk, array):
+        tmp = self._path(name, chunk) + '.tmp'
+        with open(tmp, 'wb') as f:
+            np.save(f, array)
+        os.replace(tmp, self._path(name, chunk))
+
+    def _write_chunk(self, keys, feat, feat_grad):
+        chunks = self._chunks()
+        chunk = chunks[-1] + 1 if len(chunks) > 0 else 0
+        self._save('feat', chunk, feat)
+        self._save('grad', chunk, feat_grad)
+        self._save('keys', chunk, np.array(keys))
+        return chunk
+
+    def _lock(self):
+        lock = open(os.path.join(self.directory, 'cache.lock'), 'w')
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        return lock
+
+    def get(self, model, x, batch_size):
+        """
+        Features and derivative of unscaled coordinates. Missing geometries are computed and added to the cache.
+
+        Args:
+            model (object): Model with precompute_feature_in_chunks().
+            x (np.array): Coordinates of shape (batch,atoms,3).
+            batch_size (int): Batch size for computing features.
+
+        Returns:
+            feat (np.array): Features of shape (batch,features).
+            feat_grad (np.array): Derivative of shape (batch,features,atoms,3).
+
+        """
+        x = np.asarray(x)
+        keys = self.geometry_keys(x)
+        with self._lock():
+            index = self._read_index()
+            missing = []
+            for n, key in enumerate(keys):
+                if key not in index:
+                    index[key] = None
+                    missing.append(n)
+
+            if len(missing) > 0:
+                new_feat, new_grad = model.precompute_feature_in_chunks(x[missing], batch_size=batch_size)
+                chunk = self._write_chunk([keys[n] for n in missing], new_feat, new_grad)
+                for row, n in enumerate(missing):
+                    index[keys[n]] = (chunk, row)
+
+            print("Info: Feature cache %s reused %s, computed %s" % (
+                self.directory, len(x) - len(missing), len(missing)))
+
+            # Gather rows chunk by chunk from the memory map
+            location = np.array([index[key] for key in keys], dtype=np.int64).reshape((-1, 2))
+            feat = None
+            feat_grad = None
+            for chunk in np.unique(location[:, 0]):
+                pos = np.where(location[:, 0] == chunk)[0]
+                chunk_feat = np.load(self._path('feat', chunk), mmap_mode='r')
+                chunk_grad = np.load(self._path('grad', chunk), mmap_mode='r')
+                if feat is None:
+                    feat = np.empty((len(x),) + chunk_feat.shape[1:], dtype=chunk_feat.dtype)
+                    feat_grad = np.empty((len(x),) + chunk_grad.shape[1:], dtype=chunk_grad.dtype)
+                feat[pos] = chunk_feat[location[pos, 1]]
+                feat_grad[pos] = chunk_grad[location[pos, 1]]
+
+        return feat, feat_grad
+
+
+def precompute_features(model, x, x_rescale, x_std, batch_size, cache_dir=''):
+    """
+    Features and derivative of the scaled coordinates for training, taken from the feature cache if set.
+
+    Args:
+        model (object): Model with feat_layer and precompute_feature_in_chunks().
+        x (np.array): Unscaled coordinates of shape (batch,atoms,3).
+        x_rescale (np.array): Scaled coordinates of shape (batch,atoms,3).
+        x_std (np.array): Coordinate scale of the scaler.
+        batch_size (int): Batch size for computing features.
+        cache_dir (str, optional): Cache directory. The default is '', which disables the cache.
+
+    Returns:
+        feat (np.array): Features of shape (batch,features).
+        feat_grad (np.array): Derivative of shape (batch,features,atoms,3).
+
+    """
+    if not cache_dir or np.size(x_std) != 1:
+        return model.precompute_feature_in_chunks(x_rescale, batch_size=batch_size)
+
+    cache = FeatureCache(cache_dir, model.feat_layer)
+    feat, feat_grad = cache.get(model, x, batch_size)
+    return scale_features(feat, feat_grad, cache.n_invd, x_std)
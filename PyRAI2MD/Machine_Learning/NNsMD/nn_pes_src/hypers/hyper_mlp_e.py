@@ -10,6 +10,8 @@ DEFAULT_HYPER_PARAM_ENERGY = {
             'main_dir': '',  # not used atm
             'model_dir': '',  # not used atm
             'info': '',  # not used atm
+            'feature_cache': '',  # directory to share precomputed features, empty to disable
+            'keep_normalization': False,  # keep the scaler and feature normalization of the old weights when retraining
             'pyNN_version': "1.0.2"  # not used atm
         },
     'model':  # Model Parameters   # fixes model, cannot be changed after init
@@ -10,6 +10,12 @@ DEFAULT_HYPER_PARAM_ENERGY_GRADS = {
             'main_dir': '',  # not used atm
             'model_dir': '',  # not used atm
             'info': '',  # not used atm
+            'feature_cache': '',  # directory to share precomputed features, empty to disable
+            'keep_normalization': False,  # keep the scaler and feature normalization of the old weights when retraining
+            'stream': False,  # stream batches from chunks on disk instead of loading all data
+            'chunk_size': 4096,  # number of samples per chunk if streamed
+            'shuffle_buffer': 16384,  # number of samples shuffled together if streamed
+            'permute_map': '',  # permutation map applied on the fly if streamed, empty for none
             'pyNN_version': "1.0.2"  # not used atm
         },
     'model':  # Model Parameters   # fixes model, cannot be changed after init
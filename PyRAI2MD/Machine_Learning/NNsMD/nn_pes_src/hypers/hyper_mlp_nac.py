@@ -9,6 +9,8 @@ DEFAULT_HYPER_PARAM_NAC = {
             'main_dir': '',
             'model_dir': '',
             'info': '',
+            'feature_cache': '',  # directory to share precomputed features, empty to disable
+            'keep_normalization': False,  # keep the scaler and feature normalization of the old weights when retraining
             'pyNN_version': "1.0.2"  # not used atm
         },
     'model':  # Model Parameters # fixed model, cannot be changed after init
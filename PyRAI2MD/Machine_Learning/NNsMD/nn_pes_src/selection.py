@@ -4,6 +4,7 @@ Model selection
 import os
 import copy
 import numpy as np
+import tensorflow as tf
 
 from PyRAI2MD.Machine_Learning.NNsMD.models.mlp_e import EnergyModel
 from PyRAI2MD.Machine_Learning.NNsMD.models.mlp_eg import EnergyGradientModel
@@ -138,6 +139,78 @@ def predict_uncertainty(model_type, out, mult_nn):
         return out_mean, out_std
 
 
+def get_scaler_as_tensor(scaler, dtype=tf.float32):
+    """
+    Copy a scaler with its parameters as constants, so that transform and inverse_transform run in a graph.
+
+    Args:
+        scaler (object): Scaler with numpy parameters.
+        dtype (tf.dtype, optional): Type of the constants. The default is tf.float32.
+
+    Returns:
+        object: Scaler copy with tf.constant parameters.
+
+    """
+    scaler_tf = copy.copy(scaler)
+    for key, value in vars(scaler).items():
+        if key.startswith('_'):
+            continue
+        if isinstance(value, (np.ndarray, np.floating)):
+            setattr(scaler_tf, key, tf.constant(value, dtype=dtype))
+    return scaler_tf
+
+
+def cast_output(y, dtype=tf.float64):
+    """
+    Cast the output of a model, a tf.tensor or a list of tf.tensor.
+
+    Args:
+        y (tf.tensor, list): Model output.
+        dtype (tf.dtype, optional): Target type. The default is tf.float64.
+
+    Returns:
+        tf.tensor, list: Model output of the target type.
+
+    """
+    if isinstance(y, (list, tuple)):
+        return [tf.cast(x, dtype) for x in y]
+    return tf.cast(y, dtype)
+
+
+def fused_uncertainty(out, mult_nn):
+    """
+    Mean and standard deviation of the member predictions as tensor operations, same as predict_uncertainty.
+
+    Args:
+        out (list): List of member predictions, each a tf.tensor or list of tf.tensor.
+        mult_nn (int): Number of members.
+
+    Returns:
+        out_mean (tf.tensor, list): Mean prediction.
+        out_std (tf.tensor, list): Standard deviation with ddof=1, zero for a single member.
+
+    """
+    def reduce_members(y_list):
+        y = tf.stack(y_list, axis=0)
+        y_mean = tf.reduce_mean(y, axis=0)
+        if mult_nn > 1:
+            y_std = tf.sqrt(tf.reduce_sum(tf.square(y - y_mean), axis=0) / (mult_nn - 1))
+        else:
+            y_std = tf.zeros_like(y_mean)
+        return y_mean, y_std
+
+    if isinstance(out[0], (list, tuple)):
+        out_mean = []
+        out_std = []
+        for i in range(len(out[0])):
+            y_mean, y_std = reduce_members([x[i] for x in out])
+            out_mean.append(y_mean)
+            out_std.append(y_std)
+        return out_mean, out_std
+    else:
+        return reduce_members(out)
+
+
 def unpack_convert_y_to_numpy(model_type, temp):
     if isinstance(temp, list):
         return [x.numpy() for x in temp]
@@ -0,0 +1,302 @@
+"""
+Compiled inference session for a model ensemble.
+"""
+
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from PyRAI2MD.Machine_Learning.NNsMD.nn_pes_src.selection import cast_output
+from PyRAI2MD.Machine_Learning.NNsMD.nn_pes_src.selection import fused_uncertainty
+from PyRAI2MD.Machine_Learning.NNsMD.nn_pes_src.selection import get_scaler_as_tensor
+
+
+def use_mc_passes(model, mc_passes):
+    """
+    Check if a model runs stochastic dropout passes.
+
+    Args:
+        model (tf.keras.Model): Model of the ensemble.
+        mc_passes (int): Number of stochastic passes.
+
+    Returns:
+        bool: Model has dropout and more than one pass is requested.
+
+    """
+    return mc_passes > 1 and bool(getattr(model, 'use_dropout', False))
+
+
+def tile_passes(x, mc_passes):
+    """
+    Stack copies of the input along the batch, dropout draws an independent mask for each row.
+
+    Args:
+        x (tf.tensor): Input of shape (batch,...).
+        mc_passes (int): Number of stochastic passes.
+
+    Returns:
+        tf.tensor: Input of shape (mc_passes*batch,...).
+
+    """
+    return tf.tile(x, [mc_passes] + [1] * (len(x.shape) - 1))
+
+
+def split_passes(y, mc_passes):
+    """
+    Split the output of tiled inputs into the stochastic passes.
+
+    Args:
+        y (tf.tensor, list): Output of shape (mc_passes*batch,...) or list of them.
+        mc_passes (int): Number of stochastic passes.
+
+    Returns:
+        list: Output of each pass, same format as y.
+
+    """
+    if isinstance(y, (list, tuple)):
+        y_split = [tf.split(x, mc_passes, axis=0) for x in y]
+        return [[x[i] for x in y_split] for i in range(mc_passes)]
+    return tf.split(y, mc_passes, axis=0)
+
+
+class InferenceSession:
+    """
+    Inference of all NN instances of a model in one graph with a pinned input signature.
+
+    The input signature has a dynamic batch dimension and a fixed number of atoms, so the graph is traced
+    once for single geometries and batches alike. Tracing is counted to make retracing visible.
+    The outputs are scaled back and reduced to mean and std in float64, as the unfused call does in NumPy, since
+    absolute energies lose the differences between the NN instances in float32.
+    With mc_passes, every NN instance with dropout runs the passes as one tiled batch with dropout active and
+    each pass counts as a member of the ensemble.
+    """
+
+    def __init__(self, model_list, scaler_list, atoms, mc_passes=0):
+        """
+        Initialize the session. The graph is traced on the first call or by warmup().
+
+        Args:
+            model_list (list): List of tf.keras models of the ensemble.
+            scaler_list (list): List of scaler of the ensemble.
+            atoms (int): Number of atoms.
+            mc_passes (int, optional): Number of stochastic dropout passes per NN instance. The default is 0.
+
+        """
+        self.atoms = int(atoms)
+        self.num_nn = len(model_list)
+        self.mc_passes = int(mc_passes)
+        self.num_trace = 0
+        self.num_call = 0
+        self.warmup_time = 0.0
+
+        self._model_list = model_list
+        self._scaler_list = [get_scaler_as_tensor(x) for x in scaler_list]
+        self._inverse_scaler_list = [get_scaler_as_tensor(x, tf.float64) for x in scaler_list]
+        self._graph = tf.function(self._fused_call,
+                                  input_signature=[tf.TensorSpec(shape=(None, self.atoms, 3), dtype=tf.float32)])
+
+    def _fused_call(self, x):
+        # Python code only runs while tracing
+        self.num_trace += 1
+        out = []
+        for i in range(self.num_nn):
+            mc = use_mc_passes(self._model_list[i], self.mc_passes)
+            x_in = tile_passes(x, self.mc_passes) if mc else x
+            x_scaled = self._scaler_list[i].transform(x=x_in)[0]
+            y_scaled = self._model_list[i](x_scaled, training=mc)
+            y = self._inverse_scaler_list[i].inverse_transform(y=cast_output(y_scaled))[1]
+            if mc:
+                out += split_passes(y, self.mc_passes)
+            else:
+                out.append(y)
+        return fused_uncertainty(out, len(out))
+
+    def __call__(self, x):
+        """
+        Predict mean and standard deviation of the ensemble.
+
+        Args:
+            x (np.array): Coordinates of shape (batch,atoms,3).
+
+        Returns:
+            out_mean (tf.tensor, list): Mean prediction.
+            out_std (tf.tensor, list): Standard deviation.
+
+        """
+        self.num_call += 1
+        return self._graph(tf.convert_to_tensor(x, dtype=tf.float32))
+
+    def warmup(self):
+        """
+        Trace the graph with a dummy geometry so the first real call does not pay for tracing.
+
+        Returns:
+            float: Warmup time in seconds.
+
+        """
+        start = time.time()
+        # Distinct points avoid zero distances in the features
+        x = np.arange(self.atoms * 3, dtype=np.float32).reshape((1, self.atoms, 3))
+        self._graph(tf.convert_to_tensor(x, dtype=tf.float32))
+        self.warmup_time = time.time() - start
+        return self.warmup_time
+
+    def retrace(self):
+        """
+        Number of traces beyond the first one.
+
+        Returns:
+            int: Number of retraces.
+
+        """
+        return max(self.num_trace - 1, 0)
+
+
+class SharedFeatureSession:
+    """
+    Inference of all models in one graph, with the geometric features and their derivative computed once.
+
+    The features are computed from the unscaled coordinates for each distinct feature index set. The scalers shift
+    and divide all coordinates by the same x_mean and x_std, so only the inverse distances change with scaling and
+    the features of each model follow from the shared ones. Models then run on these precomputed features.
+    Models that cannot take precomputed features are called with coordinates in the same graph.
+    Stochastic dropout passes tile the shared features instead of computing them again.
+    The outputs are scaled back and reduced to mean and std in float64, as in InferenceSession.
+    """
+
+    def __init__(self, model_dict, scaler_dict, type_dict, atoms, mc_passes=0):
+        """
+        Initialize the session. The graph is traced on the first call or by warmup().
+
+        Args:
+            model_dict (dict): Lists of tf.keras models for each model name.
+            scaler_dict (dict): Lists of scaler for each model name.
+            type_dict (dict): Model type for each model name.
+            atoms (int): Number of atoms.
+            mc_passes (int, optional): Number of stochastic dropout passes per NN instance. The default is 0.
+
+        """
+        self.atoms = int(atoms)
+        self.mc_passes = int(mc_passes)
+        self.num_trace = 0
+        self.num_call = 0
+        self.warmup_time = 0.0
+
+        self._model_dict = model_dict
+        self._scaler_dict = {name: [get_scaler_as_tensor(x) for x in scaler_list]
+                             for name, scaler_list in scaler_dict.items()}
+        self._inverse_scaler_dict = {name: [get_scaler_as_tensor(x, tf.float64) for x in scaler_list]
+                                     for name, scaler_list in scaler_dict.items()}
+        self._feature_key = {}
+        for name, model_list in model_dict.items():
+            self._feature_key[name] = [self._get_feature_key(x, y, type_dict[name])
+                                       for x, y in zip(model_list, scaler_dict[name])]
+        self._graph = tf.function(self._shared_call,
+                                  input_signature=[tf.TensorSpec(shape=(None, self.atoms, 3), dtype=tf.float32)])
+
+    @staticmethod
+    def _get_feature_key(model, scaler, model_type):
+        # Models with the same index weights in the feature layer compute the same features
+        if np.size(scaler.x_std) != 1 or np.size(scaler.x_mean) != 1:
+            return None
+        if model_type == 'mlp_e' and not model.energy_only:
+            return None
+        feat_layer = model.feat_layer
+        return tuple(feat_layer.get_feature_type_segmentation()) + tuple(
+            np.array(x).tobytes() for x in feat_layer.get_weights())
+
+    @staticmethod
+    def _features(model, x):
+        with tf.GradientTape() as tape:
+            tape.watch(x)
+            feat = model.feat_layer(x)
+        return feat, tape.batch_jacobian(feat, x)
+
+    @staticmethod
+    def _scale_features(model, scaler, feat, feat_grad):
+        # Inverse distances scale with x_std, angles and dihedrals are invariant
+        x_std = tf.reshape(scaler.x_std, [])
+        feat_layer = model.feat_layer
+        n_invd = feat_layer.invd_shape[0] if feat_layer.use_invdist else 0
+        scale = tf.concat([tf.fill([n_invd], x_std), tf.ones([feat.shape[-1] - n_invd])], axis=0)
+        return feat * scale, feat_grad * tf.reshape(scale * x_std, (1, -1, 1, 1))
+
+    @staticmethod
+    def _call_precomputed(model, feat, feat_grad, training=False):
+        # The switch is only read while tracing
+        model.precomputed_features = True
+        try:
+            y = model([feat, feat_grad], training=training)
+        finally:
+            model.precomputed_features = False
+        return y
+
+    def _shared_call(self, x):
+        # Python code only runs while tracing
+        self.num_trace += 1
+        features = {}
+        out_dict = {}
+        for name, model_list in self._model_dict.items():
+            out = []
+            for i, model in enumerate(model_list):
+                scaler = self._scaler_dict[name][i]
+                key = self._feature_key[name][i]
+                mc = use_mc_passes(model, self.mc_passes)
+                if key is None:
+                    x_in = tile_passes(x, self.mc_passes) if mc else x
+                    y_scaled = model(scaler.transform(x=x_in)[0], training=mc)
+                else:
+                    if key not in features:
+                        features[key] = self._features(model, x)
+                    feat, feat_grad = self._scale_features(model, scaler, *features[key])
+                    if mc:
+                        feat = tile_passes(feat, self.mc_passes)
+                        feat_grad = tile_passes(feat_grad, self.mc_passes)
+                    y_scaled = self._call_precomputed(model, feat, feat_grad, training=mc)
+                y = self._inverse_scaler_dict[name][i].inverse_transform(y=cast_output(y_scaled))[1]
+                if mc:
+                    out += split_passes(y, self.mc_passes)
+                else:
+                    out.append(y)
+            out_dict[name] = fused_uncertainty(out, len(out))
+        return out_dict
+
+    def __call__(self, x):
+        """
+        Predict mean and standard deviation of all models.
+
+        Args:
+            x (np.array): Coordinates of shape (batch,atoms,3).
+
+        Returns:
+            out_dict (dict): Mean prediction and standard deviation for each model name.
+
+        """
+        self.num_call += 1
+        return self._graph(tf.convert_to_tensor(x, dtype=tf.float32))
+
+    def warmup(self):
+        """
+        Trace the graph with a dummy geometry so the first real call does not pay for tracing.
+
+        Returns:
+            float: Warmup time in seconds.
+
+        """
+        start = time.time()
+        # Distinct points avoid zero distances in the features
+        x = np.arange(self.atoms * 3, dtype=np.float32).reshape((1, self.atoms, 3))
+        self._graph(tf.convert_to_tensor(x, dtype=tf.float32))
+        self.warmup_time = time.time() - start
+        return self.warmup_time
+
+    def retrace(self):
+        """
+        Number of traces beyond the first one.
+
+        Returns:
+            int: Number of retraces.
+
+        """
+        return max(self.num_trace - 1, 0)
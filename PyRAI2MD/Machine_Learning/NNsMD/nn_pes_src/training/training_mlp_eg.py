@@ -20,36 +20,28 @@ parser.add_argument("-i", "--index", required=True, help="Index of the NN to tra
 parser.add_argument("-f", "--filepath", required=True, help="Filepath to weights, hyperparameter, data etc. ")
 parser.add_argument("-g", "--gpus", default=-1, required=True, help="Index of gpu to use")
 parser.add_argument("-m", "--mode", default="training", required=True, help="Which mode to use train or retrain")
-args = vars(parser.parse_args())
 # args = {"filepath":"E:/Benutzer/Patrick/PostDoc/Projects ML/NeuralNet4/NNfit0/energy_gradient_0",'index' : 0,"gpus":0}
 
-
-fstdout = open(os.path.join(args['filepath'], "fitlog_" + str(args['index']) + ".txt"), 'w')
-sys.stderr = fstdout
-sys.stdout = fstdout
-
-print("Input argpars:", args)
-
 from PyRAI2MD.Machine_Learning.NNsMD.nn_pes_src.device import set_gpu
 
-set_gpu([int(args['gpus'])])
-print("Logic Devices:", tf.config.experimental.list_logical_devices('GPU'))
-
 from PyRAI2MD.Machine_Learning.NNsMD.utils.callbacks import EarlyStopping, lr_lin_reduction, lr_exp_reduction, lr_step_reduction
 from PyRAI2MD.Machine_Learning.NNsMD.models.mlp_eg import EnergyGradientModel
 # from PyRAI2MD.Machine_Learning.NNsMD.nn_pes_src.legacy import compute_feature_derivative
 from PyRAI2MD.Machine_Learning.NNsMD.datasets.general import load_hyp
 from PyRAI2MD.Machine_Learning.NNsMD.datasets.general import split_validation_training_index
+from PyRAI2MD.Machine_Learning.NNsMD.datasets.stream import STREAM_DIR, ChunkedData, load_permutations, stream_batches
+from PyRAI2MD.Machine_Learning.NNsMD.datasets.stream import make_tf_dataset, set_normalization_from_stream
 # from PyRAI2MD.Machine_Learning.NNsMD.nn_pes_src.scaler import save_std_scaler_dict
 from PyRAI2MD.Machine_Learning.NNsMD.scaler.energy import EnergyGradientStandardScaler
 from PyRAI2MD.Machine_Learning.NNsMD.scaler.general import SegmentStandardScaler
+from PyRAI2MD.Machine_Learning.NNsMD.nn_pes_src.feature_cache import precompute_features
 from PyRAI2MD.Machine_Learning.NNsMD.utils.loss import get_lr_metric, ScaledMeanAbsoluteError, r2_metric, ZeroEmptyLoss
 from PyRAI2MD.Machine_Learning.NNsMD.plots.loss import plot_loss_curves, plot_learning_curve
 from PyRAI2MD.Machine_Learning.NNsMD.plots.pred import plot_scatter_prediction
 from PyRAI2MD.Machine_Learning.NNsMD.plots.error import plot_error_vec_mean, plot_error_vec_max
 
 
-def train_model_energy_gradient(i=0, outdir=None, mode='training'):
+def train_model_energy_gradient(i=0, outdir=None, mode='training', x=None, y=None):
     """
     Train an energy plus gradient model. Uses precomputed feature and model representation.
 
@@ -57,6 +49,8 @@ def train_model_energy_gradient(i=0, outdir=None, mode='training'):
         i (int, optional): Model index. The default is 0.
         outdir (str, optional): Direcotry for fit output. The default is None.
         mode (str, optional): Fitmode to take from hyperparameters. The default is 'training'.
+        x (np.array, optional): Coordinates, if trained in-process. The default is None, read from folder.
+        y (list, np.array, optional): Target values, if trained in-process. The default is None, read from folder.
 
     Raises:
         ValueError: Wrong input shape.
@@ -66,15 +60,21 @@ def train_model_energy_gradient(i=0, outdir=None, mode='training'):
 
     """
     i = int(i)
-    # Load everything from folder
-    try:
-        with open(os.path.join(outdir, 'data_y'), 'rb') as f:
-            y = pickle.load(f)
-        with open(os.path.join(outdir, 'data_x'), 'rb') as f:
-            x = pickle.load(f)
-    except:
-        print("Error: Can not load data for fit", outdir)
-        return
+    # Stream batches from the chunked dataset if set
+    hyper_file = os.path.join(outdir, 'hyper' + '_v%i' % i + ".json")
+    if os.path.exists(hyper_file) and load_hyp(hyper_file)['general'].get('stream', False):
+        return train_model_energy_gradient_stream(i, outdir, mode, x=x, y=y)
+
+    # Load everything from folder, unless the data is passed in-process
+    if x is None or y is None:
+        try:
+            with open(os.path.join(outdir, 'data_y'), 'rb') as f:
+                y = pickle.load(f)
+            with open(os.path.join(outdir, 'data_x'), 'rb') as f:
+                x = pickle.load(f)
+        except:
+            print("Error: Can not load data for fit", outdir)
+            return
     hyperall = None
     try:
         hyperall = load_hyp(os.path.join(outdir, 'hyper' + '_v%i' % i + ".json"))
@@ -167,6 +167,10 @@ def train_model_energy_gradient(i=0, outdir=None, mode='training'):
         try:
             out_model.load_weights(os.path.join(outdir, "weights" + '_v%i' % i + '.h5'))
             print("Info: Load old weights at:", os.path.join(outdir, "weights" + '_v%i' % i + '.h5'))
+            # Fine-tuning keeps the scaler and feature normalization the old weights were trained with
+            if hyperall['general'].get('keep_normalization', False):
+                scaler.load(os.path.join(outdir, 'scaler' + '_v%i' % i + ".json"))
+                out_model.keep_normalization = True
             print("Info: Transferring weights...")
         except:
             print("Error: Can't load old weights...")
@@ -174,14 +178,19 @@ def train_model_energy_gradient(i=0, outdir=None, mode='training'):
         print("Info: Making new initialized weights.")
 
     # Scale x,y
-    scaler.fit(x, y, auto_scale=auto_scale)
+    if not out_model.keep_normalization:
+        scaler.fit(x, y, auto_scale=auto_scale)
     x_rescale, y_rescale = scaler.transform(x, y)
     y1, y2 = y_rescale
 
-    # Model + Model precompute layer +feat
-    feat_x, feat_grad = out_model.precompute_feature_in_chunks(x_rescale, batch_size=batch_size)
+    # Model + Model precompute layer +feat, reused from the feature cache if set
+    feat_x, feat_grad = precompute_features(out_model, x, x_rescale, scaler.x_std, batch_size,
+                                            hyperall['general'].get('feature_cache', ''))
     # Finding Normalization
-    feat_x_mean, feat_x_std = out_model.set_const_normalization_from_features(feat_x,normalization_mode=normalize_feat)
+    if out_model.keep_normalization:
+        feat_x_mean, feat_x_std = out_model.get_layer('feat_std').get_weights()
+    else:
+        feat_x_mean, feat_x_std = out_model.set_const_normalization_from_features(feat_x,normalization_mode=normalize_feat)
 
     # Train Test split
     xtrain = [feat_x[i_train], feat_grad[i_train]]
@@ -316,9 +325,243 @@ def train_model_energy_gradient(i=0, outdir=None, mode='training'):
     return error_val
 
 
+def _stream_mean_absolute_error(model, scaler, data, indices, batch_size, permutations):
+    # Mean absolute error of energy and gradient accumulated batch by batch
+    err_sum = [0.0, 0.0]
+    err_count = [0, 0]
+    for x, y in stream_batches(data, indices, batch_size, permutations):
+        x_rescale = scaler.transform(x=x)[0]
+        pred = model(tf.convert_to_tensor(x_rescale, dtype=tf.float32), training=False)
+        _, pred = scaler.inverse_transform(y=[pred['energy'].numpy(), pred['force'].numpy()])
+        for k in range(2):
+            err_sum[k] += np.sum(np.abs(pred[k] - y[k]))
+            err_count[k] += np.size(y[k])
+    return [err_sum[k] / max(err_count[k], 1) for k in range(2)]
+
+
+def train_model_energy_gradient_stream(i=0, outdir=None, mode='training', x=None, y=None):
+    """
+    Train an energy plus gradient model on batches streamed from the chunked dataset in the model folder.
+
+    The scaler and feature normalization are fitted in a single pass. Batches are shuffled in a buffer, permuted by
+    the permutation map on the fly and scaled before they are fed to the model, which computes the features itself.
+
+    Args:
+        i (int, optional): Model index. The default is 0.
+        outdir (str, optional): Direcotry for fit output. The default is None.
+        mode (str, optional): Fitmode to take from hyperparameters. The default is 'training'.
+        x (np.array, optional): Coordinates, if trained in-process. The default is None, read from folder.
+        y (list, np.array, optional): Target values, if trained in-process. The default is None, read from folder.
+
+    Returns:
+        error_val (list): Validation error for (energy,gradient).
+
+    """
+    i = int(i)
+    hyperall = None
+    try:
+        hyperall = load_hyp(os.path.join(outdir, 'hyper' + '_v%i' % i + ".json"))
+    except:
+        print("Error: Can not load hyper for fit", outdir)
+
+    # Data stays on disk, unless it is passed in-process
+    try:
+        if x is None or y is None:
+            data = ChunkedData(os.path.join(outdir, STREAM_DIR))
+        else:
+            data = ChunkedData(x=x, y=y)
+    except:
+        print("Error: Can not load data for fit", outdir)
+        return
+
+    # Model
+    hypermodel = hyperall['model']
+    # plots
+    unit_label_energy = hyperall['plots']['unit_energy']
+    # Stream
+    general = hyperall['general']
+    shuffle_buffer = general.get('shuffle_buffer', 16384)
+    permutations = load_permutations(general.get('permute_map', ''), hypermodel['atoms'])
+    # Fit
+    hyper = hyperall[mode]
+    energies_only = hyper['energy_only']
+    epo = hyper['epo']
+    batch_size = hyper['batch_size']
+    epostep = hyper['epostep']
+    val_disjoint = hyper['val_disjoint']
+    val_split = hyper['val_split']
+    initialize_weights = hyper['initialize_weights']
+    learning_rate = hyper['learning_rate']
+    loss_weights = hyper['loss_weights']
+    auto_scale = hyper['auto_scaling']
+    normalize_feat = int(hyper['normalization_mode'])
+    # step
+    use_step_callback = hyper['step_callback']
+    use_linear_callback = hyper['linear_callback']
+    use_exp_callback = hyper['exp_callback']
+    use_early_callback = hyper['early_callback']
+
+    print("Found %s samples in %s chunks with %s permutations" % (len(data), len(data.sizes), len(permutations)))
+
+    # Fit stats dir
+    dir_save = os.path.join(outdir, "fit_stats")
+    os.makedirs(dir_save, exist_ok=True)
+
+    # cbks,Learning rate schedule
+    cbks = []
+    if use_early_callback['use']:
+        es_cbk = EarlyStopping(**use_early_callback)
+        cbks.append(es_cbk)
+    if use_linear_callback['use']:
+        lr_sched = lr_lin_reduction(**use_linear_callback)
+        lr_cbk = tf.keras.callbacks.LearningRateScheduler(lr_sched)
+        cbks.append(lr_cbk)
+    if use_exp_callback['use']:
+        lr_exp = lr_exp_reduction(**use_exp_callback)
+        exp_cbk = tf.keras.callbacks.LearningRateScheduler(lr_exp)
+        cbks.append(exp_cbk)
+    if use_step_callback['use']:
+        lr_step = lr_step_reduction(**use_step_callback)
+        step_cbk = tf.keras.callbacks.LearningRateScheduler(lr_step)
+        cbks.append(step_cbk)
+
+    # Index train test split, permuted copies stay in the split of their original
+    lval = int(len(data) * val_split)
+    allind = np.arange(0, len(data))
+    i_train, i_val = split_validation_training_index(allind, lval, val_disjoint, i)
+    print("Info: Train-Test split at Train:", len(i_train), "Test", len(i_val), "Total", len(data))
+
+    # Make all Model, features are computed from coordinates in the model
+    scaler = EnergyGradientStandardScaler()
+    out_model = EnergyGradientModel(**hypermodel)
+    out_model.precomputed_features = False
+    out_model.output_as_dict = True
+    out_model.energy_only = energies_only
+
+    # Look for loading weights
+    if not initialize_weights:
+        try:
+            out_model.load_weights(os.path.join(outdir, "weights" + '_v%i' % i + '.h5'))
+            print("Info: Load old weights at:", os.path.join(outdir, "weights" + '_v%i' % i + '.h5'))
+            # Fine-tuning keeps the scaler and feature normalization the old weights were trained with
+            if hyperall['general'].get('keep_normalization', False):
+                scaler.load(os.path.join(outdir, 'scaler' + '_v%i' % i + ".json"))
+                out_model.keep_normalization = True
+            print("Info: Transferring weights...")
+        except:
+            print("Error: Can't load old weights...")
+    else:
+        print("Info: Making new initialized weights.")
+
+    # Scale x,y in one pass, permutations change neither mean nor std
+    if not out_model.keep_normalization:
+        scaler.fit_stream(data.iter_chunks(), auto_scale=auto_scale)
+
+    def transform(xb, yb):
+        xs, ys = scaler.transform(xb, yb)
+        return xs.astype(np.float32), {'energy': ys[0].astype(np.float32), 'force': ys[1].astype(np.float32)}
+
+    # Finding Normalization of all features, the same samples as the scaler and the in-memory fit
+    if out_model.keep_normalization:
+        feat_x_mean, feat_x_std = out_model.get_layer('feat_std').get_weights()
+    else:
+        feat_x_mean, feat_x_std = set_normalization_from_stream(
+            out_model, (scaler.transform(x=xb)[0] for xb, _ in stream_batches(data, allind, batch_size)),
+            normalization_mode=normalize_feat)
+
+    train_data = make_tf_dataset(data, i_train, batch_size, transform, permutations, shuffle_buffer, seed=i)
+    val_data = make_tf_dataset(data, i_val, batch_size, transform, permutations)
+
+    optimizer = tf.keras.optimizers.Adam(lr=learning_rate)
+    lr_metric = get_lr_metric(optimizer)
+    mae_energy = ScaledMeanAbsoluteError(scaling_shape=scaler.energy_std.shape)
+    mae_force = ScaledMeanAbsoluteError(scaling_shape=scaler.gradient_std.shape)
+    mae_energy.set_scale(scaler.energy_std)
+    mae_force.set_scale(scaler.gradient_std)
+    if energies_only:
+        train_loss = {'energy': 'mean_squared_error', 'force' : ZeroEmptyLoss()}
+    else:
+        train_loss = {'energy': 'mean_squared_error', 'force': 'mean_squared_error'}
+    out_model.compile(optimizer=optimizer,
+                      loss=train_loss, loss_weights=loss_weights,
+                      metrics={'energy': [mae_energy, lr_metric, r2_metric],
+                               'force': [mae_force, lr_metric, r2_metric]})
+
+    scaler.print_params_info()
+    print("Info: Using feature-scale", feat_x_std.shape, ":", feat_x_std)
+    print("Info: Using feature-offset", feat_x_mean.shape, ":", feat_x_mean)
+
+    print("")
+    print("Start fit.")
+    out_model.summary()
+    hist = out_model.fit(x=train_data, epochs=epo, callbacks=cbks, validation_freq=epostep,
+                         validation_data=val_data, verbose=2)
+    print("End fit.")
+    print("")
+    out_model.energy_only = False
+
+    try:
+        outname = os.path.join(dir_save, "history_" + ".json")
+        outhist = {a: np.array(b, dtype=np.float64).tolist() for a, b in hist.history.items()}
+        with open(outname, 'w') as f:
+            json.dump(outhist, f)
+    except:
+        print("Warning: Cant save history")
+
+    try:
+        out_model.save_weights(os.path.join(outdir, "weights" + '_v%i' % i + '.h5'))
+    except:
+        print("Warning: Cant save weights")
+
+    try:
+        print("Info: Saving auto-scaler to file...")
+        scaler.save(os.path.join(outdir, "scaler" + '_v%i' % i + '.json'))
+    except:
+        print("Error: Can not export scaler info. Model prediciton will be wrongly scaled.")
+
+    try:
+        # Prediction plots need the full data, only plot the loss
+        print("Info: Plot fit stats...")
+        plot_loss_curves([hist.history['energy_mean_absolute_error'], hist.history['force_mean_absolute_error']],
+                         [hist.history['val_energy_mean_absolute_error'],
+                          hist.history['val_force_mean_absolute_error']],
+                         label_curves=["energy", "force"],
+                         val_step=epostep, save_plot_to_file=True, dir_save=dir_save,
+                         filename='fit' + str(i), filetypeout='.png', unit_loss=unit_label_energy, loss_name="MAE",
+                         plot_title="Energy")
+
+        plot_learning_curve(hist.history['energy_lr'], filename='fit' + str(i), dir_save=dir_save)
+    except:
+        print("Error: Could not plot fitting stats")
+
+    error_val = None
+    try:
+        # Safe fitting Error MAE
+        error_val = _stream_mean_absolute_error(out_model, scaler, data, i_val, batch_size, permutations)
+        error_train = _stream_mean_absolute_error(out_model, scaler, data, i_train, batch_size, permutations)
+        np.save(os.path.join(outdir, "fiterr_valid" + '_v%i' % i + ".npy"), error_val)
+        np.save(os.path.join(outdir, "fiterr_train" + '_v%i' % i + ".npy"), error_train)
+        print("error_val:", error_val)
+        print("error_train:", error_train)
+    except:
+        print("Error: Can not save fiterror")
+
+    return error_val
+
+
 if __name__ == "__main__":
+    args = vars(parser.parse_args())
+
+    fstdout = open(os.path.join(args['filepath'], "fitlog_" + str(args['index']) + ".txt"), 'w')
+    sys.stderr = fstdout
+    sys.stdout = fstdout
+
+    print("Input argpars:", args)
+
+    set_gpu([int(args['gpus'])])
+    print("Logic Devices:", tf.config.experimental.list_logical_devices('GPU'))
+
     print("Training Model: ", args['filepath'])
     print("Network instance: ", args['index'])
     out = train_model_energy_gradient(args['index'], args['filepath'], args['mode'])
-
-fstdout.close()
+    fstdout.close()
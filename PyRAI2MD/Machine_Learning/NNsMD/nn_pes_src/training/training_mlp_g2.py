@@ -20,21 +20,10 @@ parser.add_argument("-i", "--index", required=True, help="Index of the NN to tra
 parser.add_argument("-f", "--filepath", required=True, help="Filepath to weights, hyperparameter, data etc. ")
 parser.add_argument("-g", "--gpus", default=-1, required=True, help="Index of gpu to use")
 parser.add_argument("-m", "--mode", default="training", required=True, help="Which mode to use train or retrain")
-args = vars(parser.parse_args())
 # args = {"filepath":"E:/Benutzer/Patrick/PostDoc/Projects ML/NeuralNet4/NNfit0/energy_gradient_0",'index' : 0,"gpus":0}
 
-
-fstdout = open(os.path.join(args['filepath'], "fitlog_" + str(args['index']) + ".txt"), 'w')
-sys.stderr = fstdout
-sys.stdout = fstdout
-
-print("Input argpars:", args)
-
 from PyRAI2MD.Machine_Learning.NNsMD.nn_pes_src.device import set_gpu
 
-set_gpu([int(args['gpus'])])
-print("Logic Devices:", tf.config.experimental.list_logical_devices('GPU'))
-
 from PyRAI2MD.Machine_Learning.NNsMD.utils.callbacks import EarlyStopping, lr_lin_reduction, lr_exp_reduction, lr_step_reduction
 from PyRAI2MD.Machine_Learning.NNsMD.models.mlp_g2 import GradientModel2
 # from PyRAI2MD.Machine_Learning.NNsMD.nn_pes_src.legacy import compute_feature_derivative
@@ -43,13 +32,14 @@ from PyRAI2MD.Machine_Learning.NNsMD.datasets.general import split_validation_tr
 # from PyRAI2MD.Machine_Learning.NNsMD.nn_pes_src.scaler import save_std_scaler_dict
 from PyRAI2MD.Machine_Learning.NNsMD.scaler.energy import GradientStandardScaler
 from PyRAI2MD.Machine_Learning.NNsMD.scaler.general import SegmentStandardScaler
+from PyRAI2MD.Machine_Learning.NNsMD.nn_pes_src.feature_cache import precompute_features
 from PyRAI2MD.Machine_Learning.NNsMD.utils.loss import get_lr_metric, ScaledMeanAbsoluteError, r2_metric
 from PyRAI2MD.Machine_Learning.NNsMD.plots.loss import plot_loss_curves, plot_learning_curve
 from PyRAI2MD.Machine_Learning.NNsMD.plots.pred import plot_scatter_prediction
 from PyRAI2MD.Machine_Learning.NNsMD.plots.error import plot_error_vec_mean, plot_error_vec_max
 
 
-def train_model_energy_gradient(i=0, outdir=None, mode='training'):
+def train_model_energy_gradient(i=0, outdir=None, mode='training', x=None, y=None):
     """
     Train an energy plus gradient model. Uses precomputed feature and model representation.
 
@@ -57,6 +47,8 @@ def train_model_energy_gradient(i=0, outdir=None, mode='training'):
         i (int, optional): Model index. The default is 0.
         outdir (str, optional): Direcotry for fit output. The default is None.
         mode (str, optional): Fitmode to take from hyperparameters. The default is 'training'.
+        x (np.array, optional): Coordinates, if trained in-process. The default is None, read from folder.
+        y (list, np.array, optional): Target values, if trained in-process. The default is None, read from folder.
 
     Raises:
         ValueError: Wrong input shape.
@@ -66,15 +58,16 @@ def train_model_energy_gradient(i=0, outdir=None, mode='training'):
 
     """
     i = int(i)
-    # Load everything from folder
-    try:
-        with open(os.path.join(outdir, 'data_y'), 'rb') as f:
-            y = pickle.load(f)
-        with open(os.path.join(outdir, 'data_x'), 'rb') as f:
-            x = pickle.load(f)
-    except:
-        print("Error: Can not load data for fit", outdir)
-        return
+    # Load everything from folder, unless the data is passed in-process
+    if x is None or y is None:
+        try:
+            with open(os.path.join(outdir, 'data_y'), 'rb') as f:
+                y = pickle.load(f)
+            with open(os.path.join(outdir, 'data_x'), 'rb') as f:
+                x = pickle.load(f)
+        except:
+            print("Error: Can not load data for fit", outdir)
+            return
     hyperall = None
     try:
         hyperall = load_hyp(os.path.join(outdir, 'hyper' + '_v%i' % i + ".json"))
@@ -157,6 +150,10 @@ def train_model_energy_gradient(i=0, outdir=None, mode='training'):
         try:
             out_model.load_weights(os.path.join(outdir, "weights" + '_v%i' % i + '.h5'))
             print("Info: Load old weights at:", os.path.join(outdir, "weights" + '_v%i' % i + '.h5'))
+            # Fine-tuning keeps the scaler and feature normalization the old weights were trained with
+            if hyperall['general'].get('keep_normalization', False):
+                scaler.load(os.path.join(outdir, 'scaler' + '_v%i' % i + ".json"))
+                out_model.keep_normalization = True
             print("Info: Transferring weights...")
         except:
             print("Error: Can't load old weights...")
@@ -164,14 +161,19 @@ def train_model_energy_gradient(i=0, outdir=None, mode='training'):
         print("Info: Making new initialized weights.")
 
     # Scale x,y
-    scaler.fit(x, y, auto_scale=auto_scale)
+    if not out_model.keep_normalization:
+        scaler.fit(x, y, auto_scale=auto_scale)
     x_rescale, y_rescale = scaler.transform(x, y)
     y1 = y_rescale
 
-    # Model + Model precompute layer +feat
-    feat_x, feat_grad = out_model.precompute_feature_in_chunks(x_rescale, batch_size=batch_size)
+    # Model + Model precompute layer +feat, reused from the feature cache if set
+    feat_x, feat_grad = precompute_features(out_model, x, x_rescale, scaler.x_std, batch_size,
+                                            hyperall['general'].get('feature_cache', ''))
     # Finding Normalization
-    feat_x_mean, feat_x_std = out_model.set_const_normalization_from_features(feat_x,normalization_mode=normalize_feat)
+    if out_model.keep_normalization:
+        feat_x_mean, feat_x_std = out_model.get_layer('feat_std').get_weights()
+    else:
+        feat_x_mean, feat_x_std = out_model.set_const_normalization_from_features(feat_x,normalization_mode=normalize_feat)
 
     # Train Test split
     xtrain = [feat_x[i_train], feat_grad[i_train]]
@@ -291,8 +293,18 @@ def train_model_energy_gradient(i=0, outdir=None, mode='training'):
 
 
 if __name__ == "__main__":
+    args = vars(parser.parse_args())
+
+    fstdout = open(os.path.join(args['filepath'], "fitlog_" + str(args['index']) + ".txt"), 'w')
+    sys.stderr = fstdout
+    sys.stdout = fstdout
+
+    print("Input argpars:", args)
+
+    set_gpu([int(args['gpus'])])
+    print("Logic Devices:", tf.config.experimental.list_logical_devices('GPU'))
+
     print("Training Model: ", args['filepath'])
     print("Network instance: ", args['index'])
     out = train_model_energy_gradient(args['index'], args['filepath'], args['mode'])
-
-fstdout.close()
+    fstdout.close()
@@ -3,6 +3,8 @@ import os
 import matplotlib.pyplot as plt
 import numpy as np
 
+from PyRAI2MD.Machine_Learning.NNsMD.plots.lock import plot_locked
+
 
 def find_max_relative_error(preds, yval):
     """
@@ -29,6 +31,7 @@ def find_max_relative_error(preds, yval):
     return pred_err, prelm
 
 
+@plot_locked
 def plot_error_vec_mean(
         y_pred,
         y_true,
@@ -70,6 +73,7 @@ def plot_error_vec_mean(
     return fig
 
 
+@plot_locked
 def plot_error_vec_max(y_pred,
                        y_true,
                        label_curves="Vector",
@@ -0,0 +1,26 @@
+"""
+Serialize plotting, since the figure state of pyplot is not thread-safe when models are trained in threads.
+"""
+
+import functools
+import threading
+
+PLOT_LOCK = threading.RLock()
+
+
+def plot_locked(func):
+    """
+    Decorator to run a plot function under PLOT_LOCK.
+
+    Args:
+        func (callable): Plot function.
+
+    Returns:
+        callable: Locked plot function.
+
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with PLOT_LOCK:
+            return func(*args, **kwargs)
+    return wrapper
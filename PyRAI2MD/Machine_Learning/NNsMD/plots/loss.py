@@ -3,7 +3,10 @@ import os
 import matplotlib.pyplot as plt
 import numpy as np
 
+from PyRAI2MD.Machine_Learning.NNsMD.plots.lock import plot_locked
 
+
+@plot_locked
 def plot_loss_curves(
         train_loss,
         val_loss,
@@ -59,6 +62,7 @@ def plot_loss_curves(
     return fig
 
 
+@plot_locked
 def plot_learning_curve(learningall,
                         filename='fit',
                         dir_save="",
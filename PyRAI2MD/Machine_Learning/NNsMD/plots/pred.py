@@ -3,7 +3,10 @@ import os
 import matplotlib.pyplot as plt
 import numpy as np
 
+from PyRAI2MD.Machine_Learning.NNsMD.plots.lock import plot_locked
 
+
+@plot_locked
 def plot_scatter_prediction(
         y_pred,
         y_val,
@@ -6,6 +6,8 @@ import json
 
 import numpy as np
 
+from PyRAI2MD.Machine_Learning.NNsMD.scaler.moments import RunningMoments
+
 
 class EnergyStandardScaler:
     def __init__(self):
@@ -155,6 +157,37 @@ class EnergyGradientStandardScaler:
         self._encountered_y_shape = [np.array(y[0].shape), np.array(y[1].shape)]
         self._encountered_y_std = [np.std(y[0], axis=0), np.std(y[1], axis=(0, 2, 3))]
 
+    def fit_stream(self, batches, auto_scale=None):
+        """
+        Fit in a single pass over batches of (x, [energy, gradient]) with running moments, same result as fit().
+        """
+        if auto_scale is None:
+            auto_scale = {'x_mean': True, 'x_std': True, 'energy_std': True, 'energy_mean': True}
+
+        x_mom, e_mom, g_mom = RunningMoments(), RunningMoments(), RunningMoments()
+        g_shape = None
+        for x, y in batches:
+            x_mom.update(x, axis=None)
+            e_mom.update(y[0], axis=0)
+            g_mom.update(y[1], axis=(0, 2, 3))
+            g_shape = y[1].shape[1:]
+
+        npeps = np.finfo(float).eps
+        if auto_scale['x_mean']:
+            self.x_mean = x_mom.mean.reshape(-1)[0]
+        if auto_scale['x_std']:
+            self.x_std = x_mom.std.reshape(-1)[0] + npeps
+        if auto_scale['energy_mean']:
+            self.energy_mean = e_mom.mean
+        if auto_scale['energy_std']:
+            self.energy_std = e_mom.std + npeps
+        self.gradient_std = np.expand_dims(np.expand_dims(self.energy_std, axis=-1), axis=-1) / self.x_std + npeps
+        self.gradient_mean = np.zeros_like(self.gradient_std, dtype=np.float32)  # no mean shift expected
+
+        self._encountered_y_shape = [np.array((e_mom.count,) + e_mom.mean.shape[1:]),
+                                     np.array((e_mom.count,) + tuple(g_shape))]
+        self._encountered_y_std = [e_mom.std[0], g_mom.std.reshape(-1)]
+
     def fit_transform(self, x=None, y=None, auto_scale=None):
         self.fit(x=x,y=y,auto_scale=auto_scale)
         return self.transform(x=x,y=y)
@@ -2,6 +2,8 @@ import json
 
 import numpy as np
 
+from PyRAI2MD.Machine_Learning.NNsMD.scaler.moments import RunningMoments
+
 
 class SegmentStandardScaler:
     def __init__(self, segments=None):
@@ -35,6 +37,36 @@ class SegmentStandardScaler:
         self._encountered_y_shape = np.array(y.shape)
         # print(feat_mean,feat_std)
 
+    def fit_stream(self, batches, segments=None):
+        """
+        Fit in a single pass over batches of features with running moments per segment, same result as fit().
+        """
+        if segments is not None:
+            self.segments = segments
+
+        if self.segments is None:
+            raise ValueError("Please define segments to scale features for shape", self.feat_mean.shape)
+
+        splits = np.concatenate([np.array([0]), np.cumsum(self.segments)])
+        moments = [RunningMoments() for _ in range(len(self.segments))]
+        count = 0
+        shape = ()
+        for y in batches:
+            for i in range(len(self.segments)):
+                moments[i].update(y[:, splits[i]:splits[i + 1]], axis=None)
+            count += len(y)
+            shape = y.shape[1:]
+
+        # Empty segments are dropped by np.repeat
+        feat_mean = [m.mean.reshape(-1)[0] if m.count > 0 else 0.0 for m in moments]
+        feat_std = [m.std.reshape(-1)[0] if m.count > 0 else 1.0 for m in moments]
+        feat_mean = np.repeat(np.array(feat_mean), np.array(self.segments))
+        feat_std = np.repeat(np.array(feat_std), np.array(self.segments))
+        self.feat_std = np.expand_dims(feat_std, axis=0)
+        self.feat_mean = np.expand_dims(feat_mean, axis=0)
+
+        self._encountered_y_shape = np.array((count,) + tuple(shape))
+
     def transform(self, y=None):
         y_res = None
         if y is not None:
@@ -0,0 +1,52 @@
+"""
+Running moments for fitting scalers in a single pass over batches.
+"""
+
+import numpy as np
+
+
+class RunningMoments:
+    """
+    Running mean and variance by Welford's algorithm, updated with a batch at a time (Chan et al.).
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = None
+        self.m2 = None
+
+    def update(self, values, axis=0):
+        """
+        Add a batch of values.
+
+        Args:
+            values (np.array): Batch of values.
+            axis (int, tuple, optional): Axis to reduce. The default is 0, None reduces all.
+
+        Returns:
+            self
+
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if values.size == 0:
+            return self
+        mean = np.mean(values, axis=axis, keepdims=True)
+        m2 = np.sum(np.square(values - mean), axis=axis, keepdims=True)
+        n = values.size // mean.size
+        if self.count == 0:
+            self.count, self.mean, self.m2 = n, mean, m2
+        else:
+            total = self.count + n
+            delta = mean - self.mean
+            self.mean = self.mean + delta * n / total
+            self.m2 = self.m2 + m2 + np.square(delta) * self.count * n / total
+            self.count = total
+        return self
+
+    @property
+    def var(self):
+        return self.m2 / max(self.count, 1)
+
+    @property
+    def std(self):
+        return np.sqrt(self.var)
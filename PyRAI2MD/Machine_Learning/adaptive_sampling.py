@@ -19,11 +19,28 @@ from PyRAI2MD.methods import QM
 from PyRAI2MD.Molecule.trajectory import Trajectory
 from PyRAI2MD.Dynamics.aimd import AIMD
 from PyRAI2MD.Machine_Learning.training_data import Data
+from PyRAI2MD.Machine_Learning.duplicate_index import DuplicateIndex
+from PyRAI2MD.Utils.thread_budget import ThreadBudget
 from PyRAI2MD.Utils.coordinates import print_coord
 from PyRAI2MD.Utils.sampling import sampling
 from PyRAI2MD.Utils.bonds import bond_lib
 from PyRAI2MD.Utils.timing import what_is_time
 from PyRAI2MD.Utils.timing import how_long
+from PyRAI2MD.Utils.scheduler import TimingHistory
+from PyRAI2MD.Utils.scheduler import longest_first
+from PyRAI2MD.Utils.scheduler import makespan
+from PyRAI2MD.Utils.journal import Journal
+
+## attributes of the sampling progress saved in the journal
+SAMPLING_PROGRESS = [
+    'itr', 'completed', 'initcond', 'last', 'final', 'atoms', 'geom', 'energy', 'grad', 'nac', 'soc',
+    'err_e', 'err_g', 'err_n', 'err_s', 'pop', 'max_e', 'max_g', 'max_n', 'max_s',
+    'nsampled', 'nuncertain', 'nselect', 'ndiscard', 'nrefine', 'nduplicate',
+    'select_geom', 'select_cond', 'select_id', 'uncertain_cond', 'refine_cond', 'pending_cond',
+    'dyn_e', 'dyn_g', 'dyn_n', 'dyn_s', 'dyn_e_new', 'dyn_g_new', 'dyn_n_new', 'dyn_s_new',
+    'itr_e', 'itr_g', 'itr_n', 'itr_s', 'itr_e_new', 'itr_g_new', 'itr_n_new', 'itr_s_new',
+    'holdout_index', 'ntrained', 'nfinetune', 'ref_err',
+]
 
 
 class AdaptiveSampling:
@@ -45,6 +62,16 @@ class AdaptiveSampling:
             refine_num       int         number of refinement geometries
             refine_start     int         the starting MD step of refinement
             refine_end       int         the end MD step of refinement
+            rescreen         int         re-screen pending geometries with the current model before QM calculation
+            maxqc            int         maximum number of QM calculations per iteration, 0 means no limit
+            resume           int         resume adaptive sampling from the journal
+            incremental      int         fine-tune the model with new data and replayed old data
+            replay           int         number of replayed old data in fine-tuning
+            fullretrain      int         number of iterations between full retraining in incremental training
+            maxdrift         float       relative increase of hold-out errors to trigger full retraining
+            holdout          int         number of hold-out data to validate incremental training
+            dedup            float       tolerance of fingerprint difference to detect duplicate geometries, 0 to skip
+            dedup_rmsd       float       tolerance of aligned RMSD to confirm duplicate geometries, 0 to skip
             load             int         load a pre-trained model or train a model first
             transfer         int         transfer learning instead of fresh training
             pop_step         int         MD step cutoff for averaging state population
@@ -108,6 +135,19 @@ class AdaptiveSampling:
             initcond         list        list of trajectory class for initial condition
             select_cond      list        list of trajectory class for selected geometries for QM calculation
             select_geom      list        list of coordinates for selected geometries
+            select_id        list        list of trajectory index of selected geometries
+            uncertain_cond   list        list of trajectory index and class for geometries selected by prediction errors
+            refine_cond      list        list of trajectory index and class for geometries selected by refinement
+            pending_cond     list        list of trajectory index and class for geometries deferred to the next iteration
+            timing           class       timing history class for scheduling MD and QM jobs
+            journal          class       journal class for checkpointing and resuming adaptive sampling
+            holdout_index    list        index of hold-out data for incremental training
+            dedup_index      class       near-duplicate index of the training geometries
+            budget           class       thread budget of MD, screening and QC workers
+            nduplicate       int         number of duplicate geometries removed before QC in this iteration
+            ntrained         int         number of data used in the last training
+            nfinetune        int         number of fine-tuning since the last full retraining
+            ref_err          ndarray     hold-out errors of the last full retraining or the first fine-tuning
             nsampled         list        number of sampled geometries per trajectory
             nuncertain       list        number of uncertain geometries per trajectory
             nselect          list        number of selected geometries per trajectory
@@ -146,6 +186,17 @@ class AdaptiveSampling:
         self.refine_num = keywords['control']['refine_num']
         self.refine_start = keywords['control']['refine_start']
         self.refine_end = keywords['control']['refine_end']
+        self.rescreen = keywords['control']['rescreen']
+        self.maxqc = keywords['control']['maxqc']
+        self.resume = keywords['control']['resume']
+        self.incremental = keywords['control']['incremental']
+        self.replay = keywords['control']['replay']
+        self.fullretrain = keywords['control']['fullretrain']
+        self.maxdrift = keywords['control']['maxdrift']
+        self.holdout = keywords['control']['holdout']
+        self.dedup = keywords['control']['dedup']
+        self.dedup_rmsd = keywords['control']['dedup_rmsd']
+        self.budget = ThreadBudget(keywords)
         self.load = keywords['control']['load']
         self.transfer = keywords['control']['transfer']
         self.pop_step = keywords['control']['pop_step']
@@ -179,6 +230,7 @@ class AdaptiveSampling:
 
         ## initialize trajectories stat
         self.itr = 0
+        self.completed = 0
         self.ntraj = ninitcond
         self.last = []
         self.final = []
@@ -204,6 +256,25 @@ class AdaptiveSampling:
         self.ndiscard = []
         self.nrefine = []
         self.select_cond = []
+        self.select_id = []
+        self.uncertain_cond = []
+        self.refine_cond = []
+        self.pending_cond = []
+
+        ## initialize incremental training stat
+        self.holdout_index = []
+        self.ntrained = 0
+        self.nfinetune = 0
+        self.ref_err = None
+
+        ## load timing history for scheduling
+        self.timing = TimingHistory('%s/%s.timing.json' % (os.getcwd(), self.title))
+
+        ## start a new journal unless resuming from the previous one
+        journal_path = '%s/%s.journal' % (os.getcwd(), self.title)
+        if self.resume == 0 and os.path.exists(journal_path):
+            shutil.rmtree(journal_path)
+        self.journal = Journal(journal_path)
 
         ## initialize dynamical	errors and delay steps
         if self.dynsample == 0:
@@ -238,6 +309,12 @@ class AdaptiveSampling:
         self.data.load(train_data)
         self.data.stat()
 
+        ## index training geometries to skip near-duplicates before QC
+        self.nduplicate = 0
+        self.dedup_index = None
+        if self.dedup > 0:
+            self.dedup_index = DuplicateIndex(self.dedup, self.dedup_rmsd).add(self.data.atoms, self.data.geos)
+
         ## generate initial conditions and trajectories
         np.random.seed(gl_seed)
         initcond = sampling(self.title, ninitcond, gl_seed, temp, method, ld_format)
@@ -247,20 +324,46 @@ class AdaptiveSampling:
         multiprocessing.set_start_method('spawn')
 
     def _run_aimd(self):
+        ## reuse finished trajectories in the journal
+        ntraj = len(self.initcond)
+        md_traj = [[] for _ in range(ntraj)]
+        finished = self.journal.load_jobs(self.itr, 'md')
+        for traj_id, md_hist in finished.items():
+            md_traj[traj_id] = md_hist
+
         ## wrap variables for multiprocessing
-        variables_wrapper = [[n, x] for n, x in enumerate(self.initcond)]
-        ntraj = len(variables_wrapper)
+        variables_wrapper = [[n, x] for n, x in enumerate(self.initcond) if n not in finished]
+        njob = len(variables_wrapper)
 
-        ## adjust multiprocessing if necessary
-        ncpu = np.amin([ntraj, self.ml_ncpu])
+        if njob == 0:
+            return md_traj
 
-        ## start multiprocessing
-        md_traj = [[] for _ in range(ntraj)]
-        pool = multiprocessing.Pool(processes=ncpu)
+        ## adjust multiprocessing if necessary
+        ncpu = np.amin([njob, self.ml_ncpu])
+
+        ## dispatch the longest predicted trajectories first
+        cost = self.timing.predict('md', [x[0] for x in variables_wrapper])
+        order = longest_first(cost)
+        position = {x[0]: n for n, x in enumerate(variables_wrapper)}
+        variables_wrapper = [variables_wrapper[n] for n in order]
+
+        ## start multiprocessing, each worker runs TF with its share of the thread budget
+        walltime = [0 for _ in range(njob)]
+        natom = len(self.initcond[0].coord)
+        self._plan_budget('MD', ncpu, len(self.budget.cores))
+        t_s = time.time()
+        pool = multiprocessing.Pool(processes=ncpu, **self.budget.pool_args('MD'))
         for val in pool.imap_unordered(self._aimd_wrapper, variables_wrapper):
-            traj_id, md_hist = val
+            traj_id, md_hist, md_time, md_step = val
             md_traj[traj_id] = md_hist
+            walltime[position[traj_id]] = md_time
+            self.journal.save_job(self.itr, 'md', traj_id, md_hist)
+            self.timing.record('md', traj_id, md_time, self.qm, natom, md_step, self.itr)
         pool.close()
+        t_e = time.time()
+
+        self.timing.save()
+        self._schedule_report('MD', cost, walltime, order, ncpu, t_e - t_s)
 
         return md_traj
 
@@ -286,25 +389,54 @@ class AdaptiveSampling:
         aimd.maxerr_soc = self.dyn_s[traj_id]
 
         ## run AIMD
+        t_s = time.time()
         md_traj = aimd.run()
         md_hist = md_traj.history
-        return traj_id, md_hist
+        md_time = time.time() - t_s
+        md_step = md_traj.itr
+
+        return traj_id, md_hist, md_time, md_step
 
     def _run_abinit(self):
-        ## wrap variables for multiprocessing
-        variables_wrapper = [[n, x] for n, x in enumerate(self.select_cond)]
-        ngeom = len(variables_wrapper)
+        ## reuse finished calculations in the journal
+        ngeom = len(self.select_cond)
+        qc_data = [[] for _ in range(ngeom)]
+        finished = self.journal.load_jobs(self.itr, 'qc')
+        for geom_id, data in finished.items():
+            qc_data[geom_id] = data
 
-        ## adjust multiprocessing if necessary
-        ncpu = np.amin([ngeom, self.qc_ncpu])
+        ## wrap variables for multiprocessing
+        variables_wrapper = [[n, x] for n, x in enumerate(self.select_cond) if n not in finished]
+        njob = len(variables_wrapper)
+
+        ## skip if all candidates were discarded, deferred, or computed
+        if njob > 0:
+            ## adjust multiprocessing if necessary
+            ncpu = np.amin([njob, self.qc_ncpu])
+
+            ## dispatch the longest predicted calculations first
+            cost = self.timing.predict('qc', [self.select_id[x[0]] for x in variables_wrapper])
+            order = longest_first(cost)
+            position = {x[0]: n for n, x in enumerate(variables_wrapper)}
+            variables_wrapper = [variables_wrapper[n] for n in order]
+
+            ## start multiprocessing
+            walltime = [0 for _ in range(njob)]
+            natom = len(self.atoms)
+            self._plan_budget('QM', ncpu, ThreadBudget.requested(self.keywords, self.abinit))
+            t_s = time.time()
+            pool = multiprocessing.Pool(processes=ncpu, **self.budget.pool_args('QM'))
+            for val in pool.imap_unordered(self._abinit_wrapper, variables_wrapper):
+                geom_id, xyz, energy, grad, nac, soc, completion, qc_time = val
+                qc_data[geom_id] = [[xyz, energy, grad, nac, soc], completion]
+                walltime[position[geom_id]] = qc_time
+                self.journal.save_job(self.itr, 'qc', geom_id, qc_data[geom_id])
+                self.timing.record('qc', self.select_id[geom_id], qc_time, self.abinit, natom, completion, self.itr)
+            pool.close()
+            t_e = time.time()
 
-        ## start multiprocessing
-        qc_data = [[] for _ in range(ngeom)]
-        pool = multiprocessing.Pool(processes=ncpu)
-        for val in pool.imap_unordered(self._abinit_wrapper, variables_wrapper):
-            geom_id, xyz, energy, grad, nac, soc, completion = val
-            qc_data[geom_id] = [[xyz, energy, grad, nac, soc], completion]
-        pool.close()
+            self.timing.save()
+            self._schedule_report('QM', cost, walltime, order, ncpu, t_e - t_s)
 
         ## check qc results and exclude non-converged ones
         newdata = [[] for _ in range(5)]
@@ -323,8 +455,10 @@ class AdaptiveSampling:
         xyz = np.concatenate((self.atoms, mol.coord), axis=1)
 
         ## run QC calculation
-        qc = QM(self.abinit, keywords=self.keywords, job_id=geom_id + 1)
+        t_s = time.time()
+        qc = QM(self.abinit, keywords=self.budget.qc_keywords(self.keywords, self.abinit), job_id=geom_id + 1)
         mol = qc.evaluate(mol)
+        qc_time = time.time() - t_s
 
         ## prepare qc results
         energy = mol.energy.tolist()
@@ -333,7 +467,7 @@ class AdaptiveSampling:
         soc = mol.soc
         completion = mol.status
 
-        return geom_id, xyz, energy, grad, nac, soc, completion
+        return geom_id, xyz, energy, grad, nac, soc, completion, qc_time
 
     def _screen_error(self, md_traj):
         ## initialize data list
@@ -374,11 +508,12 @@ class AdaptiveSampling:
         ## screen trajectories with multiprocessing
         ncpu = np.amin([ntraj, self.ml_ncpu, 5])
         print('\nScreen geometries with %s CPUs' % ncpu)
+        self._plan_budget('screen', ncpu, len(self.budget.cores))
         t_s = time.time()
 
         n = 0
         variables_wrapper = [[n, x] for n, x in enumerate(md_traj)]
-        pool = multiprocessing.Pool(processes=ncpu)
+        pool = multiprocessing.Pool(processes=ncpu, **self.budget.pool_args('screen'))
         for val in pool.imap_unordered(self._screen_error_wrapper, variables_wrapper):
             # for var in variables_wrapper:
             # val = self._screen_error_wrapper(var)
@@ -460,16 +595,26 @@ class AdaptiveSampling:
         self.nrefine = md_nrefine
 
         ## append selected geom and conditions
+        ## the first nselect geometries per trajectory come from prediction errors, the rest from refinement
         self.select_geom = []
         self.select_cond = []
+        self.select_id = []
+        self.uncertain_cond = []
+        self.refine_cond = []
 
         for n, geom in enumerate(md_select_geom):
             self.select_geom = self.select_geom + geom
 
-            for geo in geom:
+            for m, geo in enumerate(geom):
                 cond = copy.deepcopy(self.initcond[n])
                 cond.coord = np.array(geo)
                 self.select_cond.append(cond)
+                self.select_id.append(n)
+
+                if m < md_nselect[n]:
+                    self.uncertain_cond.append([n, cond])
+                else:
+                    self.refine_cond.append([n, cond])
 
         t_e = time.time()
         print('Prepare calculation spent: ', how_long(t_m, t_e))
@@ -758,6 +903,138 @@ class AdaptiveSampling:
 
         return selec_error, index_error
 
+    def _rescreen_candidates(self):
+        ## This function re-scores the pending and new uncertain geometries with the current model
+        ## geometries that are no longer uncertain are discarded, the rest are sorted by errors
+        ## the geometries exceeding maxqc are deferred to the next iteration
+        if self.rescreen == 0 and self.maxqc == 0:
+            return self
+
+        candidates = self.pending_cond + self.uncertain_cond
+        npending = len(self.pending_cond)
+        nnew = len(self.uncertain_cond)
+        ndiscard = 0
+
+        if self.rescreen == 1 and len(candidates) > 0:
+            t_s = time.time()
+            coord = np.array([x[1].coord for x in candidates])
+            pool = multiprocessing.Pool(processes=1)
+            for val in pool.imap_unordered(self._rescreen_wrapper, [coord]):
+                err = val
+            pool.close()
+
+            if err is not None:
+                ## normalize errors by the thresholds of recording uncertain geometries
+                ## a property without a positive threshold is not screened
+                threshold = np.array([self.minenergy, self.mingrad, self.minnac, self.minsoc])
+                valid = threshold > 0
+                score = np.amax(np.where(valid, err / np.where(valid, threshold, 1), 0), axis=1)
+                order = [x for x in np.argsort(-score) if score[x] > 1]
+                ndiscard = len(candidates) - len(order)
+                candidates = [candidates[x] for x in order]
+
+            t_e = time.time()
+            print('Re-screen geometries spent:', how_long(t_s, t_e))
+
+        if self.maxqc > 0:
+            nqc = np.amax([self.maxqc - len(self.refine_cond), 0])
+            self.pending_cond = candidates[nqc:]
+            candidates = candidates[:nqc]
+        else:
+            self.pending_cond = []
+
+        self.select_cond = [x[1] for x in candidates + self.refine_cond]
+        self.select_id = [x[0] for x in candidates + self.refine_cond]
+        self.select_geom = [x.coord.tolist() for x in self.select_cond]
+
+        log_info = """
+  &re-screen candidates iter %5s
+-------------------------------------------------------
+  Pending:                    %-10s
+  New:                        %-10s
+  Discarded:                  %-10s
+  Refinement:                 %-10s
+  Selected:                   %-10s
+  Deferred:                   %-10s
+-------------------------------------------------------
+""" % (
+            self.itr,
+            npending,
+            nnew,
+            ndiscard,
+            len(self.refine_cond),
+            len(self.select_cond),
+            len(self.pending_cond)
+        )
+
+        print(log_info)
+        with open('%s/%s.log' % (os.getcwd(), self.title), 'a') as log:
+            log.write(log_info)
+
+        return self
+
+    def _plan_budget(self, role, ncpu, requested):
+        ## split the cores over the workers and report oversubscription
+        self.budget.plan(role, ncpu, requested)
+        if len(self.budget.info) > 0:
+            print(self.budget.info)
+            with open('%s/%s.log' % (os.getcwd(), self.title), 'a') as log:
+                log.write(self.budget.info)
+
+        return self
+
+    def _schedule_report(self, job, cost, walltime, order, ncpu, elapsed):
+        ## This function reports the accuracy of predicted job costs and the makespan versus the naive order
+        cost = np.array(cost, dtype=float)
+        walltime = np.array(walltime, dtype=float)
+        known = np.where(cost > 0)[0]
+
+        if len(known) > 0:
+            mae = np.mean(np.abs(cost[known] - walltime[known]))
+            mre = np.mean(np.abs(cost[known] - walltime[known]) / np.maximum(walltime[known], 1e-6)) * 100
+        else:
+            mae = 0
+            mre = 0
+
+        log_info = """
+  &scheduling %s iter %5s
+-------------------------------------------------------
+  Number of jobs:             %-10s
+  Number of CPU:              %-10s
+  Predicted jobs:             %-10s
+  Prediction MAE (s):         %-10.2f
+  Prediction MRE (%%):         %-10.2f
+  Makespan (s):               %-10.2f
+  Longest-first makespan (s): %-10.2f
+  Naive order makespan (s):   %-10.2f
+-------------------------------------------------------
+""" % (
+            job,
+            self.itr,
+            len(walltime),
+            ncpu,
+            len(known),
+            mae,
+            mre,
+            elapsed,
+            makespan(walltime, ncpu, order),
+            makespan(walltime, ncpu)
+        )
+
+        print(log_info)
+        with open('%s/%s.log' % (os.getcwd(), self.title), 'a') as log:
+            log.write(log_info)
+
+        return self
+
+    def _rescreen_wrapper(self, coord):
+        ## load the current model in a worker process and compute the errors in one batch
+        qm = QM(self.qm, keywords=self.keywords, job_id=self.itr)
+        qm.load()
+        err = qm.screen(coord)
+
+        return err
+
     def _update_dynamical_error(self):
         self.dyn_e = copy.deepcopy(self.dyn_e_new)
         self.dyn_g = copy.deepcopy(self.dyn_g_new)
@@ -771,36 +1048,236 @@ class AdaptiveSampling:
 
         return self
 
+    def _filter_duplicates(self):
+        ## This function removes selected geometries that repeat the training data or each other
+        ## the index is only updated with labeled data in _update_train_set
+        self.nduplicate = 0
+        if self.dedup_index is None or len(self.select_cond) == 0:
+            return self
+
+        atoms = [np.array(x.atoms).reshape(-1).tolist() for x in self.select_cond]
+        geos = np.array([x.coord for x in self.select_cond])
+        keep = self.dedup_index.filter(atoms, geos, update=False)
+        self.nduplicate = len(self.select_cond) - len(keep)
+        self.select_cond = [self.select_cond[x] for x in keep]
+        self.select_id = [self.select_id[x] for x in keep]
+        self.select_geom = [self.select_cond[x].coord.tolist() for x in range(len(keep))]
+
+        log_info = '  Duplicate geometries removed before QC: %s\n' % self.nduplicate
+        print(log_info)
+        with open('%s/%s.log' % (os.getcwd(), self.title), 'a') as log:
+            log.write(log_info)
+
+        return self
+
     def _update_train_set(self, newdata):
-        self.data.append(newdata)
-        self.data.stat()
+        if len(newdata[0]) > 0 and self.dedup_index is not None:
+            ## keep only new geometries and add them to the index
+            atoms = [np.array(x)[:, 0].astype(str).tolist() for x in newdata[0]]
+            geos = np.array([np.array(x)[:, 1: 4].astype(float) for x in newdata[0]])
+            keep = self.dedup_index.filter(atoms, geos)
+            newdata = [[x[n] for n in keep] for x in newdata]
+
+        if len(newdata[0]) > 0:
+            self.data.append(newdata)
+            self.data.stat()
+
         self.data.save(self.itr + 1)
 
         return self
 
     def _train_model(self):
+        ## start NN training
+        if self.itr > 1 or self.load == 0:
+            if self.incremental == 1:
+                self._train_incremental()
+            else:
+                self._fit_model(self.data)
+
+        elif self.incremental == 1:
+            self._train_incremental()
+
+        return self
+
+    def _fit_model(self, data, finetune=False):
         ## add training data to keywords
         self.keywords[self.qm]['train_mode'] = 'training'
-        self.keywords[self.qm]['data'] = self.data
+        self.keywords[self.qm]['finetune'] = 1 if finetune else 0
+        self.keywords[self.qm]['data'] = data
 
-        ## copy NN weights for transfer learning
-        if self.itr == 2 and self.transfer == 1:
-            self.keywords[self.qm]['train_mode'] = 'retraining'
-            shutil.copytree('NN-%s' % self.title, 'NN-%s-%s' % (self.title, self.itr))
+        ## copy NN weights for transfer learning or fine-tuning
+        ## remove the weights left by an interrupted or a replaced training first
+        if self.itr > 1 and (self.transfer == 1 or finetune):
+            if os.path.exists('NN-%s-%s' % (self.title, self.itr)):
+                shutil.rmtree('NN-%s-%s' % (self.title, self.itr))
 
-        if self.itr > 2 and self.transfer == 1:
             self.keywords[self.qm]['train_mode'] = 'retraining'
-            shutil.copytree('NN-%s-%s' % (self.title, self.itr - 1), 'NN-%s-%s' % (self.title, self.itr))
 
-        ## start NN training
-        if self.itr > 1 or self.load == 0:
-            pool = multiprocessing.Pool(processes=1)
-            for _ in pool.imap_unordered(self._train_wrapper, [None]):
-                _ = None
-            pool.close()
+            if self.itr == 2:
+                shutil.copytree('NN-%s' % self.title, 'NN-%s-%s' % (self.title, self.itr))
+            else:
+                shutil.copytree('NN-%s-%s' % (self.title, self.itr - 1), 'NN-%s-%s' % (self.title, self.itr))
+
+        pool = multiprocessing.Pool(processes=1)
+        for _ in pool.imap_unordered(self._train_wrapper, [None]):
+            _ = None
+        pool.close()
 
         return self
 
+    def _train_incremental(self):
+        ## This function fine-tunes the model with the new data plus a replay of the old data
+        ## the model is fully retrained periodically or when the hold-out error drifts
+        ndata = len(self.data.geos)
+
+        ## fix the hold-out data at the first training, at most 10% of the unseen data
+        ## a loaded model has seen the initial data, the hold-out data is drawn from the first new data
+        if self.itr == 1 and self.load == 1:
+            nseen = ndata
+        else:
+            nseen = self.ntrained
+
+        if self.holdout > 0 and len(self.holdout_index) == 0:
+            nhold = np.amin([self.holdout, int((ndata - nseen) / 10)])
+            if nhold > 0:
+                self.holdout_index = (nseen + np.random.choice(ndata - nseen, nhold, replace=False)).tolist()
+
+        holdout = set(self.holdout_index)
+        train_index = [x for x in range(ndata) if x not in holdout]
+
+        if self.itr == 1:
+            if self.load == 0:
+                self._fit_model(self.data.subset(train_index))
+            mode = 'full'
+            nnew = len(train_index)
+            nreplay = 0
+            drift = 0
+            self.nfinetune = 0
+            self.ref_err = self._validate_model()
+            err = self.ref_err
+
+        elif self.nfinetune >= self.fullretrain - 1:
+            self._fit_model(self.data.subset(train_index))
+            mode = 'full'
+            nnew = len(train_index)
+            nreplay = 0
+            drift = 0
+            self.nfinetune = 0
+            self.ref_err = self._validate_model()
+            err = self.ref_err
+
+        else:
+            new_index = [x for x in range(self.ntrained, ndata) if x not in holdout]
+            old_index = [x for x in range(self.ntrained) if x not in holdout]
+            replay_index = self._stratified_index(self.data.energy, old_index, self.replay)
+            self._fit_model(self.data.subset(new_index + replay_index), finetune=True)
+            mode = 'fine-tune'
+            nnew = len(new_index)
+            nreplay = len(replay_index)
+            self.nfinetune += 1
+            err = self._validate_model()
+
+            if err is not None and self.ref_err is not None:
+                drift = np.amax((err - self.ref_err) / np.maximum(self.ref_err, 1e-12))
+            else:
+                drift = 0
+
+            ## the first hold-out errors of a loaded model are the reference
+            if self.ref_err is None:
+                self.ref_err = err
+
+            if drift > self.maxdrift:
+                self._fit_model(self.data.subset(train_index))
+                mode = 'full (drift %.4f)' % drift
+                nnew = len(train_index)
+                nreplay = 0
+                self.nfinetune = 0
+                self.ref_err = self._validate_model()
+                err = self.ref_err
+
+        self.ntrained = ndata
+
+        if err is None:
+            err = np.zeros(2)
+
+        if self.ref_err is None:
+            ref_err = np.zeros(2)
+        else:
+            ref_err = self.ref_err
+
+        log_info = """
+  &incremental training iter %5s
+-------------------------------------------------------
+  Mode:                       %-10s
+  New/training data:          %-10s
+  Replay data:                %-10s
+  Hold-out data:              %-10s
+  Hold-out MAE energy:        %-16.8f
+  Hold-out MAE gradient:      %-16.8f
+  Reference MAE energy:       %-16.8f
+  Reference MAE gradient:     %-16.8f
+-------------------------------------------------------
+""" % (
+            self.itr,
+            mode,
+            nnew,
+            nreplay,
+            len(self.holdout_index),
+            err[0],
+            err[1],
+            ref_err[0],
+            ref_err[1]
+        )
+
+        print(log_info)
+        with open('%s/%s.log' % (os.getcwd(), self.title), 'a') as log:
+            log.write(log_info)
+
+        return self
+
+    def _validate_model(self):
+        ## This function computes the errors of the current model on the hold-out data
+        if len(self.holdout_index) == 0:
+            return None
+
+        pool = multiprocessing.Pool(processes=1)
+        for val in pool.imap_unordered(self._validate_wrapper, [self.holdout_index]):
+            err = val
+        pool.close()
+
+        return err
+
+    def _validate_wrapper(self, index):
+        qm = QM(self.qm, keywords=self.keywords, job_id=self.itr)
+        qm.load()
+        err = qm.validate(self.data.geos[index], self.data.energy[index], self.data.grad[index])
+
+        return err
+
+    @staticmethod
+    def _stratified_index(energy, index, nsample, nbin=10):
+        ## This function samples data evenly from the energy bins of the lowest state
+        ## the rest of the samples are randomly drawn from the remaining data
+        index = np.array(index).astype(int)
+
+        if nsample >= len(index):
+            return index.tolist()
+
+        energy = np.array(energy)[index].reshape((len(index), -1))[:, 0]
+        edges = np.quantile(energy, np.linspace(0, 1, nbin + 1))
+        bins = np.clip(np.searchsorted(edges, energy, side='right') - 1, 0, nbin - 1)
+        quota = int(nsample / nbin)
+        select = []
+        remain = []
+        for n in range(nbin):
+            member = np.random.permutation(index[bins == n])
+            select += member[:quota].tolist()
+            remain += member[quota:].tolist()
+
+        select += np.random.permutation(remain)[: nsample - len(select)].astype(int).tolist()
+
+        return select
+
     def _train_wrapper(self, _):
         model = QM(self.qm, keywords=self.keywords, job_id=self.itr)
         model.train()
@@ -998,6 +1475,54 @@ Thrshd(E: %8.4f %s %8.4f G: %8.4f %s %8.4f N: %8.4f %s %8.4f S: %8.4f %s %8.4f)
         self.completed = completed
         return completed
 
+    def _save_state(self):
+        ## This function collects the sampling progress to save in the journal
+        ## settings such as the core counts and the QC keywords are read from the input of the resumed run
+        ## the training data and the duplicate index are rebuilt from the saved data on resume
+        state = {key: self.__dict__[key] for key in SAMPLING_PROGRESS}
+        state['data'] = {
+            'file': os.path.abspath(self.data.file),
+            'size': len(self.data.geos),
+            'forked': self.data.forked,
+        }
+
+        return state
+
+    def _restore_data(self, saved):
+        ## This function reloads the training data saved before the last commit
+        ## a store can hold the data of an interrupted update, which is appended again
+        data = Data()
+        data.load(saved['file'])
+        if len(data.geos) > saved['size']:
+            store = data.store
+            data = data.subset(np.arange(saved['size']))
+            data.store = store
+
+        if data.store is not None:
+            data.nstored = len(data.geos)
+
+        data.forked = saved['forked']
+        data.file = saved['file']
+        data.stat()
+
+        return data
+
+    def _restore_state(self):
+        ## This function restores the sampling progress from the journal
+        state = self.journal.load_state()
+
+        if state is None:
+            return self
+
+        state['data'] = self._restore_data(state['data'])
+        self.__dict__.update(state)
+        self.keywords[self.qm]['data'] = self.data
+
+        if self.dedup > 0:
+            self.dedup_index = DuplicateIndex(self.dedup, self.dedup_rmsd).add(self.data.atoms, self.data.geos)
+
+        return self
+
     def _heading(self):
 
         headline = """
@@ -1021,30 +1546,67 @@ Thrshd(E: %8.4f %s %8.4f G: %8.4f %s %8.4f N: %8.4f %s %8.4f S: %8.4f %s %8.4f)
     def search(self):
         logpath = os.getcwd()
         start = time.time()
-        heading = 'Adaptive Sampling Start: %20s\n%s' % (what_is_time(), self._heading())
+        last_itr, last_phase = self.journal.last()
+
+        if self.resume == 1 and last_phase is not None:
+            ## continue the last iteration unless it was completed
+            self._restore_state()
+            if last_phase == 'update':
+                start_itr = last_itr
+            else:
+                start_itr = last_itr - 1
+            heading = 'Adaptive Sampling Resume: %20s\n%s  Resume from iteration %s after %s\n' % (
+                what_is_time(), self._heading(), last_itr, last_phase)
+            mode = 'a'
+        else:
+            start_itr = 0
+            heading = 'Adaptive Sampling Start: %20s\n%s' % (what_is_time(), self._heading())
+            mode = 'w'
+
         print(heading)
-        with open('%s/%s.log' % (logpath, self.title), 'w') as log:
+        with open('%s/%s.log' % (logpath, self.title), mode) as log:
             log.write(heading)
 
-        for itr in range(self.maxiter):
+        for itr in range(start_itr, self.maxiter):
             self.itr = itr + 1
-            self._train_model()
-            md_traj = self._run_aimd()
-            self._screen_error(md_traj)
-            completed = self._checkpoint()
+
+            if not self.journal.done(self.itr, 'train'):
+                self._train_model()
+                self.journal.commit(self.itr, 'train', self._save_state())
+
+            if not self.journal.done(self.itr, 'screen'):
+                md_traj = self._run_aimd()
+                if not self.journal.done(self.itr, 'md'):
+                    self.journal.commit(self.itr, 'md')
+                self._screen_error(md_traj)
+                self._checkpoint()
+                self.journal.commit(self.itr, 'screen', self._save_state())
+
+            completed = self.completed
 
             if self.itr > self.maxiter:
                 break
 
-            if completed == self.ntraj and np.sum(self.nrefine) == 0:
+            ## deferred candidates are computed before stopping
+            if completed == self.ntraj and np.sum(self.nrefine) == 0 and len(self.pending_cond) == 0:
                 break
 
+            if not self.journal.done(self.itr, 'rescreen'):
+                self._rescreen_candidates()
+                self._filter_duplicates()
+                self.journal.commit(self.itr, 'rescreen', self._save_state())
+
             newdata = self._run_abinit()
+            if not self.journal.done(self.itr, 'qc'):
+                self.journal.commit(self.itr, 'qc')
             self._update_train_set(newdata)
 
             if self.dynsample != 0:
                 self._update_dynamical_error()
 
+            self.journal.commit(self.itr, 'update', self._save_state())
+            self.journal.clean(self.itr + 1)
+
         end = time.time()
         walltime = how_long(start, end)
         tailing = 'Adaptive Sampling End: %20s Total: %20s\n' % (what_is_time(), walltime)
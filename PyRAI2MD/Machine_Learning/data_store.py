@@ -0,0 +1,242 @@
+######################################################
+#
+# PyRAI2MD 2 module for binary training data store
+#
+# Author Jingbai Li
+# Oct 18 2026
+#
+######################################################
+
+import os
+import sys
+import json
+import shutil
+import numpy as np
+
+STORE_META = 'meta.json'
+STORE_FIELDS = ['symbols', 'geos', 'energy', 'grad', 'nac', 'soc']
+
+def is_store(path):
+    ## a store is a directory with a metadata header
+    return os.path.isdir(path) and os.path.exists('%s/%s' % (path, STORE_META))
+
+class DataStore:
+    """ Columnar binary store of training data
+
+        Parameters:          Type:
+            path             str         store directory
+
+        Attribute:           Type:
+            path             str         store directory
+            meta             dict        metadata header
+            size             int         number of stored data points
+            tags             list        tags of the appended data
+            masked           list        index of data points that are no longer valid
+
+        Functions:           Returns:
+            create           self        create an empty store
+            fork             DataStore   copy the store into a new directory
+            append           self        append new data in place, once per tag
+            replace          self        overwrite stored data points in place
+            mask             self        mark stored data points as no longer valid
+            read             ndarray     read a field as a memory-mapped array
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.meta = None
+
+        if is_store(path):
+            with open('%s/%s' % (path, STORE_META), 'r') as infile:
+                self.meta = json.load(infile)
+
+    def _write_meta(self):
+        ## the header is replaced last, so an interrupted append leaves the store unchanged
+        tmp = '%s/%s.tmp' % (self.path, STORE_META)
+        with open(tmp, 'w') as outfile:
+            json.dump(self.meta, outfile)
+        os.replace(tmp, '%s/%s' % (self.path, STORE_META))
+
+    def _field_file(self, name):
+        return '%s/%s.npy' % (self.path, name)
+
+    def _reserve(self, name, array, size):
+        ## each field is one preallocated file, rows beyond the stored size are free
+        ## a full field is copied into a file of twice the capacity, so appends are O(new) on average
+        file = self._field_file(name)
+        shape = tuple(np.shape(array)[1:])
+
+        if name in self.meta['fields'] and os.path.exists(file):
+            field = np.load(file, mmap_mode='r+')
+            dtype = np.promote_types(field.dtype, array.dtype)
+            if len(field) >= size and dtype == field.dtype:
+                return field
+            capacity = max(size, 2 * len(field))
+        else:
+            field = None
+            dtype = array.dtype
+            capacity = size
+
+        new = np.lib.format.open_memmap('%s.tmp' % file, mode='w+', dtype=dtype, shape=(capacity, ) + shape)
+        if field is not None:
+            new[0: self.size] = field[0: self.size]
+        new.flush()
+        del new
+        os.replace('%s.tmp' % file, file)
+
+        return np.load(file, mmap_mode='r+')
+
+    @property
+    def size(self):
+        if self.meta is None:
+            return 0
+
+        return int(self.meta['size'])
+
+    @property
+    def tags(self):
+        if self.meta is None:
+            return []
+
+        return [tag for tag, _ in self.meta['history']]
+
+    @property
+    def masked(self):
+        if self.meta is None:
+            return []
+
+        return self.meta.get('masked', [])
+
+    def create(self, natom, nstate, nnac, nsoc):
+        os.makedirs(self.path, exist_ok=True)
+        self.meta = {
+            'version': 1,
+            'natom': int(natom),
+            'nstate': int(nstate),
+            'nnac': int(nnac),
+            'nsoc': int(nsoc),
+            'fields': {},
+            'size': 0,
+            'history': [],
+            'masked': [],
+        }
+        self._write_meta()
+
+        return self
+
+    def fork(self, path):
+        ## the fork owns copies of the fields, appending to it leaves this store unchanged
+        ## its history starts from this store, so the tags of an earlier job are not skipped
+        if os.path.abspath(path) == os.path.abspath(self.path):
+            return self
+
+        if os.path.exists(path):
+            shutil.rmtree(path)
+
+        os.makedirs(path)
+        for name in self.meta['fields'].keys():
+            shutil.copyfile(self._field_file(name), '%s/%s.npy' % (path, name))
+
+        store = DataStore(path)
+        store.meta = json.loads(json.dumps(self.meta))
+        store.meta['history'] = [[os.path.abspath(self.path), self.size]]
+        store._write_meta()
+
+        return store
+
+    def append(self, columns, tag=None):
+        ## columns is a dict of arrays for all fields with the same number of data points
+        ## tag records the store size after this append, e.g. the adaptive sampling iteration
+        if self.meta is None:
+            sys.exit('\n  FileNotFoundError\n  PyRAI2MD: looking for training data store %s' % self.path)
+
+        ## data of a recorded tag is already stored, e.g. when a resumed job repeats the append
+        if tag is not None and str(tag) in self.tags:
+            return self
+
+        size = len(columns['geos'])
+        for name in STORE_FIELDS:
+            if len(columns[name]) != size:
+                sys.exit('\n  ValueError\n  PyRAI2MD: %s has %s data points but geos has %s' % (
+                    name, len(columns[name]), size))
+
+            shape = list(np.shape(columns[name])[1:])
+            if name in self.meta['fields'] and self.meta['fields'][name]['shape'] != shape:
+                sys.exit('\n  ValueError\n  PyRAI2MD: %s has shape %s but the store has %s' % (
+                    name, shape, self.meta['fields'][name]['shape']))
+
+        if size > 0:
+            start = self.size
+            for name in STORE_FIELDS:
+                array = np.ascontiguousarray(columns[name])
+                field = self._reserve(name, array, start + size)
+                field[start: start + size] = array
+                field.flush()
+                self.meta['fields'][name] = {'dtype': field.dtype.str, 'shape': list(field.shape[1:])}
+                del field
+            self.meta['size'] = start + size
+
+        if tag is not None:
+            self.meta['history'].append([str(tag), self.size])
+
+        if size > 0 or tag is not None:
+            self._write_meta()
+
+        return self
+
+    def replace(self, columns, rows):
+        ## This function overwrites stored data points, e.g. labels of a changed QC output
+        ## a replaced data point is valid again if it was masked
+        if self.meta is None:
+            sys.exit('\n  FileNotFoundError\n  PyRAI2MD: looking for training data store %s' % self.path)
+
+        rows = np.array(rows).astype(int).reshape(-1)
+        if len(rows) == 0:
+            return self
+
+        if np.amin(rows) < 0 or np.amax(rows) >= self.size:
+            sys.exit('\n  IndexError\n  PyRAI2MD: replace data points %s to %s but the store has %s' % (
+                np.amin(rows), np.amax(rows), self.size))
+
+        for name in STORE_FIELDS:
+            if len(columns[name]) != len(rows):
+                sys.exit('\n  ValueError\n  PyRAI2MD: %s has %s data points but %s rows are replaced' % (
+                    name, len(columns[name]), len(rows)))
+
+            shape = list(np.shape(columns[name])[1:])
+            if self.meta['fields'][name]['shape'] != shape:
+                sys.exit('\n  ValueError\n  PyRAI2MD: %s has shape %s but the store has %s' % (
+                    name, shape, self.meta['fields'][name]['shape']))
+
+        for name in STORE_FIELDS:
+            array = np.ascontiguousarray(columns[name])
+            field = self._reserve(name, array, self.size)
+            field[rows] = array
+            field.flush()
+            self.meta['fields'][name]['dtype'] = field.dtype.str
+            del field
+
+        self.meta['masked'] = sorted(set(self.masked) - set(rows.tolist()))
+        self._write_meta()
+
+        return self
+
+    def mask(self, rows):
+        ## masked data points stay in the fields but are skipped when the training data is loaded
+        if self.meta is None:
+            sys.exit('\n  FileNotFoundError\n  PyRAI2MD: looking for training data store %s' % self.path)
+
+        rows = np.array(rows).astype(int).reshape(-1).tolist()
+        if len(rows) > 0:
+            self.meta['masked'] = sorted(set(self.masked) | set(rows))
+            self._write_meta()
+
+        return self
+
+    def read(self, name):
+        ## the stored rows of a field are a view of the memory-mapped file, nothing is read into memory
+        if self.size == 0 or name not in self.meta['fields']:
+            return np.zeros(0)
+
+        return np.load(self._field_file(name), mmap_mode='r')[0: self.size]
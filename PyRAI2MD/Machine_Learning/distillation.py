@@ -0,0 +1,332 @@
+######################################################
+#
+# PyRAI2MD 2 module for distilling NN ensembles
+#
+# Author Jingbai Li
+# Oct 18 2026
+#
+######################################################
+
+import os
+import sys
+import copy
+import time
+import shutil
+import numpy as np
+
+from PyRAI2MD.methods import load_backend
+from PyRAI2MD.Machine_Learning.training_data import Data
+from PyRAI2MD.Utils.timing import what_is_time
+from PyRAI2MD.Utils.timing import how_long
+
+class Distillation:
+    """ Distillation of a trained NN ensemble into a compact student model
+
+        Parameters:          Type:
+            keywords         dict        keyword dictionary
+
+        Attribute:           Type:
+            title            str         calculation title
+            teacher          str         path to the teacher models
+            student          str         title of the selected student, saved as NN-<student>
+            queue            list        student architectures [layers, nodes]
+            perturb          int         number of displaced copies of each training geometry
+            displace         float       standard deviation of the random displacements in Angstrom
+            tolerance        float       allowed ratio of student to teacher errors for the selection
+            uncertainty      str         uncertainty mode of the students, None to use the &nn setting
+            data             class       training data and evaluation data
+            nlabel           int         number of teacher labeled geometries
+            ndrop            int         number of displaced geometries outside the teacher domain
+
+        Functions:           Returns:
+            run              None        train students and select the production model
+
+    """
+
+    def __init__(self, keywords=None):
+        variables = keywords['nn']['distill']
+        self.version = keywords['version']
+        self.title = keywords['control']['title']
+        self.qm = keywords['control']['qm']
+        self.seed = keywords['control']['gl_seed']
+
+        if self.qm != 'nn':
+            sys.exit('\n  KeyError\n  PyRAI2MD: distillation requires qm nn, found %s' % self.qm)
+
+        ## the teacher is the model of the &nn section by default
+        self.teacher = variables['teacher']
+        if self.teacher is None:
+            self.teacher = keywords['nn']['modeldir']
+        if self.teacher is None:
+            self.teacher = 'NN-%s' % self.title
+
+        if not os.path.exists(self.teacher):
+            sys.exit('\n  FileNotFoundError\n  PyRAI2MD: looking for teacher models %s' % self.teacher)
+
+        self.student = variables['student']
+        if self.student is None:
+            self.student = '%s-student' % self.title
+
+        ## students are smaller than the teacher by default
+        gr_layers = variables['depth']
+        gr_nodes = variables['nn_size']
+
+        if len(gr_layers) == 0:
+            gr_layers = [keywords['nn']['eg']['depth']]
+
+        if len(gr_nodes) == 0:
+            gr_nodes = [max(keywords['nn']['eg']['nn_size'] // 2, 1)]
+
+        self.queue = []
+        for a in gr_layers:
+            for b in gr_nodes:
+                self.queue.append([a, b])
+
+        self.perturb = max(variables['perturb'], 0)
+        self.displace = variables['displace']
+        self.tolerance = variables['tolerance']
+        self.uncertainty = variables['uncertainty']
+        self.nlabel = 0
+        self.ndrop = 0
+
+        ## the data object is passed to each model after copying the keywords
+        self.keywords = copy.deepcopy(keywords)
+        self.keywords['nn']['data'] = None
+        train_data = keywords['nn']['train_data']
+        pred_data = keywords['nn']['pred_data']
+        self.data = Data()
+        self.data.load(train_data)
+        if pred_data is not None and os.path.exists(pred_data):
+            self.data.load(pred_data, filetype='prediction')
+        self.data.stat()
+
+    def _model(self, title, modeldir, data, hypers=None):
+        ## This function creates a NN model with the keywords of this job
+        keywords = copy.deepcopy(self.keywords)
+        keywords['control']['title'] = title
+        keywords['control']['jobtype'] = 'train'
+        variables = keywords['nn']
+        variables['modeldir'] = modeldir
+        variables['train_mode'] = 'training'
+        variables['data'] = data
+
+        if hypers is not None:
+            layers, nodes = hypers
+            for name in ['eg', 'nac', 'soc', 'eg2', 'nac2', 'soc2']:
+                variables[name]['depth'] = layers
+                variables[name]['nn_size'] = nodes
+
+            if self.uncertainty is not None:
+                variables['uncertainty'] = self.uncertainty
+
+        return load_backend(self.qm)(keywords=keywords, job_id=None)
+
+    def _reference(self):
+        ## reference data of the evaluation set, the prediction set if available or the training set
+        if len(self.data.pred_geos) > 0:
+            geos = self.data.pred_geos
+            ref = {
+                'energy': self.data.pred_energy,
+                'gradient': self.data.pred_grad,
+                'nac': self.data.pred_nac,
+                'soc': self.data.pred_soc,
+            }
+            source = 'prediction set'
+        else:
+            geos = self.data.geos
+            ref = {
+                'energy': self.data.energy,
+                'gradient': self.data.grad,
+                'nac': self.data.nac,
+                'soc': self.data.soc,
+            }
+            source = 'training set'
+
+        return geos, ref, source
+
+    def _label(self, teacher):
+        ## This function labels the training geometries and their random displacements with the teacher
+        ndata = len(self.data.geos)
+        index = np.concatenate([np.arange(ndata) for _ in range(self.perturb + 1)])
+        data = self.data.subset(index)
+        rng = np.random.default_rng(self.seed)
+        geos = np.array(data.geos, dtype=float)
+        geos[ndata:] += rng.normal(0, self.displace, geos[ndata:].shape)
+        data.geos = geos.astype(self.data.geos.dtype)
+
+        prop = teacher.infer(data.geos)
+
+        ## displaced geometries where the teacher is less certain than on any training geometry are dropped
+        keep = np.ones(len(index), dtype=bool)
+        for key, (_, std) in prop.items():
+            max_std = np.amax(std.reshape((len(index), -1)), axis=1)
+            keep[ndata:] &= max_std[ndata:] <= np.amax(max_std[0: ndata])
+
+        if 'energy' in prop.keys():
+            data.energy = prop['energy'][0]
+            data.grad = prop['gradient'][0]
+
+        if 'nac' in prop.keys():
+            data.nac = prop['nac'][0]
+
+        if 'soc' in prop.keys():
+            data.soc = prop['soc'][0]
+
+        data = data.subset(np.argwhere(keep).reshape(-1))
+        self.nlabel = len(data.geos)
+        self.ndrop = len(index) - self.nlabel
+
+        return data
+
+    @staticmethod
+    def _errors(prop, ref):
+        ## mean absolute errors of each property to the reference
+        err = {}
+        for key, (pred, _) in prop.items():
+            if key in ref.keys() and np.size(ref[key]) == np.size(pred):
+                err[key] = np.mean(np.abs(np.array(ref[key]).reshape(pred.shape) - pred))
+
+        return err
+
+    def _select(self, results):
+        ## This function selects the fastest student within the error tolerance, or the most accurate one
+        teacher_err = results[0]['ref']
+        selected = None
+        best = None
+        for res in results[1:]:
+            if res['status'] == 0:
+                continue
+
+            ratio = [res['ref'][key] / teacher_err[key] for key in teacher_err.keys()
+                     if key in res['ref'].keys() and teacher_err[key] > 0]
+            res['ratio'] = np.amax(ratio) if len(ratio) > 0 else 0
+
+            if res['ratio'] <= self.tolerance and (selected is None or res['time'] < selected['time']):
+                selected = res
+
+            if best is None or res['ratio'] < best['ratio']:
+                best = res
+
+        if selected is None:
+            selected = best
+
+        return selected
+
+    def _write_summary(self, results, selected, source):
+        keys = list(results[0]['ref'].keys())
+        teacher_time = results[0]['time']
+
+        summary = """
+  &distillation accuracy/speed
+-------------------------------------------------------
+  Teacher labeled geometries: %s  dropped displacements: %s
+  Errors in au, SOC in cm-1, to the reference data of the %s and to the teacher
+
+  Model                          Layers   Nodes  %s  %s   Time/step(s)   Speedup
+""" % (self.nlabel, self.ndrop, source,
+       ' '.join(['%14s' % ('%s(ref)' % key) for key in keys]),
+       ' '.join(['%14s' % ('%s(tch)' % key) for key in keys]))
+
+        crashed = ''
+        for res in results:
+            if res['status'] == 0:
+                crashed += '%s\n' % res['path']
+                continue
+
+            ref_err = ' '.join(['%14.8f' % res['ref'].get(key, 0) for key in keys])
+            tch_err = ' '.join(['%14.8f' % res['teacher'].get(key, 0) for key in keys])
+            summary += '  %-30s %6s %7s  %s  %s %14.6f %9.2f\n' % (
+                res['name'], res['layers'], res['nodes'], ref_err, tch_err, res['time'],
+                teacher_time / max(res['time'], 1e-12))
+
+        if selected is not None:
+            summary += '\n  Selected student: %s saved as NN-%s\n' % (selected['name'], self.student)
+        else:
+            summary += '\n  No student was trained successfully\n'
+
+        summary += '-------------------------------------------------------\n'
+
+        print(summary)
+        with open('%s.log' % self.title, 'a') as log:
+            log.write(summary)
+
+        if len(crashed) > 0:
+            with open('%s.crashed' % self.title, 'w') as log:
+                log.write(crashed)
+
+        return self
+
+    def _heading(self):
+
+        headline = """
+%s
+ *---------------------------------------------------*
+ |                                                   |
+ |                  Distillation                     |
+ |                                                   |
+ *---------------------------------------------------*
+
+ Teacher:            %s
+ Number of students: %s
+
+""" % (self.version, self.teacher, len(self.queue))
+
+        return headline
+
+    def run(self):
+        start = time.time()
+        heading = 'Distillation Start: %20s\n%s' % (what_is_time(), self._heading())
+
+        with open('%s.log' % self.title, 'w') as log:
+            log.write(heading)
+
+        geos, ref, source = self._reference()
+
+        ## teacher labels and errors
+        teacher = self._model(self.title, self.teacher, self.data).load()
+        teacher_prop = teacher.infer(geos)
+        teacher_ref = {key: val[0] for key, val in teacher_prop.items()}
+        results = [{
+            'name': 'teacher',
+            'layers': self.keywords['nn']['eg']['depth'],
+            'nodes': self.keywords['nn']['eg']['nn_size'],
+            'ref': self._errors(teacher_prop, ref),
+            'teacher': {key: 0 for key in teacher_prop.keys()},
+            'time': teacher.step_time(geos[0: 1]),
+            'path': self.teacher,
+            'status': 1,
+        }]
+        data = self._label(teacher)
+
+        ## train each student on the teacher labels and evaluate it as a production model
+        for layers, nodes in self.queue:
+            name = '%s-%s-%s' % (self.student, layers, nodes)
+            res = {'name': name, 'layers': layers, 'nodes': nodes, 'path': 'NN-%s' % name, 'status': 0}
+            metrics = self._model(name, None, data, [layers, nodes]).train()
+            if metrics['status'] == 1:
+                student = self._model(name, None, data, [layers, nodes]).load()
+                student_prop = student.infer(geos)
+                res['ref'] = self._errors(student_prop, ref)
+                res['teacher'] = self._errors(student_prop, teacher_ref)
+                res['time'] = student.step_time(geos[0: 1])
+                res['status'] = 1
+            results.append(res)
+
+        ## the selected student is saved in the layout DNN.load reads
+        selected = self._select(results)
+        if selected is not None:
+            path = 'NN-%s' % self.student
+            if os.path.exists(path):
+                shutil.rmtree(path)
+            shutil.copytree(selected['path'], path)
+
+        self._write_summary(results, selected, source)
+
+        end = time.time()
+        walltime = how_long(start, end)
+        tailing = 'Distillation End: %20s Total: %20s\n' % (what_is_time(), walltime)
+
+        with open('%s.log' % self.title, 'a') as log:
+            log.write(tailing)
+
+        return self
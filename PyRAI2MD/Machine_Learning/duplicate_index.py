@@ -0,0 +1,254 @@
+######################################################
+#
+# PyRAI2MD 2 module for near-duplicate detection of training geometries
+#
+# Author Jingbai Li
+# Oct 18 2026
+#
+######################################################
+
+import numpy as np
+
+from PyRAI2MD.Dynamics.reset_velocity import kabsch
+
+def invd_fingerprint(geos):
+    ## This function computes the sorted inverse distances of each geometry
+    ## the fingerprint does not change with translation, rotation and permutation of atoms
+    geos = np.asarray(geos, dtype=float)
+    if len(geos.shape) == 2:
+        geos = geos.reshape((1, -1, 3))
+
+    natom = geos.shape[1]
+    i, j = np.triu_indices(natom, k=1)
+    dist = np.sqrt(np.sum((geos[:, i, :] - geos[:, j, :]) ** 2, axis=2))
+    fingerprint = np.sort(1 / np.maximum(dist, 1e-8), axis=1)
+
+    return fingerprint
+
+def assignment(cost):
+    ## This function solves the linear assignment problem of a square cost matrix by the Hungarian algorithm
+    ## it returns the column assigned to each row with the least total cost
+    cost = np.asarray(cost, dtype=float)
+    n = len(cost)
+    u = np.zeros(n + 1)
+    v = np.zeros(n + 1)
+    row = np.zeros(n + 1, dtype=int)  # row assigned to each column, counted from 1
+    way = np.zeros(n + 1, dtype=int)
+    for i in range(1, n + 1):
+        row[0] = i
+        j0 = 0
+        minv = np.full(n + 1, np.inf)
+        used = np.zeros(n + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            free = ~used[1:]
+            reduced = cost[row[j0] - 1] - u[row[j0]] - v[1:]
+            better = free & (reduced < minv[1:])
+            minv[1:][better] = reduced[better]
+            way[1:][better] = j0
+            remain = np.where(free, minv[1:], np.inf)
+            j1 = int(np.argmin(remain)) + 1
+            delta = remain[j1 - 1]
+            u[row[used]] += delta
+            v[used] -= delta
+            minv[1:][free] -= delta
+            j0 = j1
+            if row[j0] == 0:
+                break
+
+        ## augment along the alternating path
+        while j0 != 0:
+            j1 = way[j0]
+            row[j0] = row[j1]
+            j0 = j1
+
+    col = np.zeros(n, dtype=int)
+    col[row[1:] - 1] = np.arange(n)
+
+    return col
+
+def _rotation(p, q):
+    ## This function returns the Kabsch rotation of centered p onto centered q
+    v, s, w = np.linalg.svd(np.dot(np.transpose(p), q))
+    if np.linalg.det(v) * np.linalg.det(w) < 0:
+        v[:, -1] = -v[:, -1]
+
+    return np.dot(v, w)
+
+def _match_elements(atoms, cost):
+    ## This function assigns the atoms of p to the atoms of q within each element
+    ## cost[i, j] is the cost to place atom j of p at atom i of q
+    order = np.arange(len(atoms))
+    for element in np.unique(atoms):
+        index = np.argwhere(atoms == element).reshape(-1)
+        if len(index) > 1:
+            order[index] = index[assignment(cost[np.ix_(index, index)])]
+
+    return order
+
+def match_atoms(atoms, p, q, maxiter=5):
+    ## This function reorders the atoms of p to match q, atoms are only exchanged within the same element
+    ## the first match compares the sorted distances of each atom, which do not change with rotation,
+    ## the later matches compare the positions after Kabsch rotation until the order does not change
+    atoms = np.array(atoms).astype(str).reshape(-1)
+    p = np.asarray(p, dtype=float)
+    q = np.asarray(q, dtype=float)
+    p = p - np.mean(p, axis=0)
+    q = q - np.mean(q, axis=0)
+    dist_p = np.sort(np.sqrt(np.sum((p[:, None, :] - p[None, :, :]) ** 2, axis=2)), axis=1)
+    dist_q = np.sort(np.sqrt(np.sum((q[:, None, :] - q[None, :, :]) ** 2, axis=2)), axis=1)
+    order = _match_elements(atoms, np.sqrt(np.sum((dist_q[:, None, :] - dist_p[None, :, :]) ** 2, axis=2)))
+
+    for _ in range(maxiter):
+        p_rot = np.dot(p, _rotation(p[order], q))
+        new_order = _match_elements(atoms, np.sum((q[:, None, :] - p_rot[None, :, :]) ** 2, axis=2))
+        if np.array_equal(new_order, order):
+            break
+        order = new_order
+
+    return order
+
+def aligned_rmsd(p, q, atoms=None):
+    ## This function computes the RMSD between two geometries after centering and Kabsch rotation
+    ## if the atom list is given, atoms of the same element are matched first, so permuted copies are aligned
+    p = np.asarray(p, dtype=float)
+    q = np.asarray(q, dtype=float)
+    p = p - np.mean(p, axis=0)
+    q = q - np.mean(q, axis=0)
+    rmsd = kabsch(p, q)
+
+    if atoms is not None and rmsd > 0:
+        rmsd = min(rmsd, kabsch(p[match_atoms(atoms, p, q)], q))
+
+    return rmsd
+
+class DuplicateIndex:
+    """ Near-duplicate index of geometries
+
+        Parameters:          Type:
+            tol              float       tolerance of the root-mean-square difference of fingerprints in 1/Angstrom
+            rmsd             float       tolerance of the aligned RMSD in Angstrom to confirm a duplicate, 0 to skip,
+                                         atoms of the same element are matched before the alignment
+
+        Attribute:           Type:
+            tol              float       tolerance of the fingerprint difference
+            rmsd             float       tolerance of the aligned RMSD
+            groups           dict        fingerprints, geometries and norms of each composition
+            size             int         number of indexed geometries
+
+        Functions:           Returns:
+            add              self        add geometries to the index
+            find             list        index of the first duplicate of each geometry, -1 if none
+            filter           list        index of geometries that are neither indexed nor repeated
+
+    """
+
+    def __init__(self, tol=0.01, rmsd=0):
+        self.tol = tol
+        self.rmsd = rmsd
+        self.groups = {}
+        self.size = 0
+
+    @staticmethod
+    def _comp(atoms):
+        return tuple([str(x) for x in atoms])
+
+    @staticmethod
+    def _sort(group):
+        ## new geometries are merged on the next search and all are sorted by the fingerprint norm
+        ## by the triangle inequality, duplicates lie in a window of the norm
+        if len(group['new_fp']) > 0:
+            group['fp'] = np.concatenate([group['fp']] + group['new_fp'], axis=0)
+            group['geos'] = np.concatenate([group['geos']] + group['new_geos'], axis=0)
+            group['new_fp'] = []
+            group['new_geos'] = []
+            norm = np.sqrt(np.sum(group['fp'] ** 2, axis=1))
+            group['order'] = np.argsort(norm)
+            group['norm'] = norm[group['order']]
+
+        return group
+
+    def add(self, atoms, geos):
+        ## atoms is a list of atom lists, geos is an array of coordinates
+        geos = np.asarray(geos, dtype=float).reshape((len(atoms), -1, 3))
+        for n, atom in enumerate(atoms):
+            comp = self._comp(atom)
+            if comp not in self.groups:
+                natom = len(comp)
+                self.groups[comp] = {
+                    'fp': np.zeros((0, natom * (natom - 1) // 2)),
+                    'geos': np.zeros((0, natom, 3)),
+                    'new_fp': [],
+                    'new_geos': [],
+                    'index': [],
+                }
+            group = self.groups[comp]
+            group['new_fp'].append(invd_fingerprint(geos[n]))
+            group['new_geos'].append(geos[n: n + 1])
+            group['index'].append(self.size)
+            self.size += 1
+
+        return self
+
+    def _same(self, fp, geos, candidate, fingerprint, geo, atoms):
+        ## return the first candidate within the tolerance, the closest fingerprint first
+        diff = np.sqrt(np.mean((fp[candidate] - fingerprint) ** 2, axis=1))
+        for n in np.argsort(diff):
+            if diff[n] > self.tol:
+                break
+
+            if self.rmsd <= 0 or aligned_rmsd(geos[candidate[n]], geo, atoms) <= self.rmsd:
+                return candidate[n]
+
+        return -1
+
+    def _match(self, atoms, geo):
+        comp = self._comp(atoms)
+        if comp not in self.groups:
+            return -1
+
+        group = self._sort(self.groups[comp])
+        fingerprint = invd_fingerprint(geo)[0]
+        ## the rms difference bounds the norm difference times the square root of the fingerprint length
+        window = self.tol * np.sqrt(len(fingerprint))
+        center = np.sqrt(np.sum(fingerprint ** 2))
+        start = np.searchsorted(group['norm'], center - window, side='left')
+        end = np.searchsorted(group['norm'], center + window, side='right')
+        candidate = group['order'][start: end]
+        if len(candidate) == 0:
+            return -1
+
+        n = self._same(group['fp'], group['geos'], candidate, fingerprint, geo, comp)
+        if n < 0:
+            return -1
+
+        return group['index'][n]
+
+    def find(self, atoms, geos):
+        geos = np.asarray(geos, dtype=float).reshape((len(atoms), -1, 3))
+        match = [self._match(atom, geos[n]) for n, atom in enumerate(atoms)]
+
+        return match
+
+    def filter(self, atoms, geos, update=True):
+        ## This function returns the index of geometries that are not in the index and not repeated in the input
+        ## the kept geometries are added to the index if update is set
+        geos = np.asarray(geos, dtype=float).reshape((len(atoms), -1, 3))
+        keep = []
+        for n, atom in enumerate(atoms):
+            if self._match(atom, geos[n]) >= 0:
+                continue
+
+            ## compare with the kept geometries of the same composition in the input
+            kept = [m for m in keep if self._comp(atoms[m]) == self._comp(atom)]
+            if len(kept) > 0:
+                fp = invd_fingerprint(geos[kept])
+                if self._same(fp, geos[kept], np.arange(len(kept)), invd_fingerprint(geos[n])[0], geos[n], atom) >= 0:
+                    continue
+
+            keep.append(n)
+
+        if update:
+            self.add([atoms[n] for n in keep], geos[keep])
+
+        return keep
@@ -8,17 +8,40 @@
 ######################################################
 
 import os
+import sys
+import json
+import copy
 import time
+import hashlib
 import multiprocessing
 import numpy as np
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 from PyRAI2MD.methods import QM
 from PyRAI2MD.Machine_Learning.remote_train import RemoteTrain
 from PyRAI2MD.Machine_Learning.training_data import Data
+from PyRAI2MD.Machine_Learning.data_store import DataStore
+from PyRAI2MD.Machine_Learning.data_store import is_store
+from PyRAI2MD.Machine_Learning.training_scheduler import JobPacker
 from PyRAI2MD.Utils.timing import what_is_time
 from PyRAI2MD.Utils.timing import how_long
 
 
+def data_hash(data):
+    ## This function hashes the content of training data, independent of its file name and format
+    md5 = hashlib.md5()
+    md5.update(json.dumps([list(x) for x in data.species]).encode())
+    for array in [data.composition, data.geos, data.energy, data.grad, data.nac, data.soc]:
+        array = np.ascontiguousarray(array)
+        md5.update(str(array.shape).encode())
+        md5.update(array.tobytes())
+
+    return md5.hexdigest()
+
 class GridSearch:
     """ Grid search class
 
@@ -32,8 +55,23 @@ class GridSearch:
             l1               list        list of l1 regularization factor
             l2               list        list of l2 regularization factor
             dropout          list        list of dropout ratio
-            use_hpc          int         use HPC (1) for calculation or not(0), like SLURM
+            use_hpc          int         use HPC (1) for calculation or not(0), like SLURM, or pack local jobs (2)
+            ncore            int         number of cores to pack local jobs, 0 to use all available cores
+            job_threads      int         number of threads per local job, 0 to choose from the number of jobs
+            job_memory       int         memory per local job in MB, 0 to skip the memory limit
             retrieve         int         retrieve training metrics
+            mode             str         search all grid points (grid) or by successive halving (halving)
+            eta              int         keep 1/eta of the configurations at each halving rung
+            min_budget       float       fraction of epochs and training data at the first rung
+            sample           int         number of grid points sampled for the first rung, 0 to use all
+            surrogate        int         number of grid points proposed by a surrogate model after the first rung
+            ledger           str         checkpoint file of the successive halving search
+            memo             str         file of trained configurations shared by searches
+            data_hash        str         hash of the training data
+            rung_hash        str         hash of the training data of the current rung
+            ncached          int         number of configurations taken from the memo
+            ntrained         int         number of trained configurations
+            base_epochs      dict        epoch settings of each NN before scaling by the budget
 
 
         Functions:           Returns:
@@ -85,10 +123,35 @@ class GridSearch:
         self.ml_ncpu = keywords['control']['ml_ncpu']
         self.use_hpc = keywords['nn']['search']['use_hpc']
         self.retrieve = keywords['nn']['search']['retrieve']
+        self.ncore = keywords['nn']['search']['ncore']
+        self.job_threads = keywords['nn']['search']['job_threads']
+        self.job_memory = keywords['nn']['search']['job_memory']
+        self.mode = keywords['nn']['search']['mode']
+        self.eta = max(keywords['nn']['search']['eta'], 2)
+        self.min_budget = min(max(keywords['nn']['search']['min_budget'], 1e-3), 1)
+        self.sample = keywords['nn']['search']['sample']
+        self.surrogate = keywords['nn']['search']['surrogate']
+        self.seed = keywords['control']['gl_seed']
+        self.ledger = '%s/grid-search/%s-halving.json' % (os.getcwd(), self.title)
+        self.memo = keywords['nn']['search']['memo']
+        if self.memo is None:
+            self.memo = '%s/grid-search/memo.json' % os.getcwd()
+        self.ncached = 0
+        self.ntrained = 0
+        self.rung_data = None
+        self.rung_train_data = None
+        self.base_epochs = {}
+        for name in ['eg', 'nac', 'soc', 'eg2', 'nac2', 'soc2']:
+            self.base_epochs[name] = {
+                key: copy.deepcopy(val) for key, val in keywords['nn'][name].items()
+                if key in ['epo', 'epomin', 'pre_epo', 'epostep', 'epoch_step_reduction']
+            }
         train_data = keywords[self.qm]['train_data']
         self.data = Data()
         self.data.load(train_data)
         self.data.stat()
+        self.data_hash = data_hash(self.data)
+        self.rung_hash = self.data_hash
 
         title = self.keywords['nn']['train_data'].split('/')
         if len(title) == 1:
@@ -138,6 +201,20 @@ class GridSearch:
 
         return variables, key
 
+    def _update_budget(self, keywords, budget):
+        ## scale the epochs from the input settings, so a budget is never applied twice
+        variables = keywords.copy()
+        for name, base in self.base_epochs.items():
+            hyp = variables['nn'][name]
+            hyp['epo'] = max(int(np.ceil(base['epo'] * budget)), 1)
+            hyp['epomin'] = min(int(base['epomin'] * budget), hyp['epo'])
+            hyp['epostep'] = min(base['epostep'], hyp['epo'])
+            hyp['epoch_step_reduction'] = [max(int(x * budget), 1) for x in base['epoch_step_reduction']]
+            if 'pre_epo' in base:
+                hyp['pre_epo'] = max(int(base['pre_epo'] * budget), 1)
+
+        return variables
+
     def _retrieve_data(self):
         ## retrieve training results in sequential or parallel mode
         variables_wrapper = [[n, x] for n, x in enumerate(self.queue)]
@@ -157,30 +234,152 @@ class GridSearch:
 
         return results
 
-    def _run_search_seq(self):
-        ## run training in sequential mode
+    def _run_search(self):
+        ## run training of all grid points in sequential or parallel mode
         variables_wrapper = [[n, x] for n, x in enumerate(self.queue)]
+        results = self._run_jobs(variables_wrapper)
 
-        ## sequential mode
-        ncpu = 1
+        return [results[n] for n in range(self.nsearch)]
+
+    def _run_jobs(self, variables_wrapper, done=None):
+        ## train the jobs that are not in the memo, done(grid_id, metrics) is called after each job
+        cached, todo = self._recall(variables_wrapper)
+        self.ncached += len(cached)
+        self.ntrained += len(todo)
+        results = {}
+        jobs = {x[0]: x for x in todo}
+
+        def record(grid_id, grid_results):
+            results[grid_id] = grid_results
+            if grid_id in jobs.keys():
+                self._memorize(jobs[grid_id], grid_results)
+            if done is not None:
+                done(grid_id, grid_results)
+
+        for grid_id, grid_results in cached.items():
+            record(grid_id, grid_results)
+
+        if len(todo) == 0:
+            return results
+
+        ## pack local jobs on the node cores
+        if self.use_hpc > 1:
+            self._run_packed(todo, record)
+            return results
+
+        ## adjust multiprocessing if necessary
+        if self.use_hpc > 0:
+            ncpu = np.amin([len(todo), self.ml_ncpu])
+            wrapper = self._search_wrapper_hpc
+        else:
+            ncpu = 1
+            wrapper = self._search_wrapper_seq
 
         ## start multiprocessing
-        results = [[] for _ in range(self.nsearch)]
         pool = multiprocessing.Pool(processes=ncpu)
-        for val in pool.imap_unordered(self._search_wrapper_seq, variables_wrapper):
-            grid_id, grid_results = val
-            results[grid_id] = grid_results
+        for val in pool.imap_unordered(wrapper, todo):
+            record(*val)
         pool.close()
 
         return results
 
+    def _job_keywords(self, variables, nthreads=None):
+        ## resolved keywords and folder name of a job, jobs running in threads must not share the keyword dict
+        hypers = variables[1]
+        keywords, key = self._update_hypers(copy.deepcopy(self.keywords), hypers)
+        keywords[self.qm]['train_mode'] = 'training'
+        if nthreads is not None:
+            keywords['control']['ml_ncpu'] = nthreads
+
+        ## successive halving trains with a fraction of epochs and data in a folder per rung
+        if len(variables) > 2:
+            rung, budget = variables[2]
+            keywords = self._update_budget(keywords, budget)
+            keywords[self.qm]['train_data'] = self.rung_train_data
+            key = '%s-r%s' % (key, rung)
+
+        return keywords, key
+
+    def _memo_key(self, variables):
+        ## hash of the training data, method, resolved hyperparameters and training mode
+        ## paths and runtime settings do not change the trained model
+        keywords, _ = self._job_keywords(variables)
+        skip = ['search', 'data', 'train_data', 'pred_data', 'modeldir', 'silent', 'gpu', 'executor', 'feature_cache']
+        content = {
+            'data': self.rung_hash if len(variables) > 2 else self.data_hash,
+            'qm': self.qm,
+            'train_mode': keywords[self.qm]['train_mode'],
+            'hypers': {key: val for key, val in keywords[self.qm].items() if key not in skip},
+        }
+        key = hashlib.md5(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+
+        return key
+
+    def _lock_memo(self):
+        ## searches sharing the memo take turns to read and update it
+        memo_dir = os.path.dirname(self.memo)
+        if len(memo_dir) > 0 and not os.path.exists(memo_dir):
+            os.makedirs(memo_dir, exist_ok=True)
+
+        lock = open('%s.lock' % self.memo, 'w')
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+        return lock
+
+    def _load_memo(self):
+        if not os.path.exists(self.memo):
+            return {}
+
+        with open(self.memo, 'r') as infile:
+            memo = json.load(infile)
+
+        return memo
+
+    def _recall(self, variables_wrapper):
+        ## split jobs into finished ones in the memo and jobs to train
+        ## a configuration whose model folder was removed is trained again
+        with self._lock_memo():
+            memo = self._load_memo()
+
+        cached = {}
+        todo = []
+        for variables in variables_wrapper:
+            key = self._memo_key(variables)
+            if key in memo.keys() and os.path.exists(memo[key]['path']):
+                cached[variables[0]] = memo[key]['metrics']
+            else:
+                todo.append(variables)
+
+        return cached, todo
+
+    def _memorize(self, variables, metrics):
+        ## add a finished training to the memo, the file is read again under the lock so concurrent searches are merged
+        if metrics['status'] != 1:
+            return self
+
+        key = self._memo_key(variables)
+        with self._lock_memo():
+            memo = self._load_memo()
+            memo[key] = {
+                'hypers': list(variables[1]),
+                'budget': variables[2][1] if len(variables) > 2 else 1,
+                'path': metrics['path'],
+                'metrics': metrics,
+            }
+            tmp = '%s.%s.tmp' % (self.memo, os.getpid())
+            with open(tmp, 'w') as outfile:
+                json.dump(memo, outfile)
+            os.replace(tmp, self.memo)
+
+        return self
+
     def _search_wrapper_seq(self, variables):
-        grid_id, hypers = variables
+        grid_id = variables[0]
 
         ## update hypers and add training data
-        keywords, key = self._update_hypers(self.keywords, hypers)
-        keywords[self.qm]['train_mode'] = 'training'
-        keywords[self.qm]['data'] = self.data
+        keywords, key = self._job_keywords(variables)
+        keywords[self.qm]['data'] = self.rung_data if len(variables) > 2 else self.data
         maindir = os.getcwd()
         calcdir = '%s/grid-search/NN-%s-%s' % (os.getcwd(), self.title, key)
 
@@ -195,41 +394,55 @@ class GridSearch:
 
         return grid_id, metrics
 
-    def _run_search_hpc(self):
-        ## wrap variables for multiprocessing
-        variables_wrapper = [[n, x] for n, x in enumerate(self.queue)]
+    def _run_packed(self, variables_wrapper, done=None):
+        ## run local jobs in threads, each job is a subprocess pinned to its core set
+        ## done(grid_id, metrics) is called after each job
+        packer = JobPacker(self.ncore, self.job_threads, self.job_memory)
+        jobs = [['grid %s' % x[0], self._search_wrapper_packed, [x], self._job_work(x)] for x in variables_wrapper]
 
-        ## adjust multiprocessing if necessary
-        ncpu = np.amin([self.nsearch, self.ml_ncpu])
+        def record(_, val):
+            if done is not None:
+                done(*val)
 
-        ## start multiprocessing
-        results = [[] for _ in range(self.nsearch)]
-        pool = multiprocessing.Pool(processes=ncpu)
-        for val in pool.imap_unordered(self._search_wrapper_hpc, variables_wrapper):
-            grid_id, grid_results = val
-            results[grid_id] = grid_results
-        pool.close()
+        results = packer.run(jobs, record)
 
-        return results
+        with open('%s/%s.log' % (os.getcwd(), self.title), 'a') as log:
+            log.write(packer.summary())
+
+        return [results[job[0]][1] for job in jobs]
+
+    def _job_work(self, variables):
+        ## nominal number of training samples of a job to measure the throughput
+        if len(variables) > 2:
+            budget = variables[2][1]
+            epochs = max(int(np.ceil(self.base_epochs['eg']['epo'] * budget)), 1)
+            return epochs * len(self.rung_data.geos)
+
+        return self.base_epochs['eg']['epo'] * len(self.data.geos)
+
+    def _search_wrapper_packed(self, cores, nthreads, variables):
+        return self._search_wrapper_hpc(variables, cores, nthreads)
 
-    def _search_wrapper_hpc(self, variables):
-        grid_id, hypers = variables
+    def _search_wrapper_hpc(self, variables, cores=None, nthreads=None):
+        grid_id = variables[0]
 
         ## update hypers
-        keywords, key = self._update_hypers(self.keywords, hypers)
-        keywords[self.qm]['train_mode'] = 'training'
+        keywords, key = self._job_keywords(variables, nthreads)
 
         ## remote training in subprocess
         model = RemoteTrain(keywords=keywords, id=key)
-        metrics = model.train()
+        metrics = model.train(cores, nthreads)
 
         return grid_id, metrics
 
-    def _write_summary(self, metrics):
+    def _write_summary(self, metrics, queue=None):
         logpath = os.getcwd()
+        if queue is None:
+            queue = self.queue
+
         summary = '  Layers   Nodes   Batch    L1        L2       Dropout    Energy1    Gradient1    NAC1        SOC1        Energy2    Gradient2    NAC2        SOC2        Time     Walltime\n'
         crashed = ''
-        for n, hypers in enumerate(self.queue):
+        for n, hypers in enumerate(queue):
 
             if metrics[n]['status'] == 0:
                 crashed += '%s\n' % (metrics[n]['path'])
@@ -273,6 +486,188 @@ class GridSearch:
 
         return self
 
+    def _rung_budgets(self):
+        ## budgets grow by eta from min_budget to the full training
+        budgets = [1.0]
+        while budgets[0] / self.eta >= self.min_budget * (1 - 1e-8):
+            budgets.insert(0, budgets[0] / self.eta)
+
+        return budgets
+
+    def _load_ledger(self, budgets):
+        ## resume the search only if the grid and budgets are unchanged
+        if not os.path.exists(self.ledger):
+            return None
+
+        with open(self.ledger, 'r') as infile:
+            state = json.load(infile)
+
+        if state['queue'] != self.queue or not np.allclose(state['budgets'], budgets):
+            sys.exit('\n  ValueError\n  PyRAI2MD: %s was written for a different search, remove it to start over' % (
+                self.ledger))
+
+        return state
+
+    def _save_ledger(self, state):
+        ## the checkpoint is replaced in one step
+        tmp = '%s.tmp' % self.ledger
+        with open(tmp, 'w') as outfile:
+            json.dump(state, outfile)
+        os.replace(tmp, self.ledger)
+
+        return self
+
+    def _prepare_rung_data(self, state, rung, budget):
+        ## the training data of each rung is a fixed random fraction, nested in the data of the next rung
+        ## at least 200 data points are kept so the validation split stays meaningful
+        size = len(self.data.geos)
+        ndata = min(max(int(budget * size), 200), size)
+        if ndata == size:
+            self.rung_data = self.data
+            self.rung_hash = self.data_hash
+            self.rung_train_data = self.keywords[self.qm]['train_data']
+            return ndata
+
+        self.rung_data = self.data.subset(state['data_order'][0: ndata])
+        self.rung_hash = data_hash(self.rung_data)
+        self.rung_train_data = '%s/grid-search/%s-data-r%s' % (os.getcwd(), self.title, rung)
+        if self.use_hpc > 0 and not is_store(self.rung_train_data):
+            store = DataStore(self.rung_train_data).create(
+                self.rung_data.natom, self.rung_data.nstate, self.rung_data.nnac, self.rung_data.nsoc)
+            store.append(self.rung_data.columns(), tag='rung %s' % rung)
+
+        return ndata
+
+    def _train_rung(self, state, rung, budget, grid_ids):
+        ## train the configurations without results and checkpoint after each of them
+        results = state['rungs'][rung]['metrics']
+        todo = [n for n in grid_ids if str(n) not in results]
+        if len(todo) == 0:
+            return self
+
+        variables_wrapper = [[n, self.queue[n], [rung, budget]] for n in todo]
+
+        def done(grid_id, grid_results):
+            results[str(grid_id)] = grid_results
+            self._save_ledger(state)
+
+        self._run_jobs(variables_wrapper, done)
+
+        return self
+
+    @staticmethod
+    def _score(metrics):
+        ## sum of the errors relative to their median in the rung, crashed training are ranked last
+        keys = ['e1', 'g1', 'n1', 's1', 'e2', 'g2', 'n2', 's2']
+        done = [n for n, x in metrics.items() if x['status'] == 1]
+        score = {n: np.inf for n in metrics.keys()}
+        if len(done) == 0:
+            return score
+
+        errors = np.array([[metrics[n][k] for k in keys] for n in done])
+        median = np.median(errors, axis=0)
+        median[median == 0] = 1
+        for n, err in zip(done, errors):
+            score[n] = float(np.sum(err / median))
+
+        return score
+
+    def _encode(self):
+        ## map each hyperparameter to [0, 1], on a log scale if it spans more than a decade
+        x = np.array(self.queue).astype(float)
+        for n in range(x.shape[1]):
+            col = x[:, n]
+            if np.amin(col) > 0 and np.amax(col) / np.amin(col) > 10:
+                col = np.log10(col)
+            width = np.amax(col) - np.amin(col)
+            x[:, n] = (col - np.amin(col)) / width if width > 0 else 0
+
+        return x
+
+    def _propose(self, state, nprop):
+        ## fit a Gaussian process to the log scores of the first rung and pick unseen grid points
+        ## with the lowest confidence bound
+        rung = state['rungs'][0]
+        score = self._score(rung['metrics'])
+        done = [int(n) for n, x in score.items() if np.isfinite(x)]
+        seen = set(rung['configs'])
+        candidate = [n for n in range(self.nsearch) if n not in seen]
+        if len(done) < 2 or len(candidate) == 0:
+            return []
+
+        x = self._encode()
+        y = np.log(np.array([score[str(n)] for n in done]))
+        mean, std = np.mean(y), max(np.std(y), 1e-8)
+        y = (y - mean) / std
+
+        def kernel(a, b):
+            d = np.sum((a[:, None, :] - b[None, :, :]) ** 2, axis=2)
+            return np.exp(-0.5 * d / 0.25 ** 2)
+
+        k = kernel(x[done], x[done]) + 1e-2 * np.eye(len(done))
+        k_inv = np.linalg.inv(k)
+        k_s = kernel(x[candidate], x[done])
+        mu = k_s @ k_inv @ y
+        var = np.maximum(1 - np.sum((k_s @ k_inv) * k_s, axis=1), 0)
+        bound = mu - 2 * np.sqrt(var)
+        proposal = [candidate[n] for n in np.argsort(bound)[0: nprop]]
+
+        return proposal
+
+    def _run_search_halving(self):
+        ## successive halving: train many configurations on a small budget and promote the best 1/eta
+        logpath = os.getcwd()
+        budgets = self._rung_budgets()
+        if not os.path.exists('%s/grid-search' % logpath):
+            os.makedirs('%s/grid-search' % logpath)
+
+        state = self._load_ledger(budgets)
+        if state is None:
+            rng = np.random.RandomState(self.seed)
+            nsample = self.nsearch if self.sample <= 0 else min(self.sample, self.nsearch)
+            state = {
+                'queue': self.queue,
+                'budgets': budgets,
+                'data_order': rng.permutation(len(self.data.geos)).tolist(),
+                'rungs': [{'configs': sorted(rng.permutation(self.nsearch)[0: nsample].tolist()),
+                           'metrics': {}, 'proposed': 0}],
+            }
+            self._save_ledger(state)
+
+        for rung, budget in enumerate(budgets):
+            ndata = self._prepare_rung_data(state, rung, budget)
+            self._train_rung(state, rung, budget, state['rungs'][rung]['configs'])
+
+            ## add surrogate proposals once to the first rung
+            if rung == 0 and self.surrogate > 0 and state['rungs'][0]['proposed'] == 0:
+                proposal = self._propose(state, self.surrogate)
+                state['rungs'][0]['configs'] += proposal
+                state['rungs'][0]['proposed'] = 1
+                self._save_ledger(state)
+                self._train_rung(state, rung, budget, proposal)
+
+            grid_ids = state['rungs'][rung]['configs']
+            metrics = state['rungs'][rung]['metrics']
+            epochs = max(int(np.ceil(self.base_epochs['eg']['epo'] * budget)), 1)
+            rung_info = '\n  Rung %s: budget %.4f  epochs %s  data %s  configurations %s\n' % (
+                rung, budget, epochs, ndata, len(grid_ids))
+
+            with open('%s/%s.log' % (logpath, self.title), 'a') as log:
+                log.write(rung_info)
+
+            self._write_summary([metrics[str(n)] for n in grid_ids], [self.queue[n] for n in grid_ids])
+
+            ## promote the best configurations to the next rung
+            if rung < len(budgets) - 1 and len(state['rungs']) == rung + 1:
+                score = self._score(metrics)
+                order = sorted(grid_ids, key=lambda n: score[str(n)])
+                npromote = max(int(np.ceil(len(grid_ids) / self.eta)), 1)
+                promote = [n for n in order[0: npromote] if np.isfinite(score[str(n)])]
+                state['rungs'].append({'configs': promote, 'metrics': {}, 'proposed': 0})
+                self._save_ledger(state)
+
+        return self
+
     def _heading(self):
 
         headline = """
@@ -284,8 +679,9 @@ class GridSearch:
  *---------------------------------------------------*
 
  Number of search: %s
+ Search mode:      %s
 
-""" % (self.version, self.nsearch)
+""" % (self.version, self.nsearch, self.mode)
 
         return headline
 
@@ -297,15 +693,22 @@ class GridSearch:
         with open('%s/%s.log' % (logpath, self.title), 'w') as log:
             log.write(heading)
 
-        if self.retrieve == 0:
-            if self.use_hpc > 0:
-                results = self._run_search_hpc()
-            else:
-                results = self._run_search_seq()
+        if self.mode == 'halving':
+            self._run_search_halving()
+        elif self.retrieve == 0:
+            results = self._run_search()
+            self._write_summary(results)
         else:
             results = self._retrieve_data()
+            self._write_summary(results)
+
+        if self.retrieve == 0:
+            memo_info = '\n  Configurations from memo: %s  trained: %s  memo: %s\n' % (
+                self.ncached, self.ntrained, self.memo)
+            print(memo_info)
+            with open('%s/%s.log' % (logpath, self.title), 'a') as log:
+                log.write(memo_info)
 
-        self._write_summary(results)
         end = time.time()
         walltime = how_long(start, end)
         tailing = 'Grid Search End: %20s Total: %20s\n' % (what_is_time(), walltime)
@@ -7,6 +7,7 @@
 #
 ######################################################
 
+import copy
 import numpy as np
 
 def set_hyper_eg(hyp, unit, info, splits):
@@ -116,7 +117,11 @@ def set_hyper_eg(hyp, unit, info, splits):
         },
     }
 
-    hyp_dict['retraining'] = hyp_dict['training']
+    ## retraining continues from the saved weights, optionally with a different number of epochs
+    hyp_dict['retraining'] = copy.deepcopy(hyp_dict['training'])
+    hyp_dict['retraining']['initialize_weights'] = False
+    if hyp['epo_retrain'] > 0:
+        hyp_dict['retraining']['epo'] = hyp['epo_retrain']
 
     return hyp_dict
 
@@ -228,7 +233,11 @@ def set_hyper_nac(hyp, unit, info, splits):
         },
     }
 
-    hyp_dict['retraining'] = hyp_dict['training']
+    ## retraining continues from the saved weights, optionally with a different number of epochs
+    hyp_dict['retraining'] = copy.deepcopy(hyp_dict['training'])
+    hyp_dict['retraining']['initialize_weights'] = False
+    if hyp['epo_retrain'] > 0:
+        hyp_dict['retraining']['epo'] = hyp['epo_retrain']
 
     return hyp_dict
 
@@ -337,6 +346,10 @@ def set_hyper_soc(hyp, unit, info, splits):
         },
     }
 
-    hyp_dict['retraining'] = hyp_dict['training']
+    ## retraining continues from the saved weights, optionally with a different number of epochs
+    hyp_dict['retraining'] = copy.deepcopy(hyp_dict['training'])
+    hyp_dict['retraining']['initialize_weights'] = False
+    if hyp['epo_retrain'] > 0:
+        hyp_dict['retraining']['epo'] = hyp['epo_retrain']
 
     return hyp_dict
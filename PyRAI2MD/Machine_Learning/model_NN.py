@@ -16,11 +16,13 @@ from PyRAI2MD.Machine_Learning.hyper_nn import set_hyper_nac
 from PyRAI2MD.Machine_Learning.hyper_nn import set_hyper_soc
 
 from PyRAI2MD.Machine_Learning.permutation import permute_map
+from PyRAI2MD.Machine_Learning.training_scheduler import thread_budget
+from PyRAI2MD.Machine_Learning.uncertainty import calibration
+from PyRAI2MD.Machine_Learning.uncertainty import calibration_report
 from PyRAI2MD.Utils.timing import what_is_time
 from PyRAI2MD.Utils.timing import how_long
 
-from PyRAI2MD.Machine_Learning.NNsMD.nn_pes import NeuralNetPes
-from PyRAI2MD.Machine_Learning.NNsMD.nn_pes_src.device import set_gpu
+from PyRAI2MD.Machine_Learning.NNsMD.nn_pes_numpy import NeuralNetPesNumpy
 
 
 class DNN:
@@ -46,18 +48,31 @@ class DNN:
             pred_grad        ndarray     prediction set target grad
             pred_nac         ndarray     prediction set target nac
             pred_soc         ndarray     prediction set target soc
+            ntrace           int         number of retraces of the inference graph
+            engine           str         inference engine, tf or numpy
+            executor         str         training executor, subprocess or thread
+            stream           int         stream energy and gradient training data from disk
+            uncertainty      str         error estimate from two NNs (ensemble) or one NN with dropout (mc_dropout)
+            mult_nn          int         number of NN instances per property
+            mc_passes        int         number of stochastic dropout passes per step
+            baseline         str         path to a two-NN ensemble for the calibration report
+            finetune         int         keep the scaler and feature normalization of the retrained weights
+            model_path       str         path to the trained models
 
         Functions:           Returns:
             train            self        train NN for a given training set
             load             self        load trained NN for prediction
             appendix         self        fake function
             evaluate         self        run prediction
+            screen           ndarray     compute max std for a batch of geometries
+            validate         ndarray     compute energy and gradient mean absolute errors for a labeled set
+            infer            dict        compute predictions and std of all properties for a batch of geometries
+            step_time        float       measure the time of an md step
 
     """
 
     def __init__(self, keywords=None, job_id=None):
 
-        set_gpu([])  # No GPU for prediction
         title = keywords['control']['title']
         variables = keywords['nn'].copy()
         modeldir = variables['modeldir']
@@ -77,10 +92,18 @@ class DNN:
         soc_unit = variables['soc_unit']
         permute = variables['permute_map']
         gpu = variables['gpu']
+        self.engine = variables['engine']
+        feature_cache = variables['feature_cache']
+        self.executor = variables['executor']
+        self.stream = variables['stream']
+        self.uncertainty = variables['uncertainty']
+        self.mc_passes = variables['mc_passes']
+        self.baseline = variables['baseline']
         self.jobtype = keywords['control']['jobtype']
         self.version = keywords['version']
         self.ncpu = keywords['control']['ml_ncpu']
         self.train_mode = variables['train_mode']
+        self.finetune = variables['finetune']
         self.shuffle = variables['shuffle']
         self.natom = data.natom
         self.nstate = data.nstate
@@ -95,6 +118,29 @@ class DNN:
         hyp_dict_soc = set_hyper_soc(hyp_soc, soc_unit, data.info, splits)
         hyp_dict_soc2 = set_hyper_soc(hyp_soc2, soc_unit, data.info, splits)
 
+        ## one NN with dropout replaces the second NN, the stochastic passes give the error estimate
+        if self.uncertainty == 'mc_dropout':
+            self.mult_nn = 1
+            for hyp_dict in [hyp_dict_eg, hyp_dict_nac, hyp_dict_soc]:
+                hyp_dict['model']['use_dropout'] = True
+        elif self.uncertainty == 'ensemble':
+            self.mult_nn = 2
+            self.mc_passes = 0
+        else:
+            sys.exit('\n  KeyError\n  PyRAI2MD: unknown uncertainty %s, choose from ensemble, mc_dropout' % (
+                self.uncertainty))
+
+        ## share precomputed training features between NN instances, retraining and grid search
+        if feature_cache is not None:
+            for hyp_dict in [hyp_dict_eg, hyp_dict_eg2, hyp_dict_nac, hyp_dict_nac2, hyp_dict_soc, hyp_dict_soc2]:
+                hyp_dict['general']['feature_cache'] = os.path.abspath(feature_cache)
+
+        ## fine-tuning retrains the old weights with the scaler and feature normalization they were trained with
+        ## other retraining refits both on the current data
+        if self.finetune == 1 and self.train_mode == 'retraining':
+            for hyp_dict in [hyp_dict_eg, hyp_dict_eg2, hyp_dict_nac, hyp_dict_nac2, hyp_dict_soc, hyp_dict_soc2]:
+                hyp_dict['general']['keep_normalization'] = True
+
         ## retraining has some bug at the moment, do not use
         if self.train_mode not in ['training', 'retraining', 'resample']:
             self.train_mode = 'training'
@@ -142,21 +188,36 @@ class DNN:
             self.y_dict['soc'] = data.soc
 
         ## check permutation map
-        self.x, self.y_dict = permute_map(self.geos, self.y_dict, permute, hyp_dict_eg['training']['val_split'])
+        if self.stream == 1 and 'energy_gradient' in self.y_dict:
+            ## energy and gradient are streamed from disk and permuted on the fly during training
+            for hyp_dict in [hyp_dict_eg, hyp_dict_eg2]:
+                hyp_dict['general']['stream'] = True
+                if permute != 'No' and os.path.exists(permute):
+                    hyp_dict['general']['permute_map'] = os.path.abspath(permute)
+
+            y_eg = self.y_dict.pop('energy_gradient')
+            self.x = {}
+            if len(self.y_dict) > 0:
+                x, self.y_dict = permute_map(self.geos, self.y_dict, permute, hyp_dict_eg['training']['val_split'])
+                self.x = {key: x for key in self.y_dict.keys()}
+            self.x['energy_gradient'] = self.geos
+            self.y_dict['energy_gradient'] = y_eg
+        else:
+            self.x, self.y_dict = permute_map(self.geos, self.y_dict, permute, hyp_dict_eg['training']['val_split'])
 
         ## combine hypers
         self.hyper = {}
-        if nn_eg_type == 1:  # same architecture with different weight
+        if nn_eg_type == 1 or (nn_eg_type > 1 and self.mult_nn == 1):  # same architecture with different weight
             self.hyper['energy_gradient'] = hyp_dict_eg
         elif nn_eg_type > 1:
             self.hyper['energy_gradient'] = [hyp_dict_eg, hyp_dict_eg2]
 
-        if nn_nac_type == 1:  # same architecture with different weight
+        if nn_nac_type == 1 or (nn_nac_type > 1 and self.mult_nn == 1):  # same architecture with different weight
             self.hyper['nac'] = hyp_dict_nac
         elif nn_nac_type > 1:
             self.hyper['nac'] = [hyp_dict_nac, hyp_dict_nac2]
 
-        if nn_soc_type == 1:  # same architecture with different weight
+        if nn_soc_type == 1 or (nn_soc_type > 1 and self.mult_nn == 1):  # same architecture with different weight
             self.hyper['soc'] = hyp_dict_soc
         elif nn_soc_type > 1:
             self.hyper['soc'] = [hyp_dict_soc, hyp_dict_soc2]
@@ -190,9 +251,26 @@ class DNN:
 
         ## initialize model
         if modeldir is None or job_id not in [None, 1]:
-            self.model = NeuralNetPes(self.name)
+            self.model_path = self.name
         else:
-            self.model = NeuralNetPes(modeldir)
+            self.model_path = modeldir
+
+        ## the numpy engine does not import tensorflow unless a model needs training or export
+        if self.engine == 'numpy':
+            self.model = None
+        else:
+            self.model = self._tf_model()
+
+        self.ntrace = 0
+
+    def _tf_model(self):
+        ## import tensorflow only when a tensorflow model is needed
+        from PyRAI2MD.Machine_Learning.NNsMD.nn_pes import NeuralNetPes
+        from PyRAI2MD.Machine_Learning.NNsMD.nn_pes_src.device import set_gpu
+
+        set_gpu([])  # No GPU for prediction
+
+        return NeuralNetPes(self.model_path, mult_nn=self.mult_nn, mc_passes=self.mc_passes)
 
     def _heading(self):
 
@@ -222,6 +300,9 @@ class DNN:
     def train(self):
         start = time.time()
 
+        if self.engine == 'numpy':
+            self.model = self._tf_model()
+
         self.model.create(self.hyper)
 
         topline = 'Neural Networks Start: %20s\n%s' % (what_is_time(), self._heading())
@@ -235,14 +316,20 @@ class DNN:
             log.write(topline)
             log.write(runinfo)
 
-        ferr = self.model.fit(
-            self.x,
-            self.y_dict,
-            gpu_dist=self.gpu_list,
-            proc_async=self.ncpu >= 4,
-            fitmode=self.train_mode,
-            random_shuffle=self.shuffle)
+        ## all property models and their instances are trained at the same time, split ml_ncpu over them
+        nthreads = max(self.ncpu // max(len(self.y_dict) * self.mult_nn, 1), 1)
+        with thread_budget(nthreads):
+            ferr = self.model.fit(
+                self.x,
+                self.y_dict,
+                gpu_dist=self.gpu_list,
+                proc_async=self.ncpu >= 4,
+                fitmode=self.train_mode,
+                random_shuffle=self.shuffle,
+                in_process=self.executor == 'thread')
         # self.model.save()
+        self.model.export_numpy()
+        self.model.save_bundle()
 
         err_e1 = 0
         err_e2 = 0
@@ -252,19 +339,20 @@ class DNN:
         err_n2 = 0
         err_s1 = 0
         err_s2 = 0
+        ## a single NN reports the same error twice
         if 'energy_gradient' in ferr.keys():
             err_e1 = ferr['energy_gradient'][0][0]
-            err_e2 = ferr['energy_gradient'][1][0]
+            err_e2 = ferr['energy_gradient'][-1][0]
             err_g1 = ferr['energy_gradient'][0][1]
-            err_g2 = ferr['energy_gradient'][1][1]
+            err_g2 = ferr['energy_gradient'][-1][1]
 
         if 'nac' in ferr.keys():
             err_n1 = ferr['nac'][0]
-            err_n2 = ferr['nac'][1]
+            err_n2 = ferr['nac'][-1]
 
         if 'soc' in ferr.keys():
             err_s1 = ferr['soc'][0]
-            err_s2 = ferr['soc'][1]
+            err_s2 = ferr['soc'][-1]
 
         metrics = {
             'e1': err_e1 * self.k_e,
@@ -309,8 +397,51 @@ class DNN:
         return metrics
 
     def load(self):
+        if self.engine == 'numpy':
+            self.model = self._load_numpy()
+
+            return self
+
         self.model.load()
 
+        ## trace the inference graph now instead of at the first md step
+        warmup_time = self.model.warmup()
+        warmup_info = '  NN inference warmup: %s\n' % ' '.join(
+            ['%s %.2f s' % (name, t) for name, t in warmup_time.items()])
+
+        with open('%s.log' % self.name, 'a') as log:
+            log.write(warmup_info)
+
+        return self
+
+    def _load_numpy(self):
+        ## load the numpy models, models trained before the numpy export are exported first
+        model_names = [x for x in os.listdir(self.model_path) if os.path.isdir('%s/%s' % (self.model_path, x))]
+        if not np.all([NeuralNetPesNumpy.exists(self.model_path, x) for x in model_names]):
+            model_tf = self._tf_model()
+            model_tf.load()
+            model_tf.export_numpy()
+
+        model = NeuralNetPesNumpy(self.model_path, mc_passes=self.mc_passes)
+
+        if len(model.load()) != len(model_names):
+            sys.exit('\n  FileNotFoundError\n  PyRAI2MD: cannot export all models in %s to numpy' % self.model_path)
+
+        return model
+
+    def _check_retrace(self):
+        ## report if the inference graph is traced again after warmup
+        trace_info = self.model.get_trace_info()
+        ntrace = np.sum([x['retrace'] for x in trace_info.values()])
+
+        if ntrace > self.ntrace:
+            self.ntrace = ntrace
+            retrace_info = '  NN inference retraced: %s\n' % ' '.join(
+                ['%s %s/%s' % (name, x['retrace'], x['call']) for name, x in trace_info.items()])
+
+            with open('%s.log' % self.name, 'a') as log:
+                log.write(retrace_info)
+
         return self
 
     def appendix(self, _):
@@ -323,6 +454,7 @@ class DNN:
 
         xyz = traj.coord.reshape((1, self.natom, 3))
         y_pred, y_std = self.model.call(xyz)
+        self._check_retrace()
 
         ## initialize return values
         energy = []
@@ -424,8 +556,146 @@ class DNN:
         with open('max_abs_dev.txt', 'w') as out:
             out.write(output)
 
+        self._calibrate(x, y_pred, y_std)
+
+        return self
+
+    def _properties(self, y_pred, y_std):
+        ## collect the prediction and std of each property in au
+
+        prop = {}
+        if 'energy_gradient' in y_pred.keys():
+            prop['energy'] = [y_pred['energy_gradient'][0] / self.f_e, y_std['energy_gradient'][0] / self.f_e]
+            prop['gradient'] = [y_pred['energy_gradient'][1] / self.f_g, y_std['energy_gradient'][1] / self.f_g]
+
+        if 'nac' in y_pred.keys():
+            prop['nac'] = [y_pred['nac'] / self.f_n, y_std['nac'] / self.f_n]
+
+        if 'soc' in y_pred.keys():
+            prop['soc'] = [y_pred['soc'], y_std['soc']]
+
+        return prop
+
+    @staticmethod
+    def _time_step(model, x, nstep=10):
+        ## average time of an md step that calls the model with one geometry
+
+        xyz = x[0: 1]
+        model.call(xyz)
+        start = time.time()
+        for _ in range(nstep):
+            model.call(xyz)
+
+        return (time.time() - start) / nstep
+
+    def _load_baseline(self):
+        ## load the two-NN ensemble for the calibration report
+
+        if not os.path.exists(self.baseline):
+            sys.exit('\n  FileNotFoundError\n  PyRAI2MD: looking for baseline models %s' % self.baseline)
+
+        if self.engine == 'numpy':
+            model = NeuralNetPesNumpy(self.baseline)
+        else:
+            from PyRAI2MD.Machine_Learning.NNsMD.nn_pes import NeuralNetPes
+            model = NeuralNetPes(self.baseline, mult_nn=2)
+
+        model.load()
+
+        return model
+
+    def _calibrate(self, x, y_pred, y_std):
+        ## compare the estimated errors with the true errors of the prediction set and the baseline
+
+        ref = {
+            'energy': self.pred_energy,
+            'gradient': self.pred_grad,
+            'nac': self.pred_nac,
+            'soc': self.pred_soc,
+        }
+
+        models = {}
+        timing = {}
+        models[self.uncertainty] = {
+            key: calibration(ref[key], pred, std) for key, (pred, std) in self._properties(y_pred, y_std).items()
+        }
+        timing[self.uncertainty] = self._time_step(self.model, x)
+
+        if self.baseline is not None:
+            baseline = self._load_baseline()
+            b_pred, b_std = baseline.predict(x)
+            models['baseline'] = {
+                key: calibration(ref[key], pred, std) for key, (pred, std) in self._properties(b_pred, b_std).items()
+            }
+            timing['baseline'] = self._time_step(baseline, x)
+
+        report = calibration_report(models, timing)
+
+        if self.silent == 0:
+            print(report)
+
+        with open('%s.log' % self.name, 'a') as log:
+            log.write(report)
+
         return self
 
+    def screen(self, xyz):
+        ## run psnnsmd for a batch of geometries and return the max std of energy, gradient, nac, and soc
+
+        xyz = np.array(xyz).reshape((-1, self.natom, 3))
+        batch = len(xyz)
+
+        y_pred, y_std = self.model.predict(xyz)
+
+        err = np.zeros((batch, 4))
+
+        if 'energy_gradient' in y_std.keys():
+            e_std = y_std['energy_gradient'][0] / self.f_e
+            g_std = y_std['energy_gradient'][1] / self.f_g
+            err[:, 0] = np.amax(e_std.reshape((batch, -1)), axis=1)
+            err[:, 1] = np.amax(g_std.reshape((batch, -1)), axis=1)
+
+        if 'nac' in y_std.keys():
+            n_std = y_std['nac'] / self.f_n
+            err[:, 2] = np.amax(n_std.reshape((batch, -1)), axis=1)
+
+        if 'soc' in y_std.keys():
+            s_std = y_std['soc']
+            err[:, 3] = np.amax(s_std.reshape((batch, -1)), axis=1)
+
+        return err
+
+    def validate(self, xyz, energy, grad):
+        ## run psnnsmd for a labeled set and return the mean absolute errors of energy and gradient in au
+
+        xyz = np.array(xyz).reshape((-1, self.natom, 3))
+        err = np.zeros(2)
+
+        y_pred, y_std = self.model.predict(xyz)
+
+        if 'energy_gradient' in y_pred.keys():
+            e_pred = y_pred['energy_gradient'][0] / self.f_e
+            g_pred = y_pred['energy_gradient'][1] / self.f_g
+            err[0] = np.mean(np.abs(e_pred - energy))
+            err[1] = np.mean(np.abs(g_pred - grad))
+
+        return err
+
+    def infer(self, xyz):
+        ## run psnnsmd for a batch of geometries and return the prediction and std of each property in au
+
+        xyz = np.array(xyz).reshape((-1, self.natom, 3))
+        y_pred, y_std = self.model.predict(xyz)
+
+        return self._properties(y_pred, y_std)
+
+    def step_time(self, xyz):
+        ## measure the time of an md step with one geometry
+
+        xyz = np.array(xyz).reshape((-1, self.natom, 3))
+
+        return self._time_step(self.model, xyz)
+
     def evaluate(self, traj):
         ## main function to run pyNNsMD and communicate with other PyRAI2MD modules
 
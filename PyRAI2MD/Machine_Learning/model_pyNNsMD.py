@@ -20,12 +20,44 @@ from PyRAI2MD.Machine_Learning.hyper_pynnsmd import set_sch_hyper_nac
 from PyRAI2MD.Machine_Learning.hyper_pynnsmd import set_sch_hyper_soc
 from PyRAI2MD.Machine_Learning.permutation import permute_map2
 from PyRAI2MD.Machine_Learning.model_helper import Multiregions
+from PyRAI2MD.Machine_Learning.training_scheduler import TrainingScheduler
 from PyRAI2MD.Machine_Learning.NNsMD.nn_pes_src.device import set_gpu
 from PyRAI2MD.Utils.timing import what_is_time
 from PyRAI2MD.Utils.timing import how_long
 
 from pyNNsMD.NNsMD import NeuralNetEnsemble
 
+def fit_ensemble(model, hyper, data, size, splits, shuffle, train_mode, script, gpu, ncpu):
+    ## create, split and fit one pyNNsMD ensemble, called by the training scheduler
+    model.create(
+        models=[m['model'] for m in hyper],
+        scalers=[m['scaler'] for m in hyper],
+    )
+
+    model.save()
+
+    model.data(**data)
+
+    model.train_test_split(
+        dataset_size=size,
+        n_splits=splits,
+        shuffle=shuffle
+    )
+
+    model.training(
+        [m['training'] for m in hyper],
+        fit_mode=train_mode
+    )
+
+    error = model.fit(
+        [script] * 2,
+        fit_mode=train_mode,
+        gpu_dist=gpu,
+        proc_async=ncpu >= 2
+    )
+
+    return error
+
 class MLP:
     """ pyNNsMD interface
 
@@ -55,6 +87,8 @@ class MLP:
             load             self        load trained NN for prediction
             appendix         self        fake function
             evaluate         self        run prediction
+            screen           ndarray     compute max std for a batch of geometries
+            validate         ndarray     compute energy and gradient mean absolute errors for a labeled set
 
     """
 
@@ -262,39 +296,34 @@ class MLP:
             log.write(topline)
             log.write(runinfo)
 
-        if self.model_register['energy_grad']:
+        ## all registered property models are trained at the same time under the ml_ncpu budget
+        scheduler = TrainingScheduler(self.ncpu)
 
-            self.model_eg.create(
-                models=[m['model'] for m in self.hyper_eg],
-                scalers=[m['scaler'] for m in self.hyper_eg],
+        if self.model_register['energy_grad']:
+            scheduler.add(
+                'energy_grad', fit_ensemble, 2, self.model_eg, self.hyper_eg,
+                {'atoms': self.atoms, 'geometries': self.geos, 'energies': self.energy, 'forces': self.grad},
+                len(self.energy), self.splits, self.shuffle, self.train_mode, 'training_mlp_eg', self.gpu_eg, self.ncpu
             )
 
-            self.model_eg.save()
-
-            self.model_eg.data(
-                atoms=self.atoms,
-                geometries=self.geos,
-                energies=self.energy,
-                forces=self.grad
+        if self.model_register['nac']:
+            scheduler.add(
+                'nac', fit_ensemble, 2, self.model_nac, self.hyper_nac,
+                {'atoms': self.atoms, 'geometries': self.geos, 'couplings': self.nac},
+                len(self.nac), self.splits, self.shuffle, self.train_mode, 'training_mlp_nac2', self.gpu_n, self.ncpu
             )
 
-            self.model_eg.train_test_split(
-                dataset_size=len(self.energy),
-                n_splits=self.splits,
-                shuffle=self.shuffle
+        if self.model_register['soc']:
+            scheduler.add(
+                'soc', fit_ensemble, 2, self.model_soc, self.hyper_soc,
+                {'atoms': self.atoms, 'geometries': self.geos, 'energies': self.soc},
+                len(self.soc), self.splits, self.shuffle, self.train_mode, 'training_mlp_e', self.gpu_s, self.ncpu
             )
 
-            self.model_eg.training(
-                [m['training'] for m in self.hyper_eg],
-                fit_mode=self.train_mode
-            )
+        errors = scheduler.run()
 
-            eg_error = self.model_eg.fit(
-                ['training_mlp_eg'] * 2,
-                fit_mode=self.train_mode,
-                gpu_dist=self.gpu_eg,
-                proc_async=self.ncpu >= 2
-            )
+        if 'energy_grad' in errors:
+            eg_error = errors['energy_grad']
             err_e1 = eg_error[0]['valid'][0]
             err_e2 = eg_error[1]['valid'][0]
             err_g1 = eg_error[0]['valid'][1]
@@ -305,76 +334,16 @@ class MLP:
             err_g1 = 0
             err_g2 = 0
 
-        if self.model_register['nac']:
-
-            self.model_nac.create(
-                models=[m['model'] for m in self.hyper_nac],
-                scalers=[m['scaler'] for m in self.hyper_nac],
-            )
-
-            self.model_nac.save()
-
-            self.model_nac.data(
-                atoms=self.atoms,
-                geometries=self.geos,
-                couplings=self.nac,
-            )
-
-            self.model_nac.train_test_split(
-                dataset_size=len(self.nac),
-                n_splits=self.splits,
-                shuffle=self.shuffle
-            )
-
-            self.model_nac.training(
-                [m['training'] for m in self.hyper_nac],
-                fit_mode=self.train_mode
-            )
-
-            nac_error = self.model_nac.fit(
-                ['training_mlp_nac2'] * 2,
-                fit_mode=self.train_mode,
-                gpu_dist=self.gpu_n,
-                proc_async=self.ncpu >= 2
-            )
+        if 'nac' in errors:
+            nac_error = errors['nac']
             err_n1 = nac_error[0]['valid']
             err_n2 = nac_error[1]['valid']
         else:
             err_n1 = 0
             err_n2 = 0
 
-        if self.model_register['soc']:
-
-            self.model_soc.create(
-                models=[m['model'] for m in self.hyper_soc],
-                scalers=[m['scaler'] for m in self.hyper_soc],
-            )
-
-            self.model_soc.save()
-
-            self.model_soc.data(
-                atoms=self.atoms,
-                geometries=self.geos,
-                energies=self.soc,
-            )
-
-            self.model_soc.train_test_split(
-                dataset_size=len(self.soc),
-                n_splits=self.splits,
-                shuffle=self.shuffle
-            )
-
-            self.model_soc.training(
-                [m['training'] for m in self.hyper_soc],
-                fit_mode=self.train_mode
-            )
-
-            soc_error = self.model_soc.fit(
-                ['training_mlp_e'] * 2,
-                fit_mode=self.train_mode,
-                gpu_dist=self.gpu_s,
-                proc_async=self.ncpu >= 2
-            )
+        if 'soc' in errors:
+            soc_error = errors['soc']
             err_s1 = soc_error[0]['valid']
             err_s2 = soc_error[1]['valid']
         else:
@@ -404,6 +373,7 @@ class MLP:
             metrics['e1'], metrics['g1'], metrics['n1'], metrics['s1'],
             metrics['e2'], metrics['g2'], metrics['n2'], metrics['s2']
         )
+        train_info += scheduler.summary()
 
         end = time.time()
         walltime = how_long(start, end)
@@ -461,10 +431,10 @@ class MLP:
 
         if self.model_register['energy_grad']:
             pred = self.model_eg.call(xyz)
-            energy = np.mean([pred[0][0], pred[1][0]], axis=0) / self.f_e
-            e_std = np.std([pred[0][0], pred[1][0]], axis=0, ddof=1) / self.f_e
-            gradient = np.mean([pred[0][1], pred[1][1]], axis=0) / self.f_g
-            g_std = np.std([pred[0][0], pred[1][0]], axis=0, ddof=1) / self.f_g
+            energy = np.mean([p[0] for p in pred], axis=0) / self.f_e
+            e_std = np.std([p[0] for p in pred], axis=0, ddof=1) / self.f_e
+            gradient = np.mean([p[1] for p in pred], axis=0) / self.f_g
+            g_std = np.std([p[1] for p in pred], axis=0, ddof=1) / self.f_g
             err_e = np.amax(e_std)
             err_g = np.amax(g_std)
         else:
@@ -475,8 +445,8 @@ class MLP:
 
         if self.model_register['nac']:
             pred = self.model_nac.predict(xyz)
-            nac = np.mean([pred[0], pred[1]], axis=0) / self.f_n
-            n_std = np.std([pred[0], pred[1]], axis=0, ddof=1) / self.f_n
+            nac = np.mean(pred, axis=0) / self.f_n
+            n_std = np.std(pred, axis=0, ddof=1) / self.f_n
             err_n = np.amax(n_std)
         else:
             nac = []
@@ -484,8 +454,8 @@ class MLP:
 
         if self.model_register['soc']:
             pred = self.model_soc.predict(xyz)
-            soc = np.mean([pred[0], pred[1]], axis=0)
-            s_std = np.std([pred[0], pred[1]], axis=0, ddof=1)
+            soc = np.mean(pred, axis=0)
+            s_std = np.std(pred, axis=0, ddof=1)
             err_s = np.amax(s_std)
         else:
             soc = []
@@ -500,10 +470,10 @@ class MLP:
 
         if self.model_register['energy_grad']:
             pred = self.model_eg.predict(x)
-            e_pred = np.mean([pred[0][0], pred[1][0]], axis=0) / self.f_e
-            e_std = np.std([pred[0][0], pred[1][0]], axis=0, ddof=1) / self.f_e
-            g_pred = np.mean([pred[0][1], pred[1][1]], axis=0) / self.f_g
-            g_std = np.std([pred[0][0], pred[1][0]], axis=0, ddof=1) / self.f_g
+            e_pred = np.mean([p[0] for p in pred], axis=0) / self.f_e
+            e_std = np.std([p[0] for p in pred], axis=0, ddof=1) / self.f_e
+            g_pred = np.mean([p[1] for p in pred], axis=0) / self.f_g
+            g_std = np.std([p[1] for p in pred], axis=0, ddof=1) / self.f_g
 
             de = np.abs(self.pred_energy - e_pred)
             dg = np.abs(self.pred_grad - g_pred)
@@ -522,8 +492,8 @@ class MLP:
 
         if self.model_register['nac']:
             pred = self.model_nac.predict(x)
-            n_pred = np.mean([pred[0], pred[1]], axis=0) / self.f_n
-            n_std = np.std([pred[0], pred[1]], axis=0, ddof=1) / self.f_n
+            n_pred = np.mean(pred, axis=0) / self.f_n
+            n_std = np.std(pred, axis=0, ddof=1) / self.f_n
 
             dn = np.abs(self.pred_nac - n_pred)
             dn_max = np.amax(dn.reshape((batch, -1)), axis=1)
@@ -536,8 +506,8 @@ class MLP:
 
         if self.model_register['soc']:
             pred = self.model_soc.predict(x)
-            s_pred = np.mean([pred[0], pred[1]], axis=0)
-            s_std = np.std([pred[0], pred[1]], axis=0, ddof=1)
+            s_pred = np.mean(pred, axis=0)
+            s_std = np.std(pred, axis=0, ddof=1)
 
             ds = np.abs(self.pred_soc - s_pred)
             ds_max = np.amax(ds.reshape((batch, -1)), axis=1)
@@ -557,6 +527,47 @@ class MLP:
 
         return self
 
+    def screen(self, xyz):
+        ## run pynnsmd for a batch of geometries and return the max std of energy, gradient, nac, and soc
+
+        xyz = np.array(xyz).reshape((-1, self.natom, 3))
+        batch = len(xyz)
+        err = np.zeros((batch, 4))
+
+        if self.model_register['energy_grad']:
+            pred = self.model_eg.predict(xyz)
+            e_std = np.std([p[0] for p in pred], axis=0, ddof=1) / self.f_e
+            g_std = np.std([p[1] for p in pred], axis=0, ddof=1) / self.f_g
+            err[:, 0] = np.amax(e_std.reshape((batch, -1)), axis=1)
+            err[:, 1] = np.amax(g_std.reshape((batch, -1)), axis=1)
+
+        if self.model_register['nac']:
+            pred = self.model_nac.predict(xyz)
+            n_std = np.std(pred, axis=0, ddof=1) / self.f_n
+            err[:, 2] = np.amax(n_std.reshape((batch, -1)), axis=1)
+
+        if self.model_register['soc']:
+            pred = self.model_soc.predict(xyz)
+            s_std = np.std(pred, axis=0, ddof=1)
+            err[:, 3] = np.amax(s_std.reshape((batch, -1)), axis=1)
+
+        return err
+
+    def validate(self, xyz, energy, grad):
+        ## run pynnsmd for a labeled set and return the mean absolute errors of energy and gradient in au
+
+        xyz = np.array(xyz).reshape((-1, self.natom, 3))
+        err = np.zeros(2)
+
+        if self.model_register['energy_grad']:
+            pred = self.model_eg.predict(xyz)
+            e_pred = np.mean([p[0] for p in pred], axis=0) / self.f_e
+            g_pred = np.mean([p[1] for p in pred], axis=0) / self.f_g
+            err[0] = np.mean(np.abs(e_pred - energy))
+            err[1] = np.mean(np.abs(g_pred - grad))
+
+        return err
+
     def evaluate(self, traj):
         ## main function to run pyNNsMD and communicate with other PyRAI2MD modules
 
@@ -795,39 +806,34 @@ class Schnet:
             log.write(topline)
             log.write(runinfo)
 
-        if self.model_register['energy_grad']:
+        ## all registered property models are trained at the same time under the ml_ncpu budget
+        scheduler = TrainingScheduler(self.ncpu)
 
-            self.model_eg.create(
-                models=[m['model'] for m in self.hyper_eg],
-                scalers=[m['scaler'] for m in self.hyper_eg],
+        if self.model_register['energy_grad']:
+            scheduler.add(
+                'energy_grad', fit_ensemble, 2, self.model_eg, self.hyper_eg,
+                {'atoms': self.atoms, 'geometries': self.geos, 'energies': self.energy, 'forces': self.grad},
+                len(self.energy), self.splits, self.shuffle, self.train_mode, 'training_schnet_eg', self.gpu_eg, self.ncpu
             )
 
-            self.model_eg.save()
-
-            self.model_eg.data(
-                atoms=self.atoms,
-                geometries=self.geos,
-                energies=self.energy,
-                forces=self.grad
+        if self.model_register['nac']:
+            scheduler.add(
+                'nac', fit_ensemble, 2, self.model_nac, self.hyper_nac,
+                {'atoms': self.atoms, 'geometries': self.geos, 'couplings': self.nac},
+                len(self.nac), self.splits, self.shuffle, self.train_mode, 'training_schnet_nac', self.gpu_n, self.ncpu
             )
 
-            self.model_eg.train_test_split(
-                dataset_size=len(self.energy),
-                n_splits=self.splits,
-                shuffle=self.shuffle
+        if self.model_register['soc']:
+            scheduler.add(
+                'soc', fit_ensemble, 2, self.model_soc, self.hyper_soc,
+                {'atoms': self.atoms, 'geometries': self.geos, 'energies': self.soc},
+                len(self.soc), self.splits, self.shuffle, self.train_mode, 'training_schnet_e', self.gpu_s, self.ncpu
             )
 
-            self.model_eg.training(
-                [m['training'] for m in self.hyper_eg],
-                fit_mode=self.train_mode
-            )
+        errors = scheduler.run()
 
-            eg_error = self.model_eg.fit(
-                ['training_schnet_eg'] * 2,
-                fit_mode=self.train_mode,
-                gpu_dist=self.gpu_eg,
-                proc_async=self.ncpu >= 2
-            )
+        if 'energy_grad' in errors:
+            eg_error = errors['energy_grad']
             err_e1 = eg_error[0]['valid'][0]
             err_e2 = eg_error[1]['valid'][0]
             err_g1 = eg_error[0]['valid'][1]
@@ -838,76 +844,16 @@ class Schnet:
             err_g1 = 0
             err_g2 = 0
 
-        if self.model_register['nac']:
-
-            self.model_nac.create(
-                models=[m['model'] for m in self.hyper_nac],
-                scalers=[m['scaler'] for m in self.hyper_nac],
-            )
-
-            self.model_nac.save()
-
-            self.model_nac.data(
-                atoms=self.atoms,
-                geometries=self.geos,
-                couplings=self.nac,
-            )
-
-            self.model_nac.train_test_split(
-                dataset_size=len(self.nac),
-                n_splits=self.splits,
-                shuffle=self.shuffle
-            )
-
-            self.model_nac.training(
-                [m['training'] for m in self.hyper_nac],
-                fit_mode=self.train_mode
-            )
-
-            nac_error = self.model_nac.fit(
-                ['training_schnet_nac'] * 2,
-                fit_mode=self.train_mode,
-                gpu_dist=self.gpu_n,
-                proc_async=self.ncpu >= 2
-            )
+        if 'nac' in errors:
+            nac_error = errors['nac']
             err_n1 = nac_error[0]['valid']
             err_n2 = nac_error[1]['valid']
         else:
             err_n1 = 0
             err_n2 = 0
 
-        if self.model_register['soc']:
-
-            self.model_soc.create(
-                models=[m['model'] for m in self.hyper_soc],
-                scalers=[m['scaler'] for m in self.hyper_soc],
-            )
-
-            self.model_soc.save()
-
-            self.model_soc.data(
-                atoms=self.atoms,
-                geometries=self.geos,
-                energies=self.soc,
-            )
-
-            self.model_soc.train_test_split(
-                dataset_size=len(self.soc),
-                n_splits=self.splits,
-                shuffle=self.shuffle
-            )
-
-            self.model_soc.training(
-                [m['training'] for m in self.hyper_soc],
-                fit_mode=self.train_mode
-            )
-
-            soc_error = self.model_soc.fit(
-                ['training_schnet_e'] * 2,
-                fit_mode=self.train_mode,
-                gpu_dist=self.gpu_s,
-                proc_async=self.ncpu >= 2
-            )
+        if 'soc' in errors:
+            soc_error = errors['soc']
             err_s1 = soc_error[0]['valid']
             err_s2 = soc_error[1]['valid']
         else:
@@ -937,6 +883,7 @@ class Schnet:
             metrics['e1'], metrics['g1'], metrics['n1'], metrics['s1'],
             metrics['e2'], metrics['g2'], metrics['n2'], metrics['s2']
         )
+        train_info += scheduler.summary()
 
         end = time.time()
         walltime = how_long(start, end)
@@ -1001,10 +948,10 @@ class Schnet:
 
         if self.model_register['energy_grad']:
             pred = self.model_eg.call([atomic_numbers, xyz])
-            energy = np.mean([pred[0][0], pred[1][0]], axis=0) / self.f_e
-            e_std = np.std([pred[0][0], pred[1][0]], axis=0, ddof=1) / self.f_e
-            gradient = np.mean([pred[0][1], pred[1][1]], axis=0) / self.f_g
-            g_std = np.std([pred[0][0], pred[1][0]], axis=0, ddof=1) / self.f_g
+            energy = np.mean([p[0] for p in pred], axis=0) / self.f_e
+            e_std = np.std([p[0] for p in pred], axis=0, ddof=1) / self.f_e
+            gradient = np.mean([p[1] for p in pred], axis=0) / self.f_g
+            g_std = np.std([p[1] for p in pred], axis=0, ddof=1) / self.f_g
             err_e = np.amax(e_std)
             err_g = np.amax(g_std)
         else:
@@ -1015,8 +962,8 @@ class Schnet:
 
         if self.model_register['nac']:
             pred = self.model_nac.predict([atomic_numbers, xyz])
-            nac = np.mean([pred[0], pred[1]], axis=0) / self.f_n
-            n_std = np.std([pred[0], pred[1]], axis=0, ddof=1) / self.f_n
+            nac = np.mean(pred, axis=0) / self.f_n
+            n_std = np.std(pred, axis=0, ddof=1) / self.f_n
             err_n = np.amax(n_std)
         else:
             nac = []
@@ -1024,8 +971,8 @@ class Schnet:
 
         if self.model_register['soc']:
             pred = self.model_soc.predict([atomic_numbers, xyz])
-            soc = np.mean([pred[0], pred[1]], axis=0)
-            s_std = np.std([pred[0], pred[1]], axis=0, ddof=1)
+            soc = np.mean(pred, axis=0)
+            s_std = np.std(pred, axis=0, ddof=1)
             err_s = np.amax(s_std)
         else:
             soc = []
@@ -1041,10 +988,10 @@ class Schnet:
 
         if self.model_register['energy_grad']:
             pred = self.model_eg.predict([atomic_numbers, x])
-            e_pred = np.mean([pred[0][0], pred[1][0]], axis=0) / self.f_e
-            e_std = np.std([pred[0][0], pred[1][0]], axis=0, ddof=1) / self.f_e
-            g_pred = np.mean([pred[0][1], pred[1][1]], axis=0) / self.f_g
-            g_std = np.std([pred[0][0], pred[1][0]], axis=0, ddof=1) / self.f_g
+            e_pred = np.mean([p[0] for p in pred], axis=0) / self.f_e
+            e_std = np.std([p[0] for p in pred], axis=0, ddof=1) / self.f_e
+            g_pred = np.mean([p[1] for p in pred], axis=0) / self.f_g
+            g_std = np.std([p[1] for p in pred], axis=0, ddof=1) / self.f_g
 
             de = np.abs(self.pred_energy - e_pred)
             dg = np.abs(self.pred_grad - g_pred)
@@ -1063,8 +1010,8 @@ class Schnet:
 
         if self.model_register['nac']:
             pred = self.model_nac.predict([atomic_numbers, x])
-            n_pred = np.mean([pred[0], pred[1]], axis=0) / self.f_n
-            n_std = np.std([pred[0], pred[1]], axis=0, ddof=1) / self.f_n
+            n_pred = np.mean(pred, axis=0) / self.f_n
+            n_std = np.std(pred, axis=0, ddof=1) / self.f_n
 
             dn = np.abs(self.pred_nac - n_pred)
             dn_max = np.amax(dn.reshape((batch, -1)), axis=1)
@@ -1077,8 +1024,8 @@ class Schnet:
 
         if self.model_register['soc']:
             pred = self.model_soc.predict([atomic_numbers, x])
-            s_pred = np.mean([pred[0], pred[1]], axis=0)
-            s_std = np.std([pred[0], pred[1]], axis=0, ddof=1)
+            s_pred = np.mean(pred, axis=0)
+            s_std = np.std(pred, axis=0, ddof=1)
 
             ds = np.abs(self.pred_soc - s_pred)
             ds_max = np.amax(ds.reshape((batch, -1)), axis=1)
@@ -14,6 +14,8 @@ import json
 import time
 
 from PyRAI2MD.Utils.timing import how_long
+from PyRAI2MD.Utils.thread_budget import thread_env
+from PyRAI2MD.Utils.thread_budget import pinned_command
 
 class RemoteTrain:
     """ NN remote training class
@@ -28,6 +30,7 @@ class RemoteTrain:
             calcdir          str         calculation directory
             pyrai2mddir      str         PyRAI2MD directory
             use_hpc          int         use HPC (1) for calculation or not(0), like SLURM.
+                                         local jobs (2) can be pinned to a core set with a thread budget
 
         Functions:           Returns:
             train            dict        training metrics
@@ -84,15 +87,17 @@ pyrai2md.py $INPUT
 
         return self
 
-    def _start_training(self):
+    def _start_training(self, cores=None, nthreads=None):
         ## distribute NN training
-        maindir = os.getcwd()
-        os.chdir(self.calcdir)
+        ## jobs start in their folder without changing the working directory, so they can be started from threads
         if self.use_hpc == 1:
-            subprocess.run(['sbatch', '-W', '%s/%s.sbatch' % (self.calcdir, self.title)])
+            subprocess.run(['sbatch', '-W', '%s/%s.sbatch' % (self.calcdir, self.title)], cwd=self.calcdir)
         else:
-            subprocess.run(['bash', '%s/%s.sh' % (self.calcdir, self.title)])
-        os.chdir(maindir)
+            env = None
+            if nthreads is not None:
+                env = thread_env(nthreads)
+            command = pinned_command(['bash', '%s/%s.sh' % (self.calcdir, self.title)], cores)
+            subprocess.run(command, cwd=self.calcdir, env=env)
 
         return self
 
@@ -133,12 +138,13 @@ pyrai2md.py $INPUT
 
         return metrics
 
-    def train(self):
+    def train(self, cores=None, nthreads=None):
+        ## cores and nthreads pin a local job to a core set with a thread budget
         start = time.time()
 
         if self.retrieve == 0:
             self._setup_training()
-            self._start_training()
+            self._start_training(cores, nthreads)
 
         metrics: dict
         metrics = self._read_training()
@@ -9,16 +9,43 @@
 
 import os
 import sys
+import copy
 import json
 import numpy as np
 
 from PyRAI2MD.Utils.coordinates import atomic_number
+from PyRAI2MD.Machine_Learning.data_store import DataStore
+from PyRAI2MD.Machine_Learning.data_store import is_store
+
+def split_xyz(xyz, dtype=float):
+    ## split coordinates with atom symbols [[[atom, x, y, z], ...], ...] into symbols and a float array
+    if isinstance(xyz, np.ndarray) and len(xyz.shape) == 3:
+        symbols = xyz[:, :, 0].astype(str)
+        geos = np.ascontiguousarray(xyz[:, :, 1: 4].astype(dtype))
+    else:
+        symbols = [[str(atom[0]) for atom in mol] for mol in xyz]
+        geos = np.array([[atom[1: 4] for atom in mol] for mol in xyz], dtype=dtype)
+
+    return symbols, geos
+
+def index_compositions(symbols, species):
+    ## index the composition of each data point in the list of distinct compositions, new ones are added
+    table = {comp: n for n, comp in enumerate(species)}
+    index = np.zeros(len(symbols), dtype=np.int32)
+    for n, atoms in enumerate(symbols):
+        comp = tuple([str(atom) for atom in atoms])
+        if comp not in table:
+            table[comp] = len(species)
+            species.append(comp)
+        index[n] = table[comp]
+
+    return index
 
 class Data:
     """ Training data class
 
         Parameters:          Type:
-            None
+            dtype            type        float type of coordinates, float64 (default) or float32
 
         Attribute:           Type:       
             natom            int         number of atoms
@@ -26,57 +53,68 @@ class Data:
             nnac             int         number of nonadiabatic couplings
        	    nsoc             int    	 number of spin-orbit couplings
        	    info             dict        data size info dict
-            xyz              ndarray     coordinates array
+            xyz              ndarray     coordinates array with atom symbols, built on access
             energy           ndarray     energy array
             grad             ndarray     gradient array
             nac              ndarray     nonadiabatic coupling array
             soc              ndarray     spin-orbit coupling array
-            atoms            list        atom list
+            species          list        distinct compositions of the training set
+            composition      ndarray     composition index of each data point
+            atoms            list        atom list, built on access
             geos             ndarray     training set coordinates
-            pred_xyz         ndarray     prediction set coordinates array
-            pred_atoms       list        prediction set atom list
+            pred_species     list        distinct compositions of the prediction set
+            pred_composition ndarray     composition index of each prediction data point
+            pred_xyz         ndarray     prediction set coordinates array, built on access
+            pred_atoms       list        prediction set atom list, built on access
             pred_geos        ndarray     prediction set coordinates
             pred_energy      ndarray     prediction set target energy
             pred_grad        ndarray     prediction set target grad
             pred_nac         ndarray     prediction set target nac
             pred_soc         ndarray     prediction set target soc
-            atomic_numbers   list        atomic number list
+            atomic_numbers   list        atomic number list, built on access
             max_xx           float       maximum value
             min_xx           float       minimum value
             mid_xx           float       middle value
             dev_xx           float       deviation value
             avg_xx           float       mean value
             std_xx           float       standard deviation
+            store            DataStore   binary training data store, None for json data
+            nstored          int         number of data points already in the store
+            forked           bool        the store is the working copy in the current directory
+            file             str         training data file or store of the last load or save
 
         Functions:           Returns:
             load             self        load data
             append           self        add new data
+            subset           Data        copy selected data into a new data class
+            columns          dict        training data as binary store fields
             save             self        save data
             stat             self        update data statistics (max, min, mid, dev, mean, std)
     """
 
-    def __init__(self):
+    def __init__(self, dtype=float):
 
+        self.dtype = dtype
         self.natom = 0
         self.nstate = 0
         self.nnac = 0
         self.nsoc = 0
         self.info = {}
-        self.xyz = np.zeros(0)
         self.energy = np.zeros(0)
         self.grad = np.zeros(0)
         self.nac = np.zeros(0)
         self.soc = np.zeros(0)
-        self.atoms = np.zeros(0)
+        self.species = []
+        self.composition = np.zeros(0, dtype=np.int32)
         self.geos = np.zeros(0)
-        self.pred_xyz = np.zeros(0)
-        self.pred_atoms = np.zeros(0)
+        self.pred_species = []
+        self.pred_composition = np.zeros(0, dtype=np.int32)
         self.pred_geos = np.zeros(0)
         self.pred_energy = np.zeros(0)
         self.pred_grad = np.zeros(0)
         self.pred_nac = np.zeros(0)
         self.pred_soc = np.zeros(0)
-        self.atomic_numbers = []
+        self._species_numbers = {}
         self.max_energy = 0
         self.max_grad = 0
         self.max_nac = 0
@@ -101,6 +139,57 @@ class Data:
         self.std_grad = 0
         self.std_nac = 0
         self.std_soc = 0
+        self.store = None
+        self.nstored = 0
+        self.forked = False
+        self.file = None
+
+    @staticmethod
+    def _build_xyz(species, composition, geos):
+        if len(composition) == 0:
+            return np.zeros(0)
+
+        symbols = np.array(species).astype(str)[composition]
+        xyz = np.concatenate((symbols.reshape((len(symbols), -1, 1)), geos.astype(str)), axis=2)
+
+        return xyz
+
+    @property
+    def xyz(self):
+        return self._build_xyz(self.species, self.composition, self.geos)
+
+    @xyz.setter
+    def xyz(self, xyz):
+        self.species = []
+        symbols, self.geos = split_xyz(xyz, self.dtype)
+        self.composition = index_compositions(symbols, self.species)
+
+    @property
+    def atoms(self):
+        return [list(self.species[c]) for c in self.composition]
+
+    @property
+    def atomic_numbers(self):
+        ## atomic numbers are computed once per composition and shared by all data points
+        for comp in self.species:
+            if comp not in self._species_numbers:
+                self._species_numbers[comp] = atomic_number(comp)
+
+        return [self._species_numbers[self.species[c]] for c in self.composition]
+
+    @property
+    def pred_xyz(self):
+        return self._build_xyz(self.pred_species, self.pred_composition, self.pred_geos)
+
+    @pred_xyz.setter
+    def pred_xyz(self, xyz):
+        self.pred_species = []
+        symbols, self.pred_geos = split_xyz(xyz, self.dtype)
+        self.pred_composition = index_compositions(symbols, self.pred_species)
+
+    @property
+    def pred_atoms(self):
+        return [list(self.pred_species[c]) for c in self.pred_composition]
 
     def _load_training_data(self, file):
         with open('%s' % file, 'r') as indata:
@@ -111,17 +200,20 @@ class Data:
             self.natom = int(natom)
             self.nstate = int(nstate)
             self.nnac = int(nstate * (nstate - 1) / 2)
-            self.xyz = np.array(xyz)
+            self.xyz = xyz
             self.energy = np.array(energy)
             self.grad = np.array(grad)
             self.nac = np.array(nac)
 
         elif isinstance(data, dict):  # new format
+            ## data saved by earlier versions uses short keys
+            if 'n' in data.keys():
+                data['natom'], data['nstate'], data['energy'] = data['n'], data['nst'], data['eng']
             self.natom = int(data['natom'])
             self.nstate = int(data['nstate'])
             self.nnac = int(data['nnac'])
             self.nsoc = int(data['nsoc'])
-            self.xyz = np.array(data['xyz'])
+            self.xyz = data['xyz']
             self.energy = np.array(data['energy'])
             self.grad = np.array(data['grad'])
             self.nac = np.array(data['nac'])
@@ -129,9 +221,6 @@ class Data:
         else:
             sys.exit('\n  FileTypeError\n  PyRAI2MD: cannot recognize training data format %s' % file)
 
-        self.atoms = self.xyz[:, :, 0].astype(str).tolist()
-        self.geos = self.xyz[:, :, 1: 4].astype(float)
-        self.atomic_numbers = [atomic_number(atom) for atom in self.atoms]
         self.info = {
             'natom': self.natom,
             'nstate': self.nstate,
@@ -141,20 +230,65 @@ class Data:
 
         return self
 
+    def _load_training_store(self, path):
+        ## only the metadata is parsed, fields are memory-mapped views of the store
+        ## masked data points are skipped, which copies the fields
+        self.store = DataStore(path)
+        meta = self.store.meta
+        self.natom = int(meta['natom'])
+        self.nstate = int(meta['nstate'])
+        self.nnac = int(meta['nnac'])
+        self.nsoc = int(meta['nsoc'])
+        if len(self.store.masked) > 0:
+            index = np.setdiff1d(np.arange(self.store.size), self.store.masked)
+        else:
+            index = slice(None)
+        symbols, composition = np.unique(self.store.read('symbols')[index].astype(str), axis=0, return_inverse=True)
+        self.species = [tuple(comp) for comp in symbols.tolist()]
+        self.composition = composition.reshape(-1).astype(np.int32)
+        self.geos = np.asarray(self.store.read('geos')[index], dtype=self.dtype)
+        self.energy = self.store.read('energy')[index]
+        self.grad = self.store.read('grad')[index]
+        self.nac = self.store.read('nac')[index]
+        self.soc = self.store.read('soc')[index]
+        self.nstored = len(self.geos)
+        self.forked = False
+        self.info = {
+            'natom': self.natom,
+            'nstate': self.nstate,
+            'nnac': self.nnac,
+            'nsoc': self.nsoc,
+        }
+
+        return self
+
+    def _load_prediction_store(self, path):
+        store = DataStore(path)
+        symbols, composition = np.unique(store.read('symbols').astype(str), axis=0, return_inverse=True)
+        self.pred_species = [tuple(comp) for comp in symbols.tolist()]
+        self.pred_composition = composition.reshape(-1).astype(np.int32)
+        self.pred_geos = np.asarray(store.read('geos'), dtype=self.dtype)
+        self.pred_energy = store.read('energy')
+        self.pred_grad = store.read('grad')
+        self.pred_nac = store.read('nac')
+        self.pred_soc = store.read('soc')
+
+        return self
+
     def _load_prediction_data(self, file):
         with open('%s' % file, 'r') as indata:
             data = json.load(indata)
 
         if isinstance(data, list):  # old format
             natom, nstate, xyz, invr, energy, grad, nac, ci, mo = data
-            self.pred_xyz = np.array(xyz)
+            self.pred_xyz = xyz
             self.pred_energy = np.array(energy)
             self.pred_grad = np.array(grad)
             self.pred_nac = np.array(nac)
             self.pred_soc = 0
 
         elif isinstance(data, dict):  # new format
-            self.pred_xyz = np.array(data['xyz'])
+            self.pred_xyz = data['xyz']
             self.pred_energy = np.array(data['energy'])
             self.pred_grad = np.array(data['grad'])
             self.pred_nac = np.array(data['nac'])
@@ -163,16 +297,20 @@ class Data:
         else:
             sys.exit('\n  FileTypeError\n  PyRAI2MD: cannot recognize prediction data format %s' % file)
 
-        self.pred_atoms = self.pred_xyz[:, :, 0].astype(str).tolist()
-        self.pred_geos = self.pred_xyz[:, :, 1: 4].astype(float)
         return self
 
     def load(self, file, filetype='train'):
         if not os.path.exists(file):
             sys.exit('\n  FileNotFoundError\n  PyRAI2MD: looking for training data  %s for %s' % (file, filetype))
 
-        if filetype == 'train':
+        if filetype == 'train' and is_store(file):
+            self._load_training_store(file)
+            self.file = file
+        elif filetype == 'train':
             self._load_training_data(file)
+            self.file = file
+        elif filetype == 'prediction' and is_store(file):
+            self._load_prediction_store(file)
         elif filetype == 'prediction':
             self._load_prediction_data(file)
         else:
@@ -180,15 +318,42 @@ class Data:
 
         return self
 
+    def columns(self, start=0):
+        ## training data from index start as store fields
+        ## nac or soc missing in old format data are stored as empty arrays
+        size = len(self.geos) - start
+        columns = {
+            'symbols': np.array(self.species).astype(str)[self.composition[start:]],
+            'geos': np.array(self.geos[start:]).astype(float),
+            'energy': np.array(self.energy[start:]),
+            'grad': np.array(self.grad[start:]),
+            'nac': np.array(self.nac[start:]) if len(self.nac) == len(self.geos) else np.zeros((size, 0)),
+            'soc': np.array(self.soc[start:]) if len(self.soc) == len(self.geos) else np.zeros((size, 0)),
+        }
+
+        return columns
+
     def save(self, file):
-        batch = len(self.xyz)
+        ## binary store only appends the new data and records the iteration
+        ## the input store is forked into the current directory at the first save and is never changed
+        if self.store is not None:
+            if not self.forked:
+                source = os.path.basename(os.path.normpath(self.store.path))
+                self.store = self.store.fork('%s/New-data-%s' % (os.getcwd(), source))
+                self.forked = True
+            self.store.append(self.columns(self.nstored), tag=file)
+            self.nstored = len(self.geos)
+            self.file = self.store.path
+            return self
+
+        batch = len(self.geos)
         data = {
-            'n': self.natom,
-            'nst': self.nstate,
+            'natom': self.natom,
+            'nstate': self.nstate,
             'nnac': self.nnac,
             'nsoc': self.nsoc,
             'xyz': self.xyz.tolist(),
-            'eng': self.energy.tolist(),
+            'energy': self.energy.tolist(),
             'grad': self.grad.tolist(),
             'nac': self.nac.tolist(),
             'soc': self.soc.tolist(),
@@ -197,20 +362,45 @@ class Data:
         with open('New-data%s-%s.json' % (batch, file), 'w') as outdata:
             json.dump(data, outdata)
 
+        self.file = 'New-data%s-%s.json' % (batch, file)
+
         return self
 
     def append(self, newdata):
         new_xyz, new_energy, new_grad, new_nac, new_soc = newdata
-        self.xyz = np.concatenate((self.xyz, new_xyz))
+        ## only the new coordinates are split, the compositions are shared with the old data
+        symbols, new_geos = split_xyz(new_xyz, self.dtype)
+        new_composition = index_compositions(symbols, self.species)
+        self.composition = np.concatenate((self.composition, new_composition))
+        self.geos = np.concatenate((self.geos.reshape((-1, new_geos.shape[1], 3)), new_geos))
         self.energy = np.concatenate((self.energy, new_energy))
         self.grad = np.concatenate((self.grad, new_grad))
         self.nac = np.concatenate((self.nac, new_nac))
         self.soc = np.concatenate((self.soc, new_soc))
-        self.atoms = np.array(self.xyz[:, :, 0]).astype(str).tolist()
-        self.geos = np.array(self.xyz[:, :, 1: 4]).astype(float)
 
         return self
 
+    def subset(self, index):
+        ## This function copy the selected data into a new data class, the prediction set is shared
+        index = np.array(index).astype(int)
+        data = copy.copy(self)
+        data.species = list(self.species)
+        data.composition = self.composition[index]
+        data.geos = self.geos[index]
+        data.energy = self.energy[index]
+        data.grad = self.grad[index]
+
+        if len(self.nac) == len(self.geos):
+            data.nac = self.nac[index]
+
+        if len(self.soc) == len(self.geos):
+            data.soc = self.soc[index]
+
+        data.store = None
+        data.stat()
+
+        return data
+
     def stat(self):
         if len(self.energy[0]) > 0:
             self.max_energy = np.amax(self.energy)
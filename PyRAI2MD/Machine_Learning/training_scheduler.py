@@ -0,0 +1,255 @@
+######################################################
+#
+# PyRAI2MD 2 module for concurrent training of property models
+#
+# Author Jingbai Li
+# Oct 18 2026
+#
+######################################################
+
+import os
+import time
+import queue
+import threading
+from contextlib import contextmanager
+
+from PyRAI2MD.Utils.thread_budget import THREAD_VARIABLES
+from PyRAI2MD.Utils.thread_budget import node_cores
+from PyRAI2MD.Utils.thread_budget import node_memory
+
+@contextmanager
+def thread_budget(nthreads):
+    """ Limit the threads of training processes started in this context
+
+        Parameters:          Type:
+            nthreads         int         number of threads per process
+
+    """
+    ## training processes inherit the environment when they start
+    saved = {var: os.environ.get(var) for var in THREAD_VARIABLES + ['TF_NUM_INTEROP_THREADS']}
+    for var in THREAD_VARIABLES:
+        os.environ[var] = str(nthreads)
+    os.environ['TF_NUM_INTEROP_THREADS'] = str(min(2, nthreads))
+
+    try:
+        yield nthreads
+    finally:
+        for var, val in saved.items():
+            if val is None:
+                os.environ.pop(var, None)
+            else:
+                os.environ[var] = val
+
+class TrainingScheduler:
+    """ Concurrent training of property models under a core budget
+
+        Parameters:          Type:
+            ncpu             int         number of cores for training
+
+        Attribute:           Type:
+            ncpu             int         number of cores for training
+            tasks            list        training tasks [name, function, number of processes, args]
+            nthreads         int         number of threads per training process
+            timing           dict        wall time of each task
+
+        Functions:           Returns:
+            add              self        add a training task
+            run              dict        run all tasks and return their results
+            summary          str         timing summary
+
+    """
+
+    def __init__(self, ncpu=1):
+        self.ncpu = max(int(ncpu), 1)
+        self.tasks = []
+        self.nthreads = 1
+        self.timing = {}
+
+    def add(self, name, func, nproc, *args):
+        ## nproc is the number of training processes the task runs at the same time, e.g. the ensemble size
+        self.tasks.append([name, func, max(int(nproc), 1), args])
+
+        return self
+
+    def run(self):
+        ## start every task as soon as its processes fit into the budget, a task always starts on an idle node
+        ## the budget is split evenly over the processes of all tasks
+        nproc = sum([task[2] for task in self.tasks])
+        self.nthreads = max(self.ncpu // max(nproc, 1), 1)
+        results = {}
+        errors = []
+        used = [0]
+        cond = threading.Condition()
+
+        def worker(name, func, n, args):
+            start = time.time()
+            try:
+                results[name] = func(*args)
+            except BaseException as error:
+                errors.append(error)
+            finally:
+                self.timing[name] = time.time() - start
+                with cond:
+                    used[0] -= n
+                    cond.notify_all()
+
+        threads = []
+        with thread_budget(self.nthreads):
+            for name, func, n, args in self.tasks:
+                with cond:
+                    while 0 < used[0] and used[0] + n > self.ncpu:
+                        cond.wait()
+                    used[0] += n
+                thread = threading.Thread(target=worker, args=(name, func, n, args))
+                thread.start()
+                threads.append(thread)
+
+            for thread in threads:
+                thread.join()
+
+        self.tasks = []
+
+        if len(errors) > 0:
+            raise errors[0]
+
+        return results
+
+    def summary(self):
+        ## one line timing summary for the training log
+        timing = ', '.join(['%s %.1f s' % (name, t) for name, t in self.timing.items()])
+        summary = '  Concurrent training: %s (%s cores, %s threads per process)\n' % (
+            timing, self.ncpu, self.nthreads)
+
+        return summary
+
+class JobPacker:
+    """ Pack independent training jobs onto the cores of a node
+
+        Parameters:          Type:
+            ncpu             int         number of cores to use, 0 to use all available cores
+            threads          int         number of threads per job, 0 to choose from the number of jobs
+            memory           int         memory per job in MB, 0 to skip the memory limit
+
+        Attribute:           Type:
+            cores            list        available core ids
+            request          int         requested number of threads per job
+            threads          int         number of threads per job
+            memory           int         memory per job in MB
+            available        int         available memory in MB
+            nslot            int         number of jobs running at the same time
+            slots            list        core set of each slot
+            records          list        core set, wall time and work of each finished job
+
+        Functions:           Returns:
+            plan             self        choose the thread budget and core sets for a number of jobs
+            run              dict        run all jobs and return their results
+            summary          str         throughput summary
+
+    """
+
+    def __init__(self, ncpu=0, threads=0, memory=0):
+        self.cores = node_cores()
+        if 0 < ncpu < len(self.cores):
+            self.cores = self.cores[0: ncpu]
+        self.request = max(int(threads), 0)
+        self.threads = 1
+        self.memory = max(int(memory), 0)
+        self.available = node_memory()
+        self.nslot = 1
+        self.slots = [self.cores]
+        self.records = []
+
+    def plan(self, njobs):
+        ## small models scale poorly with threads, so run as many jobs as possible with the cores left to share
+        ncore = len(self.cores)
+        njobs = max(int(njobs), 1)
+        threads = self.request
+        if threads == 0:
+            threads = max(ncore // njobs, 1)
+        threads = min(threads, ncore)
+
+        nslot = max(min(ncore // threads, njobs), 1)
+        if self.memory > 0 and self.available > 0:
+            nslot = max(min(nslot, self.available // self.memory), 1)
+
+        ## jobs limited by memory share the idle cores
+        if self.request == 0:
+            threads = max(ncore // nslot, 1)
+
+        self.threads = threads
+        self.nslot = nslot
+        self.slots = [self.cores[n * threads: (n + 1) * threads] for n in range(nslot)]
+
+        return self
+
+    def run(self, jobs, done=None):
+        ## jobs is a list of [name, function, args, work], the function is called as function(cores, threads, *args)
+        ## work is the number of processed samples to report the throughput, done(name, result) is called after each job
+        if len(jobs) == 0:
+            return {}
+
+        self.plan(len(jobs))
+        free = queue.Queue()
+        for slot in self.slots:
+            free.put(slot)
+
+        results = {}
+        errors = []
+        lock = threading.Lock()
+
+        def worker(name, func, args, work, cores):
+            start = time.time()
+            try:
+                result = func(cores, self.threads, *args)
+                with lock:
+                    results[name] = result
+                    self.records.append([name, cores, time.time() - start, work])
+                    if done is not None:
+                        done(name, result)
+            except BaseException as error:
+                errors.append(error)
+            finally:
+                free.put(cores)
+
+        threads = []
+        for name, func, args, work in jobs:
+            cores = free.get()
+            if len(errors) > 0:
+                free.put(cores)
+                break
+            thread = threading.Thread(target=worker, args=(name, func, args, work, cores))
+            thread.start()
+            threads.append(thread)
+
+        for thread in threads:
+            thread.join()
+
+        if len(errors) > 0:
+            raise errors[0]
+
+        return results
+
+    def summary(self):
+        ## measured throughput per job and per core to tune the thread budget
+        summary = """
+  &job packing
+-------------------------------------------------------
+  Cores:                      %-10s
+  Jobs at the same time:      %-10s
+  Threads per job:            %-10s
+  Memory per job (MB):        %-10s
+  Available memory (MB):      %-10s
+-------------------------------------------------------
+  Job                                      Cores       Time(s)   Samples/s   Samples/s/core
+""" % (len(self.cores), self.nslot, self.threads, self.memory, self.available)
+
+        for name, cores, t, work in self.records:
+            rate = work / max(t, 1e-8)
+            summary += '  %-40s %-10s %9.1f %11.1f %16.1f\n' % (
+                name, '%s-%s' % (cores[0], cores[-1]), t, rate, rate / len(cores))
+
+        if len(self.records) > 0:
+            summary += '  Mean throughput per core: %.1f samples/s\n' % (
+                sum([w / max(t, 1e-8) / len(c) for _, c, t, w in self.records]) / len(self.records))
+
+        return summary
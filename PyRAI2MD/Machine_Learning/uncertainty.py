@@ -0,0 +1,115 @@
+######################################################
+#
+# PyRAI2MD 2 module for uncertainty calibration
+#
+# Author Jingbai Li
+# Oct 18 2026
+#
+######################################################
+
+import numpy as np
+
+def rank_correlation(x, y):
+    """ Spearman rank correlation of two samples
+
+        Parameters:          Type:
+            x                ndarray     first sample
+            y                ndarray     second sample
+
+        Return:              Type:
+            corr             float       rank correlation, 0 if a sample is constant
+
+    """
+
+    x = np.array(x).reshape(-1)
+    y = np.array(y).reshape(-1)
+
+    if len(x) < 2 or np.ptp(x) == 0 or np.ptp(y) == 0:
+        return 0
+
+    rank_x = np.argsort(np.argsort(x))
+    rank_y = np.argsort(np.argsort(y))
+    corr = np.corrcoef(rank_x, rank_y)[0, 1]
+
+    return corr
+
+def calibration(ref, pred, std):
+    """ Compare the estimated errors of a property with the true errors
+
+        Parameters:          Type:
+            ref              ndarray     reference values of a batch
+            pred             ndarray     predicted values of a batch
+            std              ndarray     estimated errors (standard deviations) of a batch
+
+        Return:              Type:
+            stat             dict        calibration statistics
+
+    """
+
+    batch = len(ref)
+    err = np.abs(np.array(ref) - np.array(pred)).reshape((batch, -1))
+    std = np.array(std).reshape((batch, -1))
+    mae = np.mean(err)
+    mstd = np.mean(std)
+
+    ## the adaptive sampling thresholds are compared with the max std of a geometry
+    stat = {
+        'mae': mae,
+        'std': mstd,
+        'ratio': mae / mstd if mstd > 0 else 0,
+        'cover': np.mean(err <= 2 * std),
+        'corr': rank_correlation(np.amax(err, axis=1), np.amax(std, axis=1)),
+        'max_std': np.amax(std, axis=1),
+    }
+
+    return stat
+
+def calibration_report(models, timing):
+    """ Uncertainty calibration table of one or more models
+
+        Parameters:          Type:
+            models           dict        calibration statistics of each property of each model, the first model
+                                         is the one to calibrate and the last is the baseline if there are two
+            timing           dict        inference time of one md step of each model
+
+        Return:              Type:
+            report           str         calibration table
+
+    """
+
+    names = list(models.keys())
+    baseline = models[names[-1]] if len(names) > 1 else None
+
+    report = """
+  &uncertainty calibration
+-------------------------------------------------------
+  Errors in au, SOC in cm-1. MAE/std is the factor to rescale the estimated error,
+  <2std is the fraction of errors within two std, rank corr is the correlation between
+  the max error and the max std of each geometry.
+
+  Model        Property     MAE          Mean std     MAE/std   <2std   Rank corr   Std/baseline  Rank corr/baseline
+"""
+
+    for name in names:
+        for prop, stat in models[name].items():
+            if baseline is not None and name != names[-1] and prop in baseline.keys():
+                base = baseline[prop]
+                std_ratio = '%12.4f' % (stat['std'] / base['std'] if base['std'] > 0 else 0)
+                base_corr = '%18.4f' % rank_correlation(stat['max_std'], base['max_std'])
+            else:
+                std_ratio = '%12s' % '-'
+                base_corr = '%18s' % '-'
+
+            report += '  %-12s %-12s %12.8f %12.8f %9.4f %7.4f %11.4f %s  %s\n' % (
+                name, prop, stat['mae'], stat['std'], stat['ratio'], stat['cover'], stat['corr'], std_ratio, base_corr)
+
+    report += '\n'
+    for name in names:
+        report += '  Inference time per step %-12s %12.6f s\n' % (name, timing[name])
+
+    if baseline is not None and timing[names[-1]] > 0:
+        report += '  Speedup to baseline: %.2f\n' % (timing[names[-1]] / max(timing[names[0]], 1e-12))
+
+    report += '-------------------------------------------------------\n'
+
+    return report
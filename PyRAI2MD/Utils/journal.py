@@ -0,0 +1,128 @@
+######################################################
+#
+# PyRAI2MD 2 module for utility tools - journal
+#
+# Author Jingbai Li
+# Oct 18 2026
+#
+######################################################
+
+import os
+import json
+import pickle
+import shutil
+
+class Journal:
+    """ Journal class to checkpoint and resume an iterative workflow
+
+        Parameters:          Type:
+            path             str         path to the journal directory
+
+        Attribute:           Type:
+            path             str         path to the journal directory
+            logfile          str         path to the readable log of committed phases
+            statefile        str         path to the file of committed phases and the state of the last commit
+            entries          list        list of committed phases
+            state            bytes       pickled state of the last commit
+
+        Functions:           Returns:
+            commit           self        save state and mark a phase as completed
+            done             bool        check if a phase is completed
+            last             list        the last completed iteration and phase
+            load_state       dict        load the state saved at the last commit
+            save_job         self        save the result of a finished job
+            load_jobs        dict        load the results of finished jobs
+            clean            self        remove job records of previous iterations
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.logfile = '%s/journal.log' % path
+        self.statefile = '%s/state.pkl' % path
+        self.entries = []
+        self.state = None
+
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+        ## the phases are read from the state file, so the last phase always has its own state
+        ## an interrupted write leaves the previous file in place
+        if os.path.exists(self.statefile):
+            with open(self.statefile, 'rb') as journal:
+                saved = pickle.load(journal)
+            self.entries = saved['entries']
+            self.state = saved['state']
+
+    @staticmethod
+    def _dump(obj, file):
+        ## write to a temporary file first so an interrupted write never replaces a valid file
+        with open('%s.tmp' % file, 'wb') as out:
+            pickle.dump(obj, out)
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace('%s.tmp' % file, file)
+
+    def commit(self, itr, phase, state=None):
+        ## the phase and its state are replaced in one write, a phase without a state keeps the last one
+        ## the state is pickled at the commit, later changes of the objects are not saved with the next phase
+        if state is not None:
+            self.state = pickle.dumps(state)
+
+        self._dump({'entries': self.entries + [[itr, phase]], 'state': self.state}, self.statefile)
+        self.entries.append([itr, phase])
+
+        with open(self.logfile, 'a') as journal:
+            journal.write('%s\n' % json.dumps({'itr': itr, 'phase': phase}))
+
+        return self
+
+    def done(self, itr, phase):
+
+        return [itr, phase] in self.entries
+
+    def last(self):
+        if len(self.entries) == 0:
+            return [0, None]
+
+        return self.entries[-1]
+
+    def load_state(self):
+        if self.state is None:
+            return None
+
+        return pickle.loads(self.state)
+
+    def save_job(self, itr, job, job_id, data):
+        job_dir = '%s/iter-%s' % (self.path, itr)
+
+        if not os.path.exists(job_dir):
+            os.makedirs(job_dir)
+
+        self._dump(data, '%s/%s-%s.pkl' % (job_dir, job, job_id))
+
+        return self
+
+    def load_jobs(self, itr, job):
+        job_dir = '%s/iter-%s' % (self.path, itr)
+        jobs = {}
+
+        if not os.path.exists(job_dir):
+            return jobs
+
+        for file in os.listdir(job_dir):
+            if not file.startswith('%s-' % job) or not file.endswith('.pkl'):
+                continue
+            job_id = int(file[len(job) + 1: -4])
+            with open('%s/%s' % (job_dir, file), 'rb') as data:
+                jobs[job_id] = pickle.load(data)
+
+        return jobs
+
+    def clean(self, itr):
+        ## keep the job records of the current iteration only
+        for file in os.listdir(self.path):
+            if file.startswith('iter-') and file != 'iter-%s' % itr:
+                shutil.rmtree('%s/%s' % (self.path, file))
+
+        return self
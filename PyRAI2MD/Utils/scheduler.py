@@ -0,0 +1,108 @@
+######################################################
+#
+# PyRAI2MD 2 module for utility tools - job scheduling
+#
+# Author Jingbai Li
+# Oct 18 2026
+#
+######################################################
+
+import os
+import json
+import heapq
+import numpy as np
+
+class TimingHistory:
+    """ Job timing history class
+
+        Parameters:          Type:
+            path             str         path to the timing history file
+
+        Attribute:           Type:
+            path             str         path to the timing history file
+            history          dict        timing records per job category and lineage
+
+        Functions:           Returns:
+            record           self        add the timing of a finished job
+            predict          list        predict the cost of a list of jobs
+            save             self        save timing history to the file
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.history = {}
+
+        if os.path.exists(path):
+            with open(path, 'r') as infile:
+                self.history = json.load(infile)
+
+    def record(self, category, lineage, walltime, method=None, natom=0, status=1, itr=0):
+        ## This function add a timing record to the history of the given category and lineage
+        ## status is the completion of QM calculations or the number of steps of MD trajectories
+        if category not in self.history.keys():
+            self.history[category] = {}
+
+        lineage = str(lineage)
+        if lineage not in self.history[category].keys():
+            self.history[category][lineage] = []
+
+        self.history[category][lineage].append({
+            'walltime': float(walltime),
+            'method': method,
+            'natom': int(natom),
+            'status': int(status),
+            'itr': int(itr),
+        })
+
+        return self
+
+    def predict(self, category, lineage):
+        ## This function predict job costs from the last-seen time in the same lineage
+        ## jobs without history use the average time of the category, or zero without any records
+        if category not in self.history.keys():
+            return [0.0 for _ in lineage]
+
+        records = self.history[category]
+        last_seen = [x[-1]['walltime'] for x in records.values() if len(x) > 0]
+
+        if len(last_seen) > 0:
+            default = float(np.mean(last_seen))
+        else:
+            default = 0.0
+
+        cost = []
+        for n in lineage:
+            n = str(n)
+            if n in records.keys() and len(records[n]) > 0:
+                cost.append(records[n][-1]['walltime'])
+            else:
+                cost.append(default)
+
+        return cost
+
+    def save(self):
+        with open(self.path, 'w') as outfile:
+            json.dump(self.history, outfile)
+
+        return self
+
+def longest_first(cost):
+    ## This function return the job order sorted from the longest to the shortest predicted cost
+    ## the original order is kept for jobs with the same cost
+
+    return np.argsort(-np.array(cost, dtype=float), kind='stable').tolist()
+
+def makespan(cost, ncpu, order=None):
+    ## This function simulate the makespan of dispatching jobs to ncpu workers in a given order
+    ## each job is sent to the first available worker as imap_unordered does
+
+    if order is None:
+        order = range(len(cost))
+
+    workers = [0.0 for _ in range(np.amax([int(ncpu), 1]))]
+    for n in order:
+        start = heapq.heappop(workers)
+        heapq.heappush(workers, start + cost[n])
+
+    return float(np.amax(workers))
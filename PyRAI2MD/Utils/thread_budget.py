@@ -0,0 +1,181 @@
+######################################################
+#
+# PyRAI2MD 2 module for utility tools - thread budget
+#
+# Author Jingbai Li
+# Oct 18 2026
+#
+######################################################
+
+import os
+import sys
+import shutil
+import multiprocessing
+
+THREAD_VARIABLES = ['OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS']
+
+def node_cores():
+    ## cores this process may run on, which respects taskset and batch system pinning
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        return list(range(os.cpu_count() or 1))
+
+def node_memory():
+    ## available memory in MB, 0 if unknown
+    try:
+        with open('/proc/meminfo', 'r') as meminfo:
+            for line in meminfo:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) // 1024
+    except OSError:
+        pass
+
+    return 0
+
+def thread_env(nthreads, env=None):
+    ## environment of a subprocess with a fixed thread budget
+    env = dict(os.environ if env is None else env)
+    for var in THREAD_VARIABLES:
+        env[var] = str(nthreads)
+    env['TF_NUM_INTEROP_THREADS'] = str(min(2, nthreads))
+
+    return env
+
+def pinned_command(command, cores):
+    ## command pinned to a core set by taskset, which is safe to start from threads unlike preexec_fn
+    ## the command runs unpinned if taskset is not available
+    if cores is None or shutil.which('taskset') is None:
+        return command
+
+    return ['taskset', '-c', ','.join(str(x) for x in sorted(cores))] + command
+
+def init_worker(slots, nthreads):
+    ## pool initializer, every worker takes one core set and limits the threads of its libraries
+    ## QC programs started by the worker inherit the environment and the affinity
+    os.environ.update(thread_env(nthreads))
+    cores = slots.get() if slots is not None else None
+    if cores is not None:
+        os.sched_setaffinity(0, cores)
+
+    ## tensorflow reads the environment when it starts, set the pools directly if it is already imported
+    if 'tensorflow' in sys.modules:
+        tf = sys.modules['tensorflow']
+        try:
+            tf.config.threading.set_intra_op_parallelism_threads(nthreads)
+            tf.config.threading.set_inter_op_parallelism_threads(min(2, nthreads))
+        except RuntimeError:
+            pass
+
+## thread settings of each QC program [thread keyword, process keyword], the total is their product
+QC_THREADS = {
+    'molcas': ['omp_num_threads', 'molcas_nproc'],
+    'mlctkr': ['omp_num_threads', 'molcas_nproc'],
+    'bagel': ['omp_num_threads', 'bagel_nproc'],
+    'xtb': ['xtb_nproc', None],
+}
+
+QC_SECTION = {
+    'molcas': 'molcas',
+    'mlctkr': 'molcas',
+    'bagel': 'bagel',
+    'xtb': 'xtb',
+}
+
+class ThreadBudget:
+    """ Thread budget of parallel workers on a node
+
+        Parameters:          Type:
+            keywords         dict        keyword dictionary
+
+        Attribute:           Type:
+            enforce          int         set the threads of workers (1) or only report oversubscription (0)
+            affinity         int         pin workers to separate core sets (1) or not (0)
+            cores            list        available core ids
+            threads          dict        number of threads per worker of each role
+            info             str         budget of the last planned role
+
+        Functions:           Returns:
+            plan             self        split the cores over a number of workers of a role
+            pool_args        dict        initializer arguments of a multiprocessing pool
+            qc_keywords      dict        keywords with the QC thread settings of the budget
+            requested        int         number of threads a QC worker requests in the input
+
+    """
+
+    def __init__(self, keywords=None):
+        ncore = keywords['control']['ncore']
+        self.enforce = keywords['control']['thread_budget']
+        self.affinity = keywords['control']['affinity']
+        self.cores = node_cores()
+        if 0 < ncore < len(self.cores):
+            self.cores = self.cores[0: ncore]
+        self.threads = {}
+        self.slots = {}
+        self.info = ''
+
+    @staticmethod
+    def requested(keywords, qm):
+        ## threads per QC worker set in the input, unknown programs count as one thread
+        if qm not in QC_THREADS.keys():
+            return 1
+
+        variables = keywords[QC_SECTION[qm]]
+        thread_key, proc_key = QC_THREADS[qm]
+        nthreads = int(variables[thread_key])
+        if proc_key is not None:
+            nthreads *= int(variables[proc_key])
+
+        return max(nthreads, 1)
+
+    def plan(self, role, nworker, requested=1):
+        ## This function splits the cores evenly over the workers of a role and reports oversubscription
+        ## requested is the number of threads a worker would use without the budget
+        ncore = len(self.cores)
+        nworker = max(int(nworker), 1)
+        nthreads = max(ncore // nworker, 1)
+        self.threads[role] = nthreads
+        self.slots[role] = [self.cores[n * nthreads: (n + 1) * nthreads] for n in range(nworker)]
+
+        if self.enforce == 1:
+            self.info = '  Thread budget %s: %s workers x %s threads on %s cores\n' % (role, nworker, nthreads, ncore)
+            total = nworker * nthreads
+        else:
+            self.info = ''
+            total = nworker * requested
+
+        if total > ncore:
+            self.info += '  Warning: %s workers use %s threads on %s cores, oversubscribed %.1fx\n' % (
+                role, total, ncore, total / ncore)
+
+        return self
+
+    def pool_args(self, role):
+        ## initializer of the pool that runs the workers of a planned role
+        if self.enforce != 1 or role not in self.threads.keys():
+            return {}
+
+        slots = None
+        if self.affinity == 1 and len(self.cores) >= len(self.slots[role]):
+            slots = multiprocessing.Queue()
+            for cores in self.slots[role]:
+                slots.put(cores)
+
+        return {'initializer': init_worker, 'initargs': (slots, self.threads[role])}
+
+    def qc_keywords(self, keywords, qm, role='QM'):
+        ## the run scripts of QC programs export their own thread counts, replace them with the budget
+        ## processes are kept and the threads per process are reduced
+        if self.enforce != 1 or qm not in QC_THREADS.keys() or role not in self.threads.keys():
+            return keywords
+
+        keywords = keywords.copy()
+        section = QC_SECTION[qm]
+        variables = keywords[section].copy()
+        thread_key, proc_key = QC_THREADS[qm]
+        nproc = 1 if proc_key is None else max(int(variables[proc_key]), 1)
+        nthreads = max(self.threads[role] // nproc, 1)
+        variables[thread_key] = str(nthreads) if isinstance(variables[thread_key], str) else nthreads
+        keywords[section] = variables
+
+        return keywords
@@ -7,29 +7,49 @@
 #
 ######################################################
 
-from PyRAI2MD.Quantum_Chemistry.qc_bagel import Bagel
-from PyRAI2MD.Quantum_Chemistry.qc_molcas import Molcas
-from PyRAI2MD.Quantum_Chemistry.qc_molcas_tinker import MolcasTinker
-from PyRAI2MD.Quantum_Chemistry.qc_orca import Orca
-from PyRAI2MD.Quantum_Chemistry.qc_xtb import Xtb
-from PyRAI2MD.Machine_Learning.model_NN import DNN
+import sys
+import importlib
+
 from PyRAI2MD.Machine_Learning.model_helper import DummyModel
 
-try:
-    from PyRAI2MD.Machine_Learning.model_pyNNsMD import MLP
-except ModuleNotFoundError:
-    MLP = DummyModel
+## backends are imported on first use, so QC jobs and workers never import tensorflow
+BACKENDS = {
+    'molcas': ['PyRAI2MD.Quantum_Chemistry.qc_molcas', 'Molcas'],
+    'mlctkr': ['PyRAI2MD.Quantum_Chemistry.qc_molcas_tinker', 'MolcasTinker'],
+    'bagel': ['PyRAI2MD.Quantum_Chemistry.qc_bagel', 'Bagel'],
+    'orca': ['PyRAI2MD.Quantum_Chemistry.qc_orca', 'Orca'],
+    'xtb': ['PyRAI2MD.Quantum_Chemistry.qc_xtb', 'Xtb'],
+    'nn': ['PyRAI2MD.Machine_Learning.model_NN', 'DNN'],
+    'mlp': ['PyRAI2MD.Machine_Learning.model_pyNNsMD', 'MLP'],
+    'schnet': ['PyRAI2MD.Machine_Learning.model_pyNNsMD', 'Schnet'],
+    'e2n2': ['PyRAI2MD.Machine_Learning.model_GCNNP', 'E2N2'],
+}
+
+## backends depending on optional packages fall back to DummyModel
+OPTIONAL_BACKENDS = ['mlp', 'schnet', 'e2n2']
+
+_loaded_backends = {}
+
+def load_backend(qm):
+    ## This function import the class of the selected method once and cache it
 
-try:
-    from PyRAI2MD.Machine_Learning.model_pyNNsMD import Schnet
-except ModuleNotFoundError:
-    Schnet = DummyModel
+    if qm in _loaded_backends.keys():
+        return _loaded_backends[qm]
 
-try:
-    from PyRAI2MD.Machine_Learning.model_GCNNP import E2N2
+    if qm not in BACKENDS.keys():
+        sys.exit('\n  KeyError\n  PyRAI2MD: cannot recognize method %s' % qm)
 
-except ModuleNotFoundError:
-    E2N2 = DummyModel
+    module, name = BACKENDS[qm]
+    try:
+        backend = getattr(importlib.import_module(module), name)
+    except ModuleNotFoundError:
+        if qm not in OPTIONAL_BACKENDS:
+            raise
+        backend = DummyModel
+
+    _loaded_backends[qm] = backend
+
+    return backend
 
 class QM:
     """ Electronic structure method class
@@ -46,23 +66,13 @@ class QM:
             load             self        load a model if qm == 'nn'
             appendix         self        add more information to the selected method
             evaluate         self        run the selected method
+            screen           ndarray     compute uncertainty for a batch of geometries if qm is a ML method
+            validate         ndarray     compute mean absolute errors for a labeled set if qm is a ML method
 
     """
 
     def __init__(self, qm, keywords=None, job_id=None):
-        qm_list = {
-            'molcas': Molcas,
-            'mlctkr': MolcasTinker,
-            'bagel': Bagel,
-            'orca': Orca,
-            'xtb': Xtb,
-            'nn': DNN,
-            'mlp': MLP,
-            'schnet': Schnet,
-            'e2n2': E2N2,
-        }
-
-        self.method = qm_list[qm](keywords=keywords, job_id=job_id)  # This should pass hypers
+        self.method = load_backend(qm)(keywords=keywords, job_id=job_id)  # This should pass hypers
 
     def train(self):
         metrics = self.method.train()
@@ -79,3 +89,13 @@ class QM:
     def evaluate(self, traj):
         traj = self.method.evaluate(traj)
         return traj
+
+    def screen(self, coord):  # batched uncertainty, only available for ML methods
+        if hasattr(self.method, 'screen'):
+            return self.method.screen(coord)
+        return None
+
+    def validate(self, coord, energy, grad):  # hold-out errors, only available for ML methods
+        if hasattr(self.method, 'validate'):
+            return self.method.validate(coord, energy, grad)
+        return None
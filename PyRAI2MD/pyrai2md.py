@@ -20,13 +20,7 @@ from PyRAI2MD.variables import read_input
 from PyRAI2MD.variables import start_info
 from PyRAI2MD.methods import QM
 from PyRAI2MD.Molecule.trajectory import Trajectory
-from PyRAI2MD.Dynamics.aimd import AIMD
-from PyRAI2MD.Dynamics.mixaimd import MIXAIMD
-from PyRAI2MD.Dynamics.single_point import SinglePoint
-from PyRAI2MD.Dynamics.hop_probability import HopProb
 from PyRAI2MD.Machine_Learning.training_data import Data
-from PyRAI2MD.Machine_Learning.grid_search import GridSearch
-from PyRAI2MD.Machine_Learning.adaptive_sampling import AdaptiveSampling
 from PyRAI2MD.Utils.coordinates import read_initcond
 from PyRAI2MD.Utils.coordinates import print_coord
 from PyRAI2MD.Utils.sampling import sampling
@@ -120,6 +114,8 @@ class PYRAI2MD:
         return self
 
     def _single_point(self):
+        from PyRAI2MD.Dynamics.single_point import SinglePoint
+
         ## create a trajectory and method model
         traj = Trajectory(self.title, keywords=self.keywords)
         method = QM(self.qm, keywords=self.keywords, job_id=None)
@@ -134,6 +130,8 @@ class PYRAI2MD:
         return self
 
     def _hop_probability(self):
+        from PyRAI2MD.Dynamics.hop_probability import HopProb
+
         ## create a trajectory and method model
         traj = Trajectory(self.title, keywords=self.keywords)
         hop = HopProb(trajectory=traj, keywords=self.keywords)
@@ -141,6 +139,8 @@ class PYRAI2MD:
         return self
 
     def _dynamics(self):
+        from PyRAI2MD.Dynamics.aimd import AIMD
+
         ## get md info
         md = self.keywords['md']
         initcond = md['initcond']
@@ -190,6 +190,8 @@ class PYRAI2MD:
         return self
 
     def _hybrid_dynamics(self):
+        from PyRAI2MD.Dynamics.mixaimd import MIXAIMD
+
         ## get md info
         md = self.keywords['md']
         initcond = md['initcond']
@@ -242,18 +244,31 @@ class PYRAI2MD:
         return self
 
     def _active_learning(self):
+        from PyRAI2MD.Machine_Learning.adaptive_sampling import AdaptiveSampling
+
         learn_proc = AdaptiveSampling(keywords=self.keywords)
         learn_proc.search()
 
         return self
 
     def _grid_search(self):
+        from PyRAI2MD.Machine_Learning.grid_search import GridSearch
+
         grid = GridSearch(keywords=self.keywords)
         grid.search()
 
         return self
 
+    def _distillation(self):
+        from PyRAI2MD.Machine_Learning.distillation import Distillation
+
+        distill = Distillation(keywords=self.keywords)
+        distill.run()
+
+        return self
+
     def run(self):
+        ## each job imports its own modules, methods are imported by QM on first use
         job_func = {
             'sp': self._single_point,
             'md': self._dynamics,
@@ -264,6 +279,7 @@ class PYRAI2MD:
             'prediction': self._machine_learning,
             'predict': self._machine_learning,
             'search': self._grid_search,
+            'distill': self._distillation,
         }
         job_func[self.jobtype]()
 
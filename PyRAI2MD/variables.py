@@ -54,6 +54,19 @@ def read_control(keywords, values):
         'inisoc': ReadVal('f'),
         'fwdsoc': ReadVal('i'),
         'bcksoc': ReadVal('i'),
+        'rescreen': ReadVal('i'),
+        'maxqc': ReadVal('i'),
+        'resume': ReadVal('i'),
+        'incremental': ReadVal('i'),
+        'replay': ReadVal('i'),
+        'fullretrain': ReadVal('i'),
+        'maxdrift': ReadVal('f'),
+        'holdout': ReadVal('i'),
+        'dedup': ReadVal('f'),
+        'dedup_rmsd': ReadVal('f'),
+        'ncore': ReadVal('i'),
+        'thread_budget': ReadVal('i'),
+        'affinity': ReadVal('i'),
         'load': ReadVal('i'),
         'transfer': ReadVal('i'),
         'pop_step': ReadVal('i'),
@@ -253,6 +266,8 @@ def read_md(keywords, values):
         'ref_grad': ReadVal('i'),
         'ref_nac': ReadVal('i'),
         'ref_soc': ReadVal('i'),
+        'online': ReadVal('i'),
+        'online_size': ReadVal('i'),
         'datapath': ReadVal('s'),
     }
 
@@ -286,6 +301,13 @@ def read_nn(keywords, values):
         'permute_map': ReadVal('s'),
         'gpu': ReadVal('i'),
         'silent': ReadVal('i'),
+        'engine': ReadVal('s'),
+        'feature_cache': ReadVal('s'),
+        'executor': ReadVal('s'),
+        'stream': ReadVal('i'),
+        'uncertainty': ReadVal('s'),
+        'mc_passes': ReadVal('i'),
+        'baseline': ReadVal('s'),
     }
 
     for i in values:
@@ -316,6 +338,15 @@ def read_grid_search(keywords, values):
         'n_rbf': ReadVal('il'),
         'use_hpc': ReadVal('i'),
         'retrieve': ReadVal('i'),
+        'ncore': ReadVal('i'),
+        'job_threads': ReadVal('i'),
+        'job_memory': ReadVal('i'),
+        'memo': ReadVal('s'),
+        'mode': ReadVal('s'),
+        'eta': ReadVal('i'),
+        'min_budget': ReadVal('f'),
+        'sample': ReadVal('i'),
+        'surrogate': ReadVal('i'),
     }
 
     for i in values:
@@ -329,6 +360,30 @@ def read_grid_search(keywords, values):
 
     return keywords
 
+def read_distill(keywords, values):
+    ## This function read variables from &distill
+    keyfunc = {
+        'teacher': ReadVal('s'),
+        'student': ReadVal('s'),
+        'depth': ReadVal('il'),
+        'nn_size': ReadVal('il'),
+        'perturb': ReadVal('i'),
+        'displace': ReadVal('f'),
+        'tolerance': ReadVal('f'),
+        'uncertainty': ReadVal('s'),
+    }
+
+    for i in values:
+        if len(i.split()) < 2:
+            continue
+        key, val = i.split()[0], i.split()[1:]
+        key = key.lower()
+        if key not in keyfunc.keys():
+            sys.exit('\n  KeywordError\n  PyRAI2MD: cannot recognize keyword %s in &distill' % key)
+        keywords[key] = keyfunc[key](val)
+
+    return keywords
+
 def read_mlp(keywords, values):
     ## This function read variables from &eg1,&eg2,&nac1,&nac2,&soc,&soc2
     keyfunc = {
@@ -361,6 +416,7 @@ def read_mlp(keywords, values):
         'initialize_weights': ReadVal('b'),
         'val_disjoint': ReadVal('b'),
         'epo': ReadVal('i'),
+        'epo_retrain': ReadVal('i'),
         'epomin': ReadVal('i'),
         'pre_epo': ReadVal('i'),
         'patience': ReadVal('i'),
@@ -555,6 +611,19 @@ def read_input(ld_input):
         'inisoc': 0.3,
         'fwdsoc': 1,
         'bcksoc': 1,
+        'rescreen': 0,
+        'maxqc': 0,
+        'resume': 0,
+        'incremental': 0,
+        'replay': 1000,
+        'fullretrain': 5,
+        'maxdrift': 0.2,
+        'holdout': 100,
+        'dedup': 0,
+        'dedup_rmsd': 0,
+        'ncore': 0,
+        'thread_budget': 0,
+        'affinity': 0,
         'load': 1,
         'transfer': 0,
         'pop_step': 200,
@@ -679,6 +748,8 @@ def read_input(ld_input):
         'ref_grad': 0,
         'ref_nac': 0,
         'ref_soc': 0,
+        'online': 0,
+        'online_size': 10,
         'datapath': None,
     }
 
@@ -699,7 +770,9 @@ def read_input(ld_input):
         'soc_unit': 'si',
         'ml_seed': 1,  # Caution! Not allow user to set.
         'data': None,  # Caution! Not allow user to set.
+        'finetune': 0,  # Caution! Not allow user to set.
         'search': None,  # Caution! Not allow user to set.
+        'distill': None,  # Caution! Not allow user to set.
         'eg': None,  # Caution! This value will be updated later. Not allow user to set.
         'nac': None,  # Caution! This value will be updated later. Not allow user to set.
         'eg2': None,  # Caution! This value will be updated later. Not allow user to set.
@@ -708,6 +781,13 @@ def read_input(ld_input):
         'soc2': None,  # Caution! This value will be updated later. Not allow user to set.
         'permute_map': 'No',
         'gpu': 0,
+        'engine': 'tf',
+        'feature_cache': None,
+        'executor': 'subprocess',
+        'stream': 0,
+        'uncertainty': 'ensemble',
+        'mc_passes': 16,
+        'baseline': None,
     }
 
     variables_search = {
@@ -725,6 +805,26 @@ def read_input(ld_input):
         'n_rbf': [],
         'use_hpc': 0,
         'retrieve': 0,
+        'ncore': 0,
+        'job_threads': 0,
+        'job_memory': 0,
+        'memo': None,
+        'mode': 'grid',
+        'eta': 3,
+        'min_budget': 0.05,
+        'sample': 0,
+        'surrogate': 0,
+    }
+
+    variables_distill = {
+        'teacher': None,
+        'student': None,
+        'depth': [],
+        'nn_size': [],
+        'perturb': 1,
+        'displace': 0.05,
+        'tolerance': 1.5,
+        'uncertainty': None,
     }
 
     variables_eg = {
@@ -757,6 +857,7 @@ def read_input(ld_input):
         'initialize_weights': True,
         'val_disjoint': True,
         'epo': 2000,
+        'epo_retrain': 0,
         'epomin': 1000,
         'patience': 300,
         'max_time': 300,
@@ -801,6 +902,7 @@ def read_input(ld_input):
         'initialize_weights': True,
         'val_disjoint': True,
         'epo': 2000,
+        'epo_retrain': 0,
         'epomin': 1000,
         'pre_epo': 100,
         'patience': 300,
@@ -845,6 +947,7 @@ def read_input(ld_input):
         'initialize_weights': True,
         'val_disjoint': True,
         'epo': 2000,
+        'epo_retrain': 0,
         'epomin': 1000,
         'patience': 300,
         'max_time': 300,
@@ -1112,6 +1215,7 @@ def read_input(ld_input):
         'schnet': variables_nn,
         'e2n2': variables_nn,
         'search': variables_search,
+        'distill': variables_distill,
         'eg': variables_eg.copy(),
         'nac': variables_nac.copy(),
         'soc': variables_soc.copy(),
@@ -1140,6 +1244,7 @@ def read_input(ld_input):
         'schnet': read_nn,
         'e2n2': read_nn,
         'search': read_grid_search,
+        'distill': read_distill,
         'eg': read_mlp,
         'nac': read_mlp,
         'soc': read_mlp,
@@ -1183,6 +1288,7 @@ def read_input(ld_input):
 
     ## update variables_nn
     variables_all['nn']['search'] = variables_input['search']
+    variables_all['nn']['distill'] = variables_input['distill']
     variables_all['nn']['eg'] = variables_input['eg']
     variables_all['nn']['nac'] = variables_input['nac']
     variables_all['nn']['soc'] = variables_input['soc']
@@ -1270,6 +1376,7 @@ def start_info(variables_all):
     variables_e2n2_soc = variables_e2n2['e2n2_soc']
 
     variables_search = variables_nn['search']
+    variables_distill = variables_nn['distill']
 
     control_info = """
   &control
@@ -1277,6 +1384,9 @@ def start_info(variables_all):
   Title:                      %-10s
   NCPU for ML:                %-10s
   NCPU for QC:                %-10s
+  Cores on node:              %-10s
+  Thread budget:              %-10s
+  CPU affinity:               %-10s
   Seed:                       %-10s
   Job: 	                      %-10s
   QM:          	       	      %-10s
@@ -1287,6 +1397,9 @@ def start_info(variables_all):
         variables_control['title'],
         variables_control['ml_ncpu'],
         variables_control['qc_ncpu'],
+        variables_control['ncore'],
+        variables_control['thread_budget'],
+        variables_control['affinity'],
         variables_control['gl_seed'],
         variables_control['jobtype'],
         variables_control['qm'],
@@ -1335,6 +1448,16 @@ def start_info(variables_all):
   Max discard range           %-10s
   Refine crossing:            %-10s
   Refine points/range: 	      %-10s %-10s %-10s
+  Re-screen candidates:       %-10s
+  Max QC per iteration:       %-10s
+  Resume from journal:        %-10s
+  Incremental training:       %-10s
+  Replay data size:           %-10s
+  Full retraining interval:   %-10s
+  Max hold-out error drift:   %-10s
+  Hold-out data size:         %-10s
+  Duplicate tolerance:        %-10s
+  Duplicate RMSD:             %-10s
   MaxStd  energy:             %-10s
   MinStd  energy:             %-10s
   InitStd energy:             %-10s
@@ -1373,6 +1496,16 @@ def start_info(variables_all):
         variables_control['refine_num'],
         variables_control['refine_start'],
         variables_control['refine_end'],
+        variables_control['rescreen'],
+        variables_control['maxqc'],
+        variables_control['resume'],
+        variables_control['incremental'],
+        variables_control['replay'],
+        variables_control['fullretrain'],
+        variables_control['maxdrift'],
+        variables_control['holdout'],
+        variables_control['dedup'],
+        variables_control['dedup_rmsd'],
         variables_control['maxenergy'],
         variables_control['minenergy'],
         variables_control['inienergy'],
@@ -1496,13 +1629,17 @@ def start_info(variables_all):
   Mix Gradient                %-10s
   Mix NAC                     %-10s
   Mix SOC                     %-10s
+  Online learning             %-10s
+  Online batch size           %-10s
 -------------------------------------------------------
 
 """ % (
         variables_md['ref_energy'],
         variables_md['ref_grad'],
         variables_md['ref_nac'],
-        variables_md['ref_soc']
+        variables_md['ref_soc'],
+        variables_md['online'],
+        variables_md['online_size']
     )
 
     nn_info = """
@@ -1521,6 +1658,13 @@ def start_info(variables_all):
   EG unit:                    %-10s
   NAC unit:                   %-10s
   Data permutation            %-10s
+  Inference engine:           %-10s
+  Feature cache:              %-10s
+  Training executor:          %-10s
+  Stream training data:       %-10s
+  Uncertainty:                %-10s
+  MC dropout passes:          %-10s
+  Calibration baseline:       %-10s
 -------------------------------------------------------
 
 """ % (
@@ -1536,7 +1680,14 @@ def start_info(variables_all):
         variables_nn['shuffle'],
         variables_nn['eg_unit'],
         variables_nn['nac_unit'],
-        variables_nn['permute_map']
+        variables_nn['permute_map'],
+        variables_nn['engine'],
+        variables_nn['feature_cache'],
+        variables_nn['executor'],
+        variables_nn['stream'],
+        variables_nn['uncertainty'],
+        variables_nn['mc_passes'],
+        variables_nn['baseline']
     )
 
     nn_info += """
@@ -1565,6 +1716,7 @@ def start_info(variables_all):
   Validation disjoint:        %-20s %-20s %-20s
   Validation split:           %-20s %-20s %-20s
   Epoch:                      %-20s %-20s %-20s
+  Epoch retrain:              %-20s %-20s %-20s
   Epoch_pre:                  %-20s %-20s %-20s
   Epoch_min                   %-20s %-20s %-20s
   Patience:                   %-20s %-20s %-20s
@@ -1640,6 +1792,9 @@ def start_info(variables_all):
         variables_eg['epo'],
         variables_nac['epo'],
         variables_soc['epo'],
+        variables_eg['epo_retrain'],
+        variables_nac['epo_retrain'],
+        variables_soc['epo_retrain'],
         '',
         variables_nac['pre_epo'],
         '',
@@ -1701,6 +1856,7 @@ def start_info(variables_all):
   Validation disjoint:        %-20s %-20s %-20s
   Validation split:           %-20s %-20s %-20s
   Epoch:                      %-20s %-20s %-20s
+  Epoch retrain:              %-20s %-20s %-20s
   Epoch_pre:                  %-20s %-20s %-20s
   Epoch_min                   %-20s %-20s %-20s
   Patience:                   %-20s %-20s %-20s
@@ -1776,6 +1932,9 @@ def start_info(variables_all):
         variables_eg2['epo'],
         variables_nac2['epo'],
         variables_soc2['epo'],
+        variables_eg2['epo_retrain'],
+        variables_nac2['epo_retrain'],
+        variables_soc2['epo_retrain'],
         '',
         variables_nac2['pre_epo'],
         '',
@@ -2380,6 +2539,15 @@ def start_info(variables_all):
   Dropout:                    %-10s
   Job distribution            %-10s
   Retrieve data               %-10s
+  Cores for local jobs        %-10s
+  Threads per local job       %-10s
+  Memory per local job (MB)   %-10s
+  Memo of trained models      %-10s
+  Search mode                 %-10s
+  Halving factor              %-10s
+  Minimum budget              %-10s
+  Sampled grid points         %-10s
+  Surrogate proposals         %-10s
 -------------------------------------------------------
 
 """ % (
@@ -2390,7 +2558,40 @@ def start_info(variables_all):
         variables_search['reg_l2'],
         variables_search['dropout'],
         variables_search['use_hpc'],
-        variables_search['retrieve']
+        variables_search['retrieve'],
+        variables_search['ncore'],
+        variables_search['job_threads'],
+        variables_search['job_memory'],
+        variables_search['memo'],
+        variables_search['mode'],
+        variables_search['eta'],
+        variables_search['min_budget'],
+        variables_search['sample'],
+        variables_search['surrogate']
+    )
+
+    distill_info = """
+  &distillation
+-------------------------------------------------------
+  Teacher models:             %-10s
+  Student title:              %-10s
+  Student layers:             %-10s
+  Student neurons/layer:      %-10s
+  Perturbations/geometry:     %-10s
+  Displacement (Angstrom):    %-10s
+  Error tolerance:            %-10s
+  Student uncertainty:        %-10s
+-------------------------------------------------------
+
+""" % (
+        variables_distill['teacher'],
+        variables_distill['student'],
+        variables_distill['depth'],
+        variables_distill['nn_size'],
+        variables_distill['perturb'],
+        variables_distill['displace'],
+        variables_distill['tolerance'],
+        variables_distill['uncertainty']
     )
 
     molcas_info = """
@@ -2526,6 +2727,7 @@ def start_info(variables_all):
         'prediction': control_info + molecule_info + info_method[qm],
         'predict': control_info + molecule_info + info_method[qm],
         'search': control_info + molecule_info + info_method[qm] + search_info,
+        'distill': control_info + molecule_info + info_method[qm] + distill_info,
     }
 
     log_info = info_jobtype[jobtype]
@@ -0,0 +1,120 @@
+######################################################
+#
+# PyRAI2MD test data store
+#
+# Author Jingbai Li
+# Oct 19 2026
+#
+######################################################
+
+import os
+import shutil
+import numpy as np
+
+try:
+    import PyRAI2MD
+
+    pyrai2mddir = os.path.dirname(PyRAI2MD.__file__)
+
+except ModuleNotFoundError:
+    pyrai2mddir = ''
+
+
+def TestDataStore():
+    """ data store test
+
+    1. append and read back
+    2. fork
+    3. mask and replace
+
+    """
+
+    testdir = '%s/results/data_store' % (os.getcwd())
+
+    summary = """
+ *---------------------------------------------------*
+ |                                                   |
+ |            Data Store Test Calculation            |
+ |                                                   |
+ *---------------------------------------------------*
+
+ Check data store:
+-------------------------------------------------------
+"""
+
+    if pyrai2mddir == '':
+        summary += '\n PyRAI2MD is not installed, skip test\n\n'
+        return summary, 'FAILED(PyRAI2MD not found)'
+
+    if os.path.exists(testdir):
+        shutil.rmtree(testdir)
+    os.makedirs(testdir)
+
+    results, code = CheckDataStore(testdir)
+    summary += '%s\n' % results
+
+    return summary, code
+
+
+def Check(results, label, passed):
+    ## This function records the result of one check
+    results.append('   %-56s %s' % (label, 'ok' if passed else 'wrong'))
+
+    return passed
+
+
+def Columns(size, natom=3, nstate=2, seed=0):
+    ## This function generates random training data of a store
+    rng = np.random.default_rng(seed)
+    columns = {
+        'symbols': np.array([['C', 'H', 'H'][0: natom]] * size),
+        'geos': rng.normal(size=(size, natom, 3)),
+        'energy': rng.normal(size=(size, nstate)),
+        'grad': rng.normal(size=(size, nstate, natom, 3)),
+        'nac': rng.normal(size=(size, 1, natom, 3)),
+        'soc': rng.normal(size=(size, 1)),
+    }
+
+    return columns
+
+
+def CheckDataStore(testdir):
+    ## appended data reads back in order, repeated tags are skipped and forks leave the source unchanged
+    from PyRAI2MD.Machine_Learning.data_store import DataStore, STORE_FIELDS, is_store
+
+    path = '%s/store' % testdir
+    first = Columns(4, seed=1)
+    second = Columns(7, seed=2)
+    store = DataStore(path).create(natom=3, nstate=2, nnac=1, nsoc=1)
+    store.append(first, tag='iter 1')
+    store.append(first, tag='iter 1')
+    store.append(second, tag='iter 2')
+
+    reopened = DataStore(path)
+    results = []
+    passed = [
+        Check(results, 'store header', is_store(path)),
+        Check(results, 'size after repeated tag', reopened.size == 11),
+        Check(results, 'tags', reopened.tags == ['iter 1', 'iter 2']),
+        Check(results, 'fields round trip', all(
+            np.array_equal(reopened.read(x), np.concatenate([first[x], second[x]])) for x in STORE_FIELDS)),
+    ]
+
+    fork = reopened.fork('%s/store-fork' % testdir)
+    fork.append(Columns(2, seed=3), tag='iter 3')
+    passed += [
+        Check(results, 'fork history starts from the source', fork.tags == [os.path.abspath(path), 'iter 3']),
+        Check(results, 'fork appends', fork.size == 13),
+        Check(results, 'source unchanged by the fork', DataStore(path).size == 11),
+    ]
+
+    new = Columns(2, seed=4)
+    reopened.mask([0, 5])
+    reopened.replace(new, [5, 6])
+    stored = DataStore(path)
+    passed += [
+        Check(results, 'replaced data points', np.array_equal(stored.read('energy')[5: 7], new['energy'])),
+        Check(results, 'replaced data points are valid', stored.masked == [0]),
+    ]
+
+    return '\n'.join(results), 'PASSED' if all(passed) else 'FAILED(data store round trip)'
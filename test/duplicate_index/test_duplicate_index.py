@@ -0,0 +1,98 @@
+######################################################
+#
+# PyRAI2MD test duplicate index
+#
+# Author Jingbai Li
+# Oct 19 2026
+#
+######################################################
+
+import os
+import shutil
+import itertools
+import numpy as np
+
+try:
+    import PyRAI2MD
+
+    pyrai2mddir = os.path.dirname(PyRAI2MD.__file__)
+
+except ModuleNotFoundError:
+    pyrai2mddir = ''
+
+
+def TestDuplicateIndex():
+    """ duplicate index test
+
+    1. assignment
+    2. aligned rmsd
+    3. find and filter duplicates
+
+    """
+
+    testdir = '%s/results/duplicate_index' % (os.getcwd())
+
+    summary = """
+ *---------------------------------------------------*
+ |                                                   |
+ |         Duplicate Index Test Calculation          |
+ |                                                   |
+ *---------------------------------------------------*
+
+ Check duplicate index:
+-------------------------------------------------------
+"""
+
+    if pyrai2mddir == '':
+        summary += '\n PyRAI2MD is not installed, skip test\n\n'
+        return summary, 'FAILED(PyRAI2MD not found)'
+
+    if os.path.exists(testdir):
+        shutil.rmtree(testdir)
+    os.makedirs(testdir)
+
+    results, code = CheckDuplicate(testdir)
+    summary += '%s\n' % results
+
+    return summary, code
+
+
+def Check(results, label, passed):
+    ## This function records the result of one check
+    results.append('   %-56s %s' % (label, 'ok' if passed else 'wrong'))
+
+    return passed
+
+
+def CheckDuplicate(testdir):
+    ## rotated and permuted copies of a geometry are duplicates, displaced geometries are not
+    from PyRAI2MD.Machine_Learning.duplicate_index import DuplicateIndex, assignment, aligned_rmsd
+
+    rng = np.random.default_rng(5)
+    results = []
+
+    cost = rng.random((5, 5))
+    best = min(itertools.permutations(range(5)), key=lambda x: np.sum(cost[np.arange(5), x]))
+    passed = [Check(results, 'assignment', np.isclose(
+        np.sum(cost[np.arange(5), assignment(cost)]), np.sum(cost[np.arange(5), best])))]
+
+    atoms = ['C', 'C', 'O', 'H', 'H', 'H', 'H']
+    geo = rng.normal(scale=1.5, size=(7, 3))
+    theta = 0.7
+    rot = np.array([[np.cos(theta), -np.sin(theta), 0], [np.sin(theta), np.cos(theta), 0], [0, 0, 1]])
+    order = [1, 0, 2, 5, 3, 6, 4]
+    copy = (geo @ rot.T + np.array([1.0, -2.0, 0.5]))[order]
+    far = geo + rng.normal(scale=0.3, size=(7, 3))
+
+    passed.append(Check(results, 'aligned rmsd of a permuted copy', aligned_rmsd(geo, copy, atoms) < 1e-6))
+
+    index = DuplicateIndex(tol=0.01, rmsd=0.05)
+    index.add([atoms], [geo])
+    passed += [
+        Check(results, 'find a permuted copy', index.find([atoms, atoms], [copy, far]) == [0, -1]),
+        Check(results, 'other compositions', index.find([['N'] + atoms[1:]], [copy]) == [-1]),
+        Check(results, 'filter repeated geometries', index.filter([atoms, atoms, atoms], [far, copy, far]) == [0]),
+        Check(results, 'filtered geometries are indexed', index.find([atoms], [far]) == [1]),
+    ]
+
+    return '\n'.join(results), 'PASSED' if all(passed) else 'FAILED(duplicate index matching)'
@@ -0,0 +1,109 @@
+######################################################
+#
+# PyRAI2MD test inference
+#
+# Author Jingbai Li
+# Oct 19 2026
+#
+######################################################
+
+import os
+import shutil
+import numpy as np
+
+try:
+    import PyRAI2MD
+
+    pyrai2mddir = os.path.dirname(PyRAI2MD.__file__)
+
+except ModuleNotFoundError:
+    pyrai2mddir = ''
+
+
+def TestInference():
+    """ inference test
+
+    1. fused graph against the unfused call
+    2. shared features against the unfused call
+
+    """
+
+    testdir = '%s/results/inference' % (os.getcwd())
+
+    summary = """
+ *---------------------------------------------------*
+ |                                                   |
+ |            Inference Test Calculation             |
+ |                                                   |
+ *---------------------------------------------------*
+
+ Check inference:
+-------------------------------------------------------
+"""
+
+    if pyrai2mddir == '':
+        summary += '\n PyRAI2MD is not installed, skip test\n\n'
+        return summary, 'FAILED(PyRAI2MD not found)'
+
+    try:
+        import tensorflow
+    except ModuleNotFoundError:
+        summary += '\n tensorflow is not installed, skip test\n\n'
+        return summary, 'FAILED(tensorflow not found)'
+
+    if os.path.exists(testdir):
+        shutil.rmtree(testdir)
+    os.makedirs(testdir)
+
+    results, code = CheckInference(testdir)
+    summary += '%s\n' % results
+
+    return summary, code
+
+
+def Check(results, label, passed):
+    ## This function records the result of one check
+    results.append('   %-56s %s' % (label, 'ok' if passed else 'wrong'))
+
+    return passed
+
+
+def Same(a, b, atol):
+    ## This function compares the energy and gradient of two calls
+    return all(np.allclose(x, y, rtol=0, atol=atol) for x, y in zip(a, b))
+
+
+def CheckInference(testdir):
+    ## the fused graphs scale back absolute energies as precisely as the unfused call
+    from PyRAI2MD.Machine_Learning.NNsMD.nn_pes import NeuralNetPes
+
+    rng = np.random.default_rng(7)
+    natom = 4
+    x = rng.normal(scale=1.5, size=(16, natom, 3))
+    energy = rng.normal(loc=-2e4, scale=0.05, size=(16, 2))
+    grad = rng.normal(scale=0.01, size=(16, 2, natom, 3))
+    hyper = {'general': {'model_type': 'mlp_eg'}, 'model': {'atoms': natom, 'states': 2}}
+
+    pes = NeuralNetPes(testdir, mult_nn=2, fused=True, shared_features=True)
+    pes.create({'eg': hyper, 'eg2': hyper})
+    for scaler_list in pes._models_scaler.values():
+        for scaler in scaler_list:
+            scaler.fit(x, [energy, grad])
+
+    pes._fused = False
+    unfused = pes.call(x)
+    pes._shared_features = False
+    pes._fused = True
+    fused = pes.call(x)
+    pes._shared_features = True
+    shared = pes.call(x)
+
+    results = []
+    passed = []
+    for name, out in [['fused', fused], ['shared', shared]]:
+        passed += [
+            Check(results, '%s mean' % name, all(Same(unfused[0][key], out[0][key], 1e-5) for key in ['eg', 'eg2'])),
+            Check(results, '%s std' % name, all(Same(unfused[1][key], out[1][key], 1e-5) for key in ['eg', 'eg2'])),
+        ]
+
+    return '\n'.join(results), 'PASSED' if all(passed) else 'FAILED(fused inference)'
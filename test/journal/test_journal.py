@@ -0,0 +1,201 @@
+######################################################
+#
+# PyRAI2MD test journal
+#
+# Author Jingbai Li
+# Oct 18 2026
+#
+######################################################
+
+import os
+import json
+import shutil
+import numpy as np
+
+try:
+    import PyRAI2MD
+
+    pyrai2mddir = os.path.dirname(PyRAI2MD.__file__)
+
+except ModuleNotFoundError:
+    pyrai2mddir = ''
+
+
+def TestJournal():
+    """ journal test
+
+    1. journal resume
+    2. adaptive sampling resume with json training data
+
+    """
+
+    testdir = '%s/results/journal' % (os.getcwd())
+
+    summary = """
+ *---------------------------------------------------*
+ |                                                   |
+ |             Journal Test Calculation              |
+ |                                                   |
+ *---------------------------------------------------*
+
+ Check journal:
+-------------------------------------------------------
+"""
+
+    if pyrai2mddir == '':
+        summary += '\n PyRAI2MD is not installed, skip test\n\n'
+        return summary, 'FAILED(PyRAI2MD not found)'
+
+    if os.path.exists(testdir):
+        shutil.rmtree(testdir)
+    os.makedirs(testdir)
+
+    code = 'PASSED'
+    for name, func in [['journal', CheckJournal],
+                       ['sampling resume', CheckResume]]:
+        results, status = func(testdir)
+        summary += ' %-20s %s\n%s\n' % (name, status, results)
+        if status != 'PASSED' and code == 'PASSED':
+            code = status
+
+    return summary, code
+
+
+def Check(results, label, passed):
+    ## This function records the result of one check
+    results.append('   %-56s %s' % (label, 'ok' if passed else 'wrong'))
+
+    return passed
+
+
+def CheckJournal(testdir):
+    ## a resumed journal continues from the last committed phase with the state saved at that commit
+    from PyRAI2MD.Utils.journal import Journal
+
+    path = '%s/journal' % testdir
+    journal = Journal(path)
+    state = {'itr': 1, 'nstored': 10}
+    journal.commit(1, 'sample', state=state)
+    journal.save_job(1, 'qm', 0, {'energy': [1.0]})
+    journal.save_job(1, 'qm', 2, {'energy': [2.0]})
+    state['nstored'] = 11
+    journal.commit(1, 'qm')
+    journal.commit(1, 'train', state={'itr': 1, 'nstored': 12})
+
+    ## an interrupted commit leaves an incomplete state file and log line
+    with open('%s.tmp' % journal.statefile, 'wb') as out:
+        out.write(b'\x80\x04')
+    with open(journal.logfile, 'a') as log:
+        log.write('{"itr": 2, "pha')
+
+    resumed = Journal(path)
+    jobs = resumed.load_jobs(1, 'qm')
+    results = []
+    passed = [
+        Check(results, 'last committed phase', resumed.last() == [1, 'train']),
+        Check(results, 'completed phases', resumed.done(1, 'sample') and resumed.done(1, 'qm')),
+        Check(results, 'incomplete phase is not done', not resumed.done(2, 'sample')),
+        Check(results, 'state of the last commit', resumed.load_state() == {'itr': 1, 'nstored': 12}),
+        Check(results, 'finished jobs', sorted(jobs.keys()) == [0, 2] and jobs[2] == {'energy': [2.0]}),
+    ]
+
+    ## a phase without a state keeps the state of the previous commit as it was at that commit
+    journal = Journal('%s/journal-phase' % testdir)
+    state = {'itr': 1, 'nstored': 10}
+    journal.commit(1, 'rescreen', state=state)
+    state['nstored'] = 11
+    journal.commit(1, 'qc')
+    resumed = Journal('%s/journal-phase' % testdir)
+    passed.append(Check(results, 'state of a phase without a state', resumed.last() == [1, 'qc'] and (
+        resumed.load_state() == {'itr': 1, 'nstored': 10})))
+
+    resumed.save_job(1, 'qc', 0, {'energy': [1.0]})
+    resumed.clean(2)
+    passed.append(Check(results, 'job records of previous iterations removed', resumed.load_jobs(1, 'qc') == {}))
+    passed.append(Check(results, 'empty journal', Journal('%s/journal-new' % testdir).last() == [0, None]))
+
+    return '\n'.join(results), 'PASSED' if all(passed) else 'FAILED(journal resume)'
+
+
+def TrainingData(size, seed=0):
+    ## This function generates random training data in the json format
+    rng = np.random.default_rng(seed)
+    geos = rng.normal(size=(size, 3, 3))
+    xyz = [[[atom] + geo.tolist() for atom, geo in zip(['O', 'H', 'H'], mol)] for mol in geos]
+    data = [
+        xyz,
+        rng.normal(size=(size, 2)).tolist(),
+        rng.normal(size=(size, 2, 3, 3)).tolist(),
+        rng.normal(size=(size, 1, 3, 3)).tolist(),
+        np.zeros((size, 0)).tolist(),
+    ]
+
+    return data
+
+
+def Sampler(journal, data, ml_ncpu):
+    ## This function creates an adaptive sampling object with the attributes used by the journal
+    from PyRAI2MD.Machine_Learning.adaptive_sampling import AdaptiveSampling, SAMPLING_PROGRESS
+
+    sampler = AdaptiveSampling.__new__(AdaptiveSampling)
+    for key in SAMPLING_PROGRESS:
+        setattr(sampler, key, [])
+    sampler.itr = 1
+    sampler.qm = 'nn'
+    sampler.ml_ncpu = ml_ncpu
+    sampler.keywords = {'nn': {'train_mode': 'training'}}
+    sampler.journal = journal
+    sampler.data = data
+    sampler.dedup = 0
+    sampler.dedup_index = None
+
+    return sampler
+
+
+def CheckResume(testdir):
+    ## a resumed sampling continues with the training data saved at the last commit and the current settings
+    from PyRAI2MD.Utils.journal import Journal
+    from PyRAI2MD.Machine_Learning.training_data import Data
+
+    path = '%s/resume' % testdir
+    os.makedirs(path)
+    maindir = os.getcwd()
+    os.chdir(path)
+
+    xyz, energy, grad, nac, soc = TrainingData(4, seed=1)
+    with open('data.json', 'w') as outdata:
+        json.dump({'natom': 3, 'nstate': 2, 'nnac': 1, 'nsoc': 0, 'xyz': xyz, 'energy': energy, 'grad': grad,
+                   'nac': nac, 'soc': soc}, outdata)
+
+    data = Data()
+    data.load('data.json')
+    newdata = TrainingData(2, seed=2)
+    sampler = Sampler(Journal('%s/journal' % path), data, 4)
+    sampler.pending_cond = [[0, 'deferred']]
+    sampler._update_train_set(newdata)
+    sampler.journal.commit(1, 'update', sampler._save_state())
+
+    ## the interrupted run saved the next data, which is not part of the committed state
+    sampler.data.append(TrainingData(1, seed=3))
+    sampler.data.save(3)
+
+    initial = Data()
+    initial.load('data.json')
+    resumed = Sampler(Journal('%s/journal' % path), initial, 8)
+    resumed._restore_state()
+    os.chdir(maindir)
+
+    results = []
+    passed = [
+        Check(results, 'saved json data', os.path.exists('%s/New-data6-2.json' % path)),
+        Check(results, 'restored data size', len(resumed.data.geos) == 6),
+        Check(results, 'restored coordinates', np.allclose(resumed.data.geos[4:], np.array(newdata[0])[:, :, 1:4].astype(
+            float))),
+        Check(results, 'restored energies', np.allclose(resumed.data.energy[4:], newdata[1])),
+        Check(results, 'restored data file', resumed.data.file == '%s/New-data6-2.json' % path),
+        Check(results, 'training data in the keywords', resumed.keywords['nn']['data'] is resumed.data),
+        Check(results, 'restored progress', resumed.pending_cond == [[0, 'deferred']]),
+        Check(results, 'settings of the current input', resumed.ml_ncpu == 8),
+    ]
+
+    return '\n'.join(results), 'PASSED' if all(passed) else 'FAILED(sampling resume)'
@@ -0,0 +1,113 @@
+######################################################
+#
+# PyRAI2MD test running moments
+#
+# Author Jingbai Li
+# Oct 19 2026
+#
+######################################################
+
+import os
+import shutil
+import numpy as np
+
+try:
+    import PyRAI2MD
+
+    pyrai2mddir = os.path.dirname(PyRAI2MD.__file__)
+
+except ModuleNotFoundError:
+    pyrai2mddir = ''
+
+
+def TestRunningMoments():
+    """ running moments test
+
+    1. running mean and std
+    2. streamed scaler fit
+
+    """
+
+    testdir = '%s/results/running_moments' % (os.getcwd())
+
+    summary = """
+ *---------------------------------------------------*
+ |                                                   |
+ |         Running Moments Test Calculation          |
+ |                                                   |
+ *---------------------------------------------------*
+
+ Check running moments:
+-------------------------------------------------------
+"""
+
+    if pyrai2mddir == '':
+        summary += '\n PyRAI2MD is not installed, skip test\n\n'
+        return summary, 'FAILED(PyRAI2MD not found)'
+
+    if os.path.exists(testdir):
+        shutil.rmtree(testdir)
+    os.makedirs(testdir)
+
+    results, code = CheckMoments(testdir)
+    summary += '%s\n' % results
+
+    return summary, code
+
+
+def Check(results, label, passed):
+    ## This function records the result of one check
+    results.append('   %-56s %s' % (label, 'ok' if passed else 'wrong'))
+
+    return passed
+
+
+def Batches(x, y, batch_size):
+    ## This function splits the data into batches
+    for a in range(0, len(x), batch_size):
+        yield x[a: a + batch_size], [value[a: a + batch_size] for value in y]
+
+
+def CheckMoments(testdir):
+    ## scalers fitted on a stream of batches match the scalers fitted on the full data
+    from PyRAI2MD.Machine_Learning.NNsMD.scaler.moments import RunningMoments
+    from PyRAI2MD.Machine_Learning.NNsMD.scaler.energy import EnergyGradientStandardScaler
+    from PyRAI2MD.Machine_Learning.NNsMD.scaler.general import SegmentStandardScaler
+
+    rng = np.random.default_rng(6)
+    x = rng.normal(loc=1.0, scale=2.0, size=(53, 4, 3))
+    energy = rng.normal(loc=-100.0, scale=0.1, size=(53, 2))
+    grad = rng.normal(size=(53, 2, 4, 3))
+    feat = rng.normal(size=(53, 9))
+    results = []
+
+    moments = RunningMoments()
+    for batch, _ in Batches(grad, [], 10):
+        moments.update(batch, axis=(0, 2, 3))
+    passed = [Check(results, 'running mean and std', np.allclose(
+        moments.mean.reshape(-1), np.mean(grad, axis=(0, 2, 3))) and np.allclose(
+        moments.std.reshape(-1), np.std(grad, axis=(0, 2, 3))))]
+
+    scaler = EnergyGradientStandardScaler()
+    scaler.fit(x, [energy, grad])
+    stream = EnergyGradientStandardScaler()
+    stream.fit_stream(Batches(x, [energy, grad], 10))
+    passed.append(Check(results, 'energy gradient scaler', all(np.allclose(a, b) for a, b in [
+        [scaler.x_mean, stream.x_mean],
+        [scaler.x_std, stream.x_std],
+        [scaler.energy_mean, stream.energy_mean],
+        [scaler.energy_std, stream.energy_std],
+        [scaler.gradient_std, stream.gradient_std],
+        [scaler._encountered_y_std[0], stream._encountered_y_std[0]],
+        [scaler._encountered_y_std[1], stream._encountered_y_std[1]],
+    ])))
+
+    segments = [3, 6]
+    scaler = SegmentStandardScaler(segments)
+    scaler.fit(feat)
+    stream = SegmentStandardScaler(segments)
+    stream.fit_stream(batch for batch, _ in Batches(feat, [], 10))
+    passed.append(Check(results, 'segment scaler', np.allclose(scaler.feat_mean, stream.feat_mean) and np.allclose(
+        scaler.feat_std, stream.feat_std)))
+
+    return '\n'.join(results), 'PASSED' if all(passed) else 'FAILED(running moments)'
@@ -0,0 +1,93 @@
+######################################################
+#
+# PyRAI2MD test scheduler
+#
+# Author Jingbai Li
+# Oct 18 2026
+#
+######################################################
+
+import os
+import shutil
+
+try:
+    import PyRAI2MD
+
+    pyrai2mddir = os.path.dirname(PyRAI2MD.__file__)
+
+except ModuleNotFoundError:
+    pyrai2mddir = ''
+
+
+def TestScheduler():
+    """ scheduler test
+
+    1. longest-first order
+    2. makespan simulation
+    3. timing history
+
+    """
+
+    testdir = '%s/results/scheduler' % (os.getcwd())
+
+    summary = """
+ *---------------------------------------------------*
+ |                                                   |
+ |            Scheduler Test Calculation             |
+ |                                                   |
+ *---------------------------------------------------*
+
+ Check scheduler:
+-------------------------------------------------------
+"""
+
+    if pyrai2mddir == '':
+        summary += '\n PyRAI2MD is not installed, skip test\n\n'
+        return summary, 'FAILED(PyRAI2MD not found)'
+
+    if os.path.exists(testdir):
+        shutil.rmtree(testdir)
+    os.makedirs(testdir)
+
+    results, code = CheckScheduler(testdir)
+    summary += '%s\n' % results
+
+    return summary, code
+
+
+def Check(results, label, passed):
+    ## This function records the result of one check
+    results.append('   %-56s %s' % (label, 'ok' if passed else 'wrong'))
+
+    return passed
+
+
+def CheckScheduler(testdir):
+    ## the longest jobs are dispatched first and the makespan follows the first available worker
+    from PyRAI2MD.Utils.scheduler import TimingHistory, longest_first, makespan
+
+    results = []
+    cost = [1.0, 1.0, 1.0, 1.0, 4.0]
+    passed = [
+        Check(results, 'longest first', longest_first([3, 1, 3, 5]) == [3, 0, 2, 1]),
+        Check(results, 'makespan of the input order', makespan(cost, 2) == 6.0),
+        Check(results, 'makespan of the longest-first order', makespan(cost, 2, longest_first(cost)) == 4.0),
+        Check(results, 'makespan of one worker', makespan(cost, 0) == 8.0),
+    ]
+
+    path = '%s/timing.json' % testdir
+    timing = TimingHistory(path)
+    timing.record('qm', 0, 10.0, 'molcas', 3, 1, 1)
+    timing.record('qm', 0, 12.0, 'molcas', 3, 1, 2)
+    timing.record('qm', 1, 20.0, 'molcas', 3, 1, 2)
+    timing.save()
+
+    history = TimingHistory(path)
+    passed += [
+        Check(results, 'saved history', history.history == timing.history),
+        Check(results, 'last-seen time of a lineage', history.predict('qm', [0, 1]) == [12.0, 20.0]),
+        Check(results, 'mean time of new lineages', history.predict('qm', [2]) == [16.0]),
+        Check(results, 'unknown category', history.predict('md', [0, 1]) == [0.0, 0.0]),
+    ]
+
+    return '\n'.join(results), 'PASSED' if all(passed) else 'FAILED(scheduler)'
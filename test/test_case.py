@@ -21,6 +21,12 @@ test_grid_search = 1
 test_aimd = 1
 test_mixaimd = 1
 test_adaptive_sampling = 1
+test_scheduler = 1
+test_journal = 1
+test_inference = 1
+test_data_store = 1
+test_duplicate_index = 1
+test_running_moments = 1
 
 import time
 import datetime
@@ -58,6 +64,13 @@ class TestCase:
         alignment
         coordinates
         sampling
+        scheduler
+        journal
+        journal resume
+        fused inference
+        training data store
+        duplicate index
+        running moments
 
 """
 
@@ -77,6 +90,12 @@ class TestCase:
             'aimd': test_aimd,
             'mixaimd': test_mixaimd,
             'adaptive_sampling': test_adaptive_sampling,
+            'scheduler': test_scheduler,
+            'journal': test_journal,
+            'inference': test_inference,
+            'data_store': test_data_store,
+            'duplicate_index': test_duplicate_index,
+            'running_moments': test_running_moments,
         }
 
         self.test_func = {}
@@ -137,6 +156,30 @@ class TestCase:
             from adaptive_sampling.test_adaptive_sampling import TestAdaptiveSampling
             self.test_func['adaptive_sampling'] = TestAdaptiveSampling
 
+        if os.path.exists('./scheduler/test_scheduler.py'):
+            from scheduler.test_scheduler import TestScheduler
+            self.test_func['scheduler'] = TestScheduler
+
+        if os.path.exists('./journal/test_journal.py'):
+            from journal.test_journal import TestJournal
+            self.test_func['journal'] = TestJournal
+
+        if os.path.exists('./inference/test_inference.py'):
+            from inference.test_inference import TestInference
+            self.test_func['inference'] = TestInference
+
+        if os.path.exists('./data_store/test_data_store.py'):
+            from data_store.test_data_store import TestDataStore
+            self.test_func['data_store'] = TestDataStore
+
+        if os.path.exists('./duplicate_index/test_duplicate_index.py'):
+            from duplicate_index.test_duplicate_index import TestDuplicateIndex
+            self.test_func['duplicate_index'] = TestDuplicateIndex
+
+        if os.path.exists('./running_moments/test_running_moments.py'):
+            from running_moments.test_running_moments import TestRunningMoments
+            self.test_func['running_moments'] = TestRunningMoments
+
     def run(self):
         heading = '''
 
@@ -0,0 +1,93 @@
+######################################################
+#
+# PyRAI2MD 2 module for benchmarking NN model loading
+#
+# Author Jingbai Li
+# Oct 18 2026
+#
+######################################################
+
+import os, sys, json, subprocess
+import numpy as np
+from optparse import OptionParser
+
+PROBE = """
+import os, sys, time, json
+from contextlib import redirect_stdout
+start = time.time()
+from PyRAI2MD.Machine_Learning.NNsMD.nn_pes import NeuralNetPes
+imports = time.time() - start
+path = '%s'
+with redirect_stdout(sys.stderr):
+    model = NeuralNetPes(path, mult_nn=%s)
+    start = time.time()
+    if '%s' == 'bundle':
+        model.load()
+    else:
+        names = [x for x in os.listdir(path) if os.path.isdir(os.path.join(path, x))]
+        for name in names:
+            model._load(os.path.abspath(path), name)
+    load = time.time() - start
+print(json.dumps({'import': imports, 'load': load}))
+"""
+
+MAKE = """
+import os, sys
+from contextlib import redirect_stdout
+from PyRAI2MD.Machine_Learning.NNsMD.nn_pes import NeuralNetPes
+with redirect_stdout(sys.stderr):
+    model = NeuralNetPes('%s', mult_nn=%s)
+    model.load()
+    model.save_bundle()
+"""
+
+def probe(path, nn, mode):
+    ## run each measurement in a fresh interpreter as a new MD process would do
+    out = subprocess.run([sys.executable, '-c', PROBE % (path, nn, mode)], capture_output=True, text=True)
+    if out.returncode != 0:
+        return None
+
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def main():
+
+    usage = """
+    PyRAI2MD NN model loading benchmark tool
+
+    Usage:
+        python3 model_load_benchmark_tool.py -d NN-title [options]
+
+    """
+
+    description = ''
+    parser = OptionParser(usage=usage, description=description)
+    parser.add_option('-d', dest='path', type=str, nargs=1, help='trained model directory, e.g. NN-title', default=None)
+    parser.add_option('-m', dest='nn', type=int, nargs=1, help='number of NN instances per model', default=2)
+    parser.add_option('-n', dest='repeat', type=int, nargs=1, help='number of repeats', default=3)
+
+    (options, args) = parser.parse_args()
+    path = options.path
+    nn = options.nn
+    repeat = options.repeat
+
+    if path is None or not os.path.exists(path):
+        sys.exit('\n  FileNotFoundError\n  PyRAI2MD: looking for model directory %s' % path)
+
+    if not os.path.exists('%s/models.bundle' % path):
+        print('  writing %s/models.bundle' % path)
+        subprocess.run([sys.executable, '-c', MAKE % (path, nn)], capture_output=True, text=True)
+
+    print('  %-10s %12s %12s %12s' % ('loading', 'import (s)', 'load (s)', 'total (s)'))
+    for mode in ['folder', 'bundle']:
+        results = [probe(path, nn, mode) for _ in range(repeat)]
+        results = [x for x in results if x is not None]
+        if len(results) == 0:
+            print('  %-10s %12s' % (mode, 'failed'))
+            continue
+
+        t_import = np.median([x['import'] for x in results])
+        t_load = np.median([x['load'] for x in results])
+        print('  %-10s %12.3f %12.3f %12.3f' % (mode, t_import, t_load, t_import + t_load))
+
+if __name__ == '__main__':
+    main()
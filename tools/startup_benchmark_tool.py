@@ -0,0 +1,69 @@
+######################################################
+#
+# PyRAI2MD 2 module for benchmarking startup time
+#
+# Author Jingbai Li
+# Oct 18 2026
+#
+######################################################
+
+import sys, json, subprocess
+import numpy as np
+from optparse import OptionParser
+
+PROBE = """
+import sys, time, json
+start = time.time()
+import PyRAI2MD.pyrai2md
+main = time.time() - start
+start = time.time()
+if '%s' != 'none':
+    from PyRAI2MD.methods import load_backend
+    load_backend('%s')
+backend = time.time() - start
+print(json.dumps({'main': main, 'backend': backend, 'tensorflow': 'tensorflow' in sys.modules}))
+"""
+
+def probe(method):
+    ## run each measurement in a fresh interpreter so no module is cached
+    out = subprocess.run([sys.executable, '-c', PROBE % (method, method)], capture_output=True, text=True)
+    if out.returncode != 0:
+        return None
+
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def main():
+
+    usage = """
+    PyRAI2MD startup benchmark tool
+
+    Usage:
+        python3 startup_benchmark_tool.py [options]
+
+    """
+
+    description = ''
+    parser = OptionParser(usage=usage, description=description)
+    parser.add_option('-m', dest='methods', type=str, nargs=1,
+                      help='comma separated methods to load', default='none,molcas,bagel,orca,xtb,nn,mlp,e2n2')
+    parser.add_option('-n', dest='repeat', type=int, nargs=1, help='number of repeats', default=3)
+
+    (options, args) = parser.parse_args()
+    methods = options.methods.split(',')
+    repeat = options.repeat
+
+    print('  %-10s %12s %12s %12s %12s' % ('method', 'main (s)', 'backend (s)', 'total (s)', 'tensorflow'))
+    for method in methods:
+        results = [probe(method) for _ in range(repeat)]
+        results = [x for x in results if x is not None]
+        if len(results) == 0:
+            print('  %-10s %12s' % (method, 'failed'))
+            continue
+
+        t_main = np.median([x['main'] for x in results])
+        t_backend = np.median([x['backend'] for x in results])
+        tf_loaded = np.any([x['tensorflow'] for x in results])
+        print('  %-10s %12.3f %12.3f %12.3f %12s' % (method, t_main, t_backend, t_main + t_backend, tf_loaded))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+######################################################
+#
+# PyRAI2MD 2 module for converting training data to and from the binary store
+#
+# Author Jingbai Li
+# Oct 18 2026
+#
+######################################################
+
+import os, sys, json
+from optparse import OptionParser
+
+from PyRAI2MD.Machine_Learning.training_data import Data
+from PyRAI2MD.Machine_Learning.data_store import DataStore
+from PyRAI2MD.Machine_Learning.data_store import is_store
+
+def json_to_store(infile, path):
+    ## old and new json formats are read by Data
+    data = Data()
+    data.load(infile)
+    if os.path.exists(path):
+        sys.exit('\n  FileExistsError\n  PyRAI2MD: training data store %s already exists' % path)
+
+    store = DataStore(path).create(data.natom, data.nstate, data.nnac, data.nsoc)
+    store.append(data.columns(), tag=os.path.basename(infile))
+
+    return store.size
+
+def store_to_json(path, outfile):
+    ## write the new json format
+    data = Data()
+    data.load(path)
+    newset = {
+        'natom': data.natom,
+        'nstate': data.nstate,
+        'nnac': data.nnac,
+        'nsoc': data.nsoc,
+        'xyz': [[[a] + x for a, x in zip(atoms, geo)] for atoms, geo in zip(data.atoms, data.geos.tolist())],
+        'energy': data.energy.tolist(),
+        'grad': data.grad.tolist(),
+        'nac': data.nac.tolist(),
+        'soc': data.soc.tolist(),
+    }
+
+    with open(outfile, 'w') as outdata:
+        json.dump(newset, outdata)
+
+    return len(data.geos)
+
+def main():
+
+    usage = """
+    PyRAI2MD training data store tool
+
+    Usage:
+        python3 training_data_store_tool.py -i data.json -o data.store
+        python3 training_data_store_tool.py -i data.store -o data.json
+
+    """
+
+    description = ''
+    parser = OptionParser(usage=usage, description=description)
+    parser.add_option('-i', dest='input', type=str, nargs=1, help='input json file or store directory', default=None)
+    parser.add_option('-o', dest='output', type=str, nargs=1, help='output store directory or json file', default=None)
+
+    (options, args) = parser.parse_args()
+    infile = options.input
+    outfile = options.output
+
+    if infile is None or not os.path.exists(infile):
+        sys.exit('\n  FileNotFoundError\n  PyRAI2MD: looking for training data %s' % infile)
+
+    if outfile is None:
+        sys.exit('\n  ValueError\n  PyRAI2MD: missing output name, use -o')
+
+    if is_store(infile):
+        size = store_to_json(infile, outfile)
+    else:
+        size = json_to_store(infile, outfile)
+
+    print('  converted %s data points from %s to %s' % (size, infile, outfile))
+
+if __name__ == '__main__':
+    main()
@@ -7,16 +7,24 @@
 #
 ######################################################
 
-import os, sys, json, multiprocessing
+import os, sys, json, hashlib
 import numpy as np
 from multiprocessing import Pool
 from optparse import OptionParser
 
+## backends whose _read_data returns the coordinates from the output
+HARVEST_METHODS = ['molcas', 'mlctkr', 'bagel']
+MANIFEST = 'manifest.json'
+
 def main():
 
     usage = """
     PyRAI2MD training data tool
 
+    Harvest QC outputs listed in &file into a training data store.
+    Outputs already in the manifest of the store are skipped unless they changed.
+    A changed output replaces its data point in the store, or masks it if it can no longer be read.
+
     Usage:
         python3 training_data_tool.py [options]
 
@@ -26,11 +34,15 @@ def main():
     parser = OptionParser(usage=usage, description=description)
     parser.add_option('-i', dest='input',       type=str,   nargs=1, help='input file name.', default = 'input')
     parser.add_option('-n', dest='ncpu',        type=int,   nargs=1, help='number of cpus.', default = 1)
+    parser.add_option('-o', dest='output',      type=str,   nargs=1, help='training data store.', default = 'data.store')
+    parser.add_option('-c', dest='chunk',       type=int,   nargs=1, help='number of data per chunk.', default = 1000)
     parser.add_option('-p', dest='pyrai2mddir', type=str,   nargs=1, help='python to PyRAI2MD', default = None)
 
     (options, args) = parser.parse_args()
     input = options.input
     ncpu = options.ncpu
+    output = options.output
+    chunk = max(options.chunk, 1)
     pyrai2mddir = options.pyrai2mddir
 
     if pyrai2mddir == None:
@@ -47,92 +59,119 @@ def main():
         sys.exit('\n  FileNotFoundError\n PyRAI2MD: looking for input file %s' % (input))
 
     sys.path.append(pyrai2mddir)
-    from PyRAI2MD.variables import ReadInput
-    from PyRAI2MD.Quantum_Chemistry.qc_molcas import MOLCAS
-    from PyRAI2MD.Quantum_Chemistry.qc_bagel import BAGEL
-    from PyRAI2MD.Quantum_Chemistry.qc_molcas_tinker import MOLCAS_TINKER
-
-    method = {
-        'molcas' : MOLCAS,
-        'mlctkr' : MOLCAS_TINKER,
-        'bagel'  : BAGEL,
-        }
+    from PyRAI2MD.variables import read_input
+    from PyRAI2MD.Machine_Learning.data_store import DataStore
 
     with open(input) as infile:
         input_dict = infile.read().split('&')
 
-    keywords = ReadInput(input_dict)
+    keywords = read_input(input_dict)
 
     file = keywords['file']['file']
 
-    if os.path.exists(file) == False:
+    if file == None or os.path.exists(file) == False:
         sys.exit('\n  FileNotFoundError\n  PyRAI2MD: looking for list file %s' % (file))
 
+    qm = keywords['control']['qm']
+    if qm not in HARVEST_METHODS:
+        sys.exit('\n  KeyError\n  PyRAI2MD: cannot harvest %s outputs, choose from %s' % (qm, ', '.join(HARVEST_METHODS)))
+
     with open(file, 'r') as infile:
-        file_list = infile.read().splitlines()
+        file_list = [os.path.abspath(x.strip()) for x in infile.read().splitlines() if len(x.strip()) > 0]
 
-    key = PrepKey(keywords)
+    key = prep_key(keywords)
     natom = key['natom']
     nstate = key['nstate']
     nnac = key['nnac']
     nsoc = key['nsoc']
 
-    qm = keywords['control']['qm']
-    wrapper = [[n, method[qm], f, key] for n, f in enumerate(file_list)]
-    nfile = len(wrapper)
-    ncpu = np.amin([nfile, ncpu])
-    pool = multiprocessing.Pool(processes = ncpu)
-
-    xyz_list = [[] for x in range(nfile)]
-    energy_list = [[] for x in range(nfile)]
-    grad_list = [[] for x in range(nfile)]
-    nac_list = [[] for x in range(nfile)]
-    soc_list = [[] for x in range(nfile)]
-
-    n = 0
-    for val in pool.imap_unordered(ReadData, wrapper):
-        n += 1
-        id, xyz, energy, grad, nac, soc = val
-        xyz_list[id] = xyz
-        energy_list[id] = energy        
-        grad_list[id] = grad
-        nac_list[id] = nac
-        soc_list[id] = soc
-
-        sys.stdout.write('CPU: %3d Extracting %6d/%-6d\r' % (ncpu, n, nfile))
-
-    pool.close()
-
-    dataset = {
-        'natom'  : natom,
-        'nstate' : nstate,
-        'nnac'   : nnac,
-        'nsoc'   : nsoc,
-        'xyz'    : xyz_list,
-        'energy' : energy_list,
-        'grad'   : grad_list,
-        'nac'    : nac_list,
-        'soc'    : soc_list,
-        }
-
-    print ('\n    --- Summary ---')
-    print ('natom:  %5d' % (natom))
-    print ('nstate: %5d' % (nstate))
-    print ('nnac:   %5d' % (nnac))
-    print ('nsoc:   %5d' % (nsoc))
-    print ('    --- Data shape ---')
-    print ('xyz:   %30s' % (str(np.array(xyz_list).shape)))
-    print ('energy:%30s' % (str(np.array(energy_list).shape)))
-    print ('grad:  %30s' % (str(np.array(grad_list).shape)))
-    print ('nac:   %30s' % (str(np.array(nac_list).shape)))
-    print ('soc:   %30s' % (str(np.array(soc_list).shape)))
-
-    with open('data.json','w') as outdata:
-        json.dump(dataset, outdata)
-
-def PrepKey(key):
+    ## open or create the store, the manifest lives next to its metadata
+    store = DataStore(output)
+    if store.meta == None:
+        store.create(natom, nstate, nnac, nsoc)
+
+    elif [store.meta['natom'], store.meta['nstate'], store.meta['nnac'], store.meta['nsoc']] != [natom, nstate, nnac, nsoc]:
+        sys.exit('\n  ValueError\n  PyRAI2MD: store %s has natom, nstate, nnac, nsoc = %s, %s, %s, %s but input has %s, %s, %s, %s' % (
+            output, store.meta['natom'], store.meta['nstate'], store.meta['nnac'], store.meta['nsoc'],
+            natom, nstate, nnac, nsoc))
+
+    manifest = load_manifest(output)
+
+    ## only outputs that are new or have a different mtime or size are read
+    pending = []
+    nmissing = 0
+    for f in file_list:
+        log = log_file(f)
+        if not os.path.exists(log):
+            nmissing += 1
+            continue
+
+        stat = os.stat(log)
+        record = manifest.get(f)
+        if record != None and record['mtime'] == stat.st_mtime and record['size'] == stat.st_size:
+            continue
+
+        old_hash = None if record == None else record['hash']
+        pending.append([len(pending), qm, f, key, old_hash])
+
+    nfile = len(pending)
+    nskip = len(file_list) - nfile - nmissing
+    print('    --- Harvest ---')
+    print('outputs:   %8d' % (len(file_list)))
+    print('missing:   %8d' % (nmissing))
+    print('ingested:  %8d' % (nskip))
+    print('pending:   %8d' % (nfile))
+
+    nnew = 0
+    nfail = 0
+    nsame = 0
+    buffer = []
+    updates = {}
+    if nfile > 0:
+        ncpu = int(np.amin([nfile, ncpu]))
+        chunksize = int(np.amax([1, np.amin([64, nfile // (ncpu * 4)])]))
+        pool = Pool(processes = ncpu)
+        n = 0
+        for val in pool.imap_unordered(read_data, pending, chunksize = chunksize):
+            n += 1
+            f, record, data = val
+            updates[f] = record
+            if record['status'] == 1:
+                buffer.append([f, data])
+                nnew += 1
+            elif record['status'] == 0:
+                nfail += 1
+            else:
+                ## a touched output with the same content keeps its data point
+                record['row'] = manifest[f].get('row')
+                nsame += 1
+
+            ## the manifest is written after each chunk, so an interrupted run resumes from the last chunk
+            if len(buffer) >= chunk:
+                flush(store, manifest, buffer, updates, key, output)
+                buffer = []
+                updates = {}
+
+            sys.stdout.write('CPU: %3d Extracting %6d/%-6d\r' % (ncpu, n, nfile))
+
+        pool.close()
+        pool.join()
+
+    flush(store, manifest, buffer, updates, key, output)
+
+    print('\n    --- Summary ---')
+    print('natom:     %8d' % (natom))
+    print('nstate:    %8d' % (nstate))
+    print('nnac:      %8d' % (nnac))
+    print('nsoc:      %8d' % (nsoc))
+    print('new:       %8d' % (nnew))
+    print('unchanged: %8d' % (nsame))
+    print('failed:    %8d' % (nfail))
+    print('stored:    %8d' % (store.size - len(store.masked)))
+
+def prep_key(key):
     qm = key['control']['qm']
-    natom = key['file']['natom']    
+    natom = key['file']['natom']
     ci = key['molecule']['ci']
     nstate = int(np.sum(ci))
     spin = key['molecule']['spin']
@@ -176,8 +215,83 @@ def PrepKey(key):
 
     return keywords
 
-def ReadData(var):
-    id, qm, f, keywords = var
+def log_file(f):
+    ## each calculation folder has a log file named after the folder
+    return '%s/%s.log' % (f, os.path.basename(f))
+
+def file_hash(file):
+    md5 = hashlib.md5()
+    with open(file, 'rb') as infile:
+        for block in iter(lambda: infile.read(1048576), b''):
+            md5.update(block)
+
+    return md5.hexdigest()
+
+def load_manifest(output):
+    manifest_file = '%s/%s' % (output, MANIFEST)
+    if not os.path.exists(manifest_file):
+        return {}
+
+    with open(manifest_file, 'r') as infile:
+        manifest = json.load(infile)
+
+    return manifest
+
+def save_manifest(manifest, output):
+    ## the manifest is replaced in one step
+    tmp = '%s/%s.tmp' % (output, MANIFEST)
+    with open(tmp, 'w') as outfile:
+        json.dump(manifest, outfile)
+    os.replace(tmp, '%s/%s' % (output, MANIFEST))
+
+def pack(buffer, keywords):
+    ## convert the harvested data to store fields
+    natom = keywords['natom']
+    size = len(buffer)
+    columns = {
+        'symbols': np.array([[a[0] for a in x[0]] for x in buffer]).astype(str),
+        'geos': np.array([[a[1: 4] for a in x[0]] for x in buffer]).astype(float),
+        'energy': np.array([x[1] for x in buffer]).reshape((size, keywords['nstate'])),
+        'grad': np.array([x[2] for x in buffer]).reshape((size, keywords['nstate'], natom, 3)),
+        'nac': np.array([x[3] for x in buffer]).reshape((size, keywords['nnac'], natom, 3)),
+        'soc': np.array([x[4] for x in buffer]).reshape((size, keywords['nsoc'])),
+        }
+    if keywords['nnac'] == 0:
+        columns['nac'] = np.zeros((size, 0))
+    if keywords['nsoc'] == 0:
+        columns['soc'] = np.zeros((size, 0))
+
+    return columns
+
+def flush(store, manifest, buffer, updates, keywords, output):
+    ## write the buffered data before recording them in the manifest
+    ## outputs in the manifest replace their data point, new outputs are appended as a new chunk
+    old = [[f, x] for f, x in buffer if manifest.get(f, {}).get('row') != None]
+    new = [[f, x] for f, x in buffer if manifest.get(f, {}).get('row') == None]
+
+    if len(old) > 0:
+        rows = [manifest[f]['row'] for f, x in old]
+        store.replace(pack([x for f, x in old], keywords), rows)
+        for n, (f, x) in enumerate(old):
+            updates[f]['row'] = rows[n]
+
+    if len(new) > 0:
+        start = store.size
+        store.append(pack([x for f, x in new], keywords), tag='harvest %s' % start)
+        for n, (f, x) in enumerate(new):
+            updates[f]['row'] = start + n
+
+    ## outputs that can no longer be read mask the data point of their previous version
+    masked = [manifest[f]['row'] for f, record in updates.items()
+              if record['status'] == 0 and manifest.get(f, {}).get('row') != None]
+    store.mask(masked)
+
+    if len(updates) > 0:
+        manifest.update(updates)
+        save_manifest(manifest, output)
+
+def read_data(var):
+    id, qm, f, keywords, old_hash = var
 
     ci = keywords['ci']
     natom = keywords['natom']
@@ -189,8 +303,24 @@ def ReadData(var):
     nsoc = keywords['nsoc']
     key = keywords['key']
 
-    data = qm(keywords = key, id = 'Read')
-    data.project = f.split('/')[-1]
+    ## a touched output with the same content is not read again
+    log = log_file(f)
+    stat = os.stat(log)
+    record = {
+        'mtime': stat.st_mtime,
+        'size': stat.st_size,
+        'hash': file_hash(log),
+        'status': 0,
+        'row': None,
+        }
+
+    if record['hash'] == old_hash:
+        record['status'] = -1
+        return f, record, None
+
+    from PyRAI2MD.methods import load_backend
+    data = load_backend(qm)(keywords = key, job_id = 'Read')
+    data.project = os.path.basename(f)
     data.workdir = f
     data.calcdir = f
     data.ci = ci
@@ -200,10 +330,23 @@ def ReadData(var):
     data.soc_coupling = soc_coupling
     data.nnac = nnac
     data.nsoc = nsoc
-    xyz, energy, grad, nac, soc = data._read_data(natom)
 
-    return id, xyz, energy.tolist(), grad.tolist(), nac.tolist(), soc.tolist()
+    try:
+        xyz, energy, grad, nac, soc = data._read_data(natom)
+    except (IndexError, ValueError):
+        return f, record, None
+
+    ## keep complete outputs only, as in the QC evaluate functions
+    energy = np.array(energy)[0: nstate]
+    grad = np.array(grad)[0: nstate]
+    nac = np.array(nac)[0: nnac]
+    soc = np.array(soc)[0: nsoc]
+    if len(xyz) != natom or len(energy) < nstate or len(grad) < nstate or len(nac) < nnac or len(soc) < nsoc:
+        return f, record, None
+
+    record['status'] = 1
+
+    return f, record, [xyz, energy.tolist(), grad.tolist(), nac.tolist(), soc.tolist()]
 
 if __name__ == '__main__':
     main()
-